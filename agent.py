@@ -1,40 +1,93 @@
+from __future__ import annotations
+
 import os
+import time
+import threading
+from typing import TYPE_CHECKING
 from dotenv import load_dotenv
-import discord
 import random
-import json
-from data_manager import DataManager
-import google.generativeai as genai
-from PIL import Image
-import requests
+from data_manager import GuildDataManagers
+from llm_backends import create_backend, DEFAULT_MODEL_NAME
+from metrics import stage
 from io import BytesIO
 import re
 import base64
-
+import asyncio
+from profiler import ProfileSession, parse_duration
+from vote_tally import ReactionTally, VOTE_EMOJI
+from challenge_scheduler import ChallengeScheduler, challenge_deadline
+from prompts import PromptTemplates, record_usage, format_usage as format_prompt_usage
+from image_admission import MemoryBudget, ImageRejected, ImageAnalysisError, check_image, estimate_cost, MAX_IMAGE_BYTES, MAX_IMAGE_PIXELS, MODEL_IMAGE_SIZE
+
+# discord, PIL and requests are heavy to import; discord is only needed for type
+# hints here and the others are imported on first use (or by warm_up()).
+if TYPE_CHECKING:
+    import discord
 
 # Load environment variables
 load_dotenv()
 
-# Initialize Gemini
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY not found in environment variables")
+# Users allowed to run admin-only commands (besides members with the Administrator permission)
+ADMIN_USER_IDS = {int(uid) for uid in os.getenv("ADMIN_USER_IDS", "").split(",") if uid.strip()}
+# Channel that receives debug/profiling reports; defaults to the channel the command came from
+ADMIN_CHANNEL_ID = int(os.getenv("ADMIN_CHANNEL_ID", "0") or 0)
+MAX_PROFILE_SECONDS = 600
+# Photos analyzed per !submit, and how many of them are processed at once
+SUBMIT_MAX_IMAGES = int(os.getenv("SUBMIT_MAX_IMAGES", "4"))
+SUBMIT_IMAGE_CONCURRENCY = int(os.getenv("SUBMIT_IMAGE_CONCURRENCY", "3"))
+# How long new trend challenges and competitions run before they are closed automatically
+TREND_DURATION_DAYS = float(os.getenv("TREND_DURATION_DAYS", "7"))
+COMPETITION_DURATION_DAYS = float(os.getenv("COMPETITION_DURATION_DAYS", "7"))
+IMAGE_MEMORY_BUDGET_MB = int(os.getenv("IMAGE_MEMORY_BUDGET_MB", "256"))
 
-print(f"Initializing Gemini with API key: {GEMINI_API_KEY[:5]}...")  # Debug log
-genai.configure(api_key=GEMINI_API_KEY)
 
 class MistralAgent:
-    def __init__(self):
-        self.data_manager = DataManager()
-        try:
-            # Initialize Gemini model with the correct model name
-            self.vision_model = genai.GenerativeModel('gemini-1.5-flash')  # Updated model name
-            self.text_model = genai.GenerativeModel('gemini-1.5-flash')  # For text interactions
-            print("Gemini models initialized successfully")
-        except Exception as e:
-            print(f"Error initializing Gemini models: {str(e)}")
-            raise
+    def __init__(self, text_model=None, vision_model=None, data_manager=None, data_managers=None):
+        """
+        Args:
+            text_model: Backend used for text prompts (see llm_backends). Defaults to
+                the backend selected by LLM_BACKEND.
+            vision_model: Backend used for outfit image analysis.
+            data_manager: A single store shared by every guild (benchmarks, tests).
+            data_managers: Per-guild stores; defaults to GuildDataManagers on ./data.
+                Ignored when data_manager is given.
+        """
+        self.shared_data_manager = data_manager
+        self.data_managers = data_managers or GuildDataManagers(
+            legacy_guild_id=os.getenv("LEGACY_DATA_GUILD_ID") or None
+        )
+        # Store for messages without a guild (DMs)
+        self.data_manager = data_manager or self.data_managers.default
+
+        # Model backends are built on first use (or by warm_up()) so that the bot can
+        # connect and answer data-only commands before the model SDK is loaded.
+        self._vision_model = vision_model
+        self._text_model = text_model
+        self._model_lock = threading.Lock()
+        self.warmed_up = False
+        
+        # Running `!debug profile` session, if any
+        self.profile_session = None
+        
+        # In-memory reaction vote tallies, one per store (see vote_tally.py)
+        self.reaction_tallies = {}
         
+        # Memory shared by all image downloads and preprocessing (see image_admission.py)
+        self.image_budget = MemoryBudget(IMAGE_MEMORY_BUDGET_MB * 1024 * 1024)
+        
+        # Closes trends and competitions at their end_date (see challenge_scheduler.py).
+        # The Discord client is set by start_scheduler and used to announce the results.
+        self.scheduler = ChallengeScheduler(self._close_due_challenge)
+        self.client = None
+        
+        
+        self._configure()
+
+    def _configure(self):
+        """
+        Settings and prompt material that a hot reload replaces (see hot_reload.py).
+        Stores, vote tallies, the scheduler and the model backends are kept.
+        """
         # Sample trend ideas for inspiration
         self.trend_ideas = [
             "Y2K Revival", "Quiet Luxury", "Barbiecore", "Dark Academia", 
@@ -62,6 +115,170 @@ class MistralAgent:
             "Normcore": "Intentionally ordinary, unremarkable clothing focusing on basics and practical pieces.",
             "Dopamine Dressing": "Joy-inducing fashion with bold colors, fun patterns, and playful accessories to boost mood."
         }
+        
+        # Static prompt prefixes per trend and per submission (see prompts.py)
+        self.prompts = PromptTemplates()
+        self.image_budget.set_budget(IMAGE_MEMORY_BUDGET_MB * 1024 * 1024)
+    
+    def reloaded(self):
+        """Bring an agent created from an earlier version of this class up to date after a hot reload."""
+        self._configure()
+        # The scheduler holds a bound method of the previous class
+        self.scheduler.on_due = self._close_due_challenge
+        # Cached replies were rendered by the previous code
+        stores = [self.shared_data_manager] if self.shared_data_manager else self.data_managers.loaded()
+        for store in stores:
+            store.renders.clear()
+    
+    @property
+    def text_model(self):
+        """Backend for text interactions."""
+        return self._get_model("_text_model")
+
+    @property
+    def vision_model(self):
+        """Backend for outfit image analysis."""
+        return self._get_model("_vision_model")
+
+    def _get_model(self, attribute):
+        model = getattr(self, attribute)
+        if model is not None:
+            return model
+        with self._model_lock:
+            model = getattr(self, attribute)
+            if model is None:
+                try:
+                    # Gemini unless LLM_BACKEND says otherwise
+                    model = create_backend(DEFAULT_MODEL_NAME)
+                    setattr(self, attribute, model)
+                    print(f"Model backend {attribute.strip('_')} initialized successfully")
+                except Exception as e:
+                    print(f"Error initializing model backends: {str(e)}")
+                    raise
+        return model
+
+    def warm_up(self):
+        """
+        Import the heavy libraries and build the model backends ahead of the first
+        request that needs them. Blocking; run it off the event loop.
+
+        Returns:
+            dict: Seconds spent on each warm-up step
+        """
+        timings = {}
+        start = time.perf_counter()
+        import PIL.Image  # noqa: F401
+        import requests  # noqa: F401
+        import similarity  # noqa: F401  (NumPy)
+        timings["imports"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        self.text_model
+        self.vision_model
+        timings["models"] = time.perf_counter() - start
+
+        self.warmed_up = True
+        return timings
+
+    async def cached_reply(self, dm, key, topics, render):
+        """
+        Reply to a read-only command from the store's render cache (see render_cache.py).
+
+        Args:
+            dm (AsyncDataManager): Store the reply is rendered from
+            key (tuple): Command and, for personal replies, the user
+            topics (tuple): Data the reply depends on, e.g. ("leaderboard",)
+            render: Coroutine function that builds the reply on a miss
+        """
+        return await dm.sync.renders.get(key, topics, render)
+
+    def data_manager_for(self, message: discord.Message):
+        """Return the async store (AsyncDataManager) for the guild a message was sent in."""
+        return self.data_manager_for_guild(message.guild.id if message.guild else None)
+    
+    def data_manager_for_guild(self, guild_id):
+        """Return the async store (AsyncDataManager) for a guild id (None for DMs)."""
+        if self.shared_data_manager:
+            return self.shared_data_manager.aio
+        return self.data_managers.get(guild_id).aio
+
+    def reaction_tally_for(self, dm):
+        """Return the (started) ReactionTally for an AsyncDataManager's store."""
+        key = dm.sync.data_folder
+        if key not in self.reaction_tallies:
+            self.reaction_tallies[key] = ReactionTally(dm.sync)
+        tally = self.reaction_tallies[key]
+        tally.start()
+        return tally
+
+    async def handle_vote_reaction(self, guild_id, message_id, user_id, added):
+        """Count a VOTE_EMOJI reaction added to (or removed from) a competition entry message."""
+        dm = self.data_manager_for_guild(guild_id)
+        return await self.reaction_tally_for(dm).note_reaction(message_id, user_id, added)
+    
+    async def start_scheduler(self, client, guild_ids):
+        """
+        Start closing challenges at their deadlines, scheduling the active ones of
+        every guild. Challenges that ended while the bot was offline close right away.
+        
+        Args:
+            client: Discord client used to post results in the challenges' channels
+            guild_ids (list): Guilds whose stores are scanned for active challenges
+        """
+        self.client = client
+        for guild_id in guild_ids:
+            await self.schedule_challenges(guild_id)
+        self.scheduler.start()
+    
+    async def schedule_challenges(self, guild_id):
+        """Schedule the deadlines of a guild's active trend and competition."""
+        dm = self.data_manager_for_guild(guild_id)
+        active_trend = await dm.get_active_trend()
+        if active_trend:
+            self.scheduler.schedule(challenge_deadline(active_trend), guild_id, "trend", active_trend["start_date"])
+        active_comp = await dm.get_active_competition()
+        if active_comp:
+            self.scheduler.schedule(challenge_deadline(active_comp), guild_id, "competition", active_comp["start_date"])
+    
+    async def _close_due_challenge(self, guild_id, kind, challenge_id):
+        """Close a trend or competition whose deadline has passed and announce it in its channel."""
+        dm = self.data_manager_for_guild(guild_id)
+        
+        if kind == "trend":
+            active_trend = await dm.get_active_trend()
+            if not active_trend or active_trend["start_date"] != challenge_id:
+                return  # ended by hand or replaced
+            success, result = await dm.end_current_trend()
+            if not success:
+                return
+            channel_id = active_trend.get("channel_id")
+            text = f"""
+## Trend Challenge Ended: {active_trend['name']}
+
+Time's up! Thank you to all {len(active_trend['participants'])} participants.
+Check the leaderboard with `!leaderboard` to see the results!
+"""
+        else:
+            active_comp = await dm.get_active_competition()
+            if not active_comp or active_comp["start_date"] != challenge_id:
+                return
+            if active_comp.get("voting") == "reactions" and self.client is not None:
+                async def fetch_entry_message(channel_id, message_id):
+                    return await self.client.get_channel(channel_id).fetch_message(message_id)
+                
+                await self.reaction_tally_for(dm).reconcile(fetch_entry_message)
+            success, result = await dm.end_competition()
+            if not success:
+                return
+            channel_id = active_comp.get("channel_id")
+            text = self._render_competition_result(result)
+        
+        print(f"Closed {kind} {challenge_id} in guild {guild_id} at its deadline")  # Debug log
+        channel = self.client.get_channel(channel_id) if self.client is not None and channel_id else None
+        if channel is None:
+            return
+        for part in self.split_message(text):
+            await channel.send(part)
 
     def clear_chat_history(self):
         """Clear any stored chat history to ensure fresh analysis."""
@@ -73,8 +290,10 @@ class MistralAgent:
         if message.content.startswith("!"):
             return await self.process_command(message)
             
+        dm = self.data_manager_for(message)
+
         # Get user's recent chat history for context
-        user_history = self.data_manager.get_chat_history(message.author.id, limit=3)
+        user_history = await dm.get_chat_history(message.author.id, limit=3)
         
         # Prepare context from chat history
         context = ""
@@ -84,7 +303,7 @@ class MistralAgent:
                 context += f"User: {entry['user_message']}\nAI: {entry['ai_response'][:100]}...\n\n"
         
         # Get recent submissions for context
-        recent_submissions = self.data_manager.get_outfit_submissions_history(message.author.id, limit=1)
+        recent_submissions = await dm.get_outfit_submissions_history(message.author.id, limit=1)
         if recent_submissions:
             recent = recent_submissions[0]
             context += f"\nUser's most recent outfit submission had ratings:\n"
@@ -107,11 +326,12 @@ Remember they can submit outfits with !submit and get feedback on their last out
 """
 
         try:
-            response = self.text_model.generate_content(prompt)
+            with stage("model_call"):
+                response = await asyncio.to_thread(self.text_model.generate_content, prompt)
             ai_response = response.text
             
             # Save to chat history
-            self.data_manager.add_to_chat_history(
+            await dm.add_to_chat_history(
                 message.author.id,
                 message.content,
                 ai_response
@@ -144,10 +364,18 @@ Remember they can submit outfits with !submit and get feedback on their last out
             return await self.handle_help_command(message)
         elif command == "!feedback":
             return await self.handle_feedback_command(message)
+        elif command == "!similar":
+            return await self.handle_similar_command(message)
+        elif command == "!stats":
+            return await self.handle_stats_command(message, parts)
+        elif command == "!debug":
+            return await self.handle_debug_command(message, parts)
         else:
             return None
         
     async def handle_trend_command(self, message: discord.Message, parts):
+        dm = self.data_manager_for(message)
+
         if len(parts) < 2:
             return """
 **Trend Command Help**
@@ -155,6 +383,7 @@ Remember they can submit outfits with !submit and get feedback on their last out
 - `!trend end` - End the current trend challenge
 - `!trend list` - List available trend ideas
 - `!trend status` - Show current active trend
+- `!trend history` - Show recent past trends
 """
         
         action = parts[1].lower()
@@ -167,14 +396,18 @@ Remember they can submit outfits with !submit and get feedback on their last out
                 description_prompt = f"Create a brief description (2-3 sentences) of the fashion trend '{trend_name}'. Include key style elements, signature pieces, and overall aesthetic."
                 
                 # Generate description using the text model
-                response = self.text_model.generate_content(description_prompt)
+                with stage("model_call"):
+                    response = await asyncio.to_thread(self.text_model.generate_content, description_prompt)
                 description = response.text
             else:
                 return "Please provide a trend name: `!trend announce [trend name]`"
             
-            success, result = self.data_manager.announce_trend(trend_name, description)
+            success, result = await dm.announce_trend(trend_name, description, TREND_DURATION_DAYS,
+                                                      channel_id=message.channel.id)
             
             if success:
+                self.scheduler.schedule(challenge_deadline(result), message.guild.id if message.guild else None,
+                                        "trend", result["start_date"])
                 return f"""
 ## 🌟 New Trend Challenge Announced! 🌟
 
@@ -188,48 +421,68 @@ Remember they can submit outfits with !submit and get feedback on their last out
 3. Submit with `!submit` and attach your image
 4. Get AI feedback and earn points!
 
-Challenge ends in {result['duration_days']} days. Good luck, fashionistas!
+Challenge ends in {result['duration_days']:g} days. Good luck, fashionistas!
 """
             else:
                 return f"Could not announce trend: {result}"
                 
         elif action == "end":
-            success, result = self.data_manager.end_current_trend()
+            success, result = await dm.end_current_trend()
             if success:
                 return "The current trend challenge has ended. Check the leaderboard to see the results!"
             else:
                 return f"Error: {result}"
                 
         elif action == "list":
-            trend_list = "\n".join([f"- {trend}" for trend in self.trend_ideas])
-            return f"""
+            return await self.cached_reply(dm, ("trend list",), (), self._render_trend_list)
+        
+        elif action == "status":
+            return await self.cached_reply(dm, ("trend status",), ("trend",),
+                                           lambda: self._render_trend_status(dm))
+        
+        elif action == "history":
+            past_trends = await dm.get_past_trends(limit=10)
+            if not past_trends:
+                return "No past trend challenges yet."
+            lines = [f"- **{trend['name']}** ({len(trend.get('participants', []))} participants, started {trend['start_date'][:10]})"
+                     for trend in past_trends]
+            return "**Past Trend Challenges:**\n" + "\n".join(lines)
+        
+        return "Unknown trend command. Try `!trend` for help."
+    
+    async def _render_trend_list(self):
+        trend_list = "\n".join([f"- {trend}" for trend in self.trend_ideas])
+        return f"""
 **Available Trend Ideas:**
 {trend_list}
 
 Use `!trend announce [trend name]` to start a challenge with one of these trends.
 """
-        
-        elif action == "status":
-            active_trend = self.data_manager.get_active_trend()
-            if active_trend:
-                return f"""
+    
+    async def _render_trend_status(self, dm):
+        active_trend = await dm.get_active_trend()
+        if active_trend:
+            return f"""
 **Current Trend Challenge: {active_trend['name']}**
 
 {active_trend['description']}
 
 Participants: {len(active_trend['participants'])}
 Started: {active_trend['start_date']}
+Ends: <t:{int(challenge_deadline(active_trend))}:R>
 """
-            else:
-                return "No active trend challenge at the moment."
-        
-        return "Unknown trend command. Try `!trend` for help."
+        else:
+            return "No active trend challenge at the moment."
     
     async def handle_submit_command(self, message: discord.Message):
         """Handle outfit submissions using Gemini Vision."""
+        from palette import merge_profiles
+
+        dm = self.data_manager_for(message)
+
         try:
             # Check if there's an active trend
-            active_trend = self.data_manager.get_active_trend()
+            active_trend = await dm.get_active_trend()
             if not active_trend:
                 return "Sorry, there's no active trend challenge to submit to. Wait for the next announcement!"
             
@@ -237,134 +490,74 @@ Started: {active_trend['start_date']}
             if not message.attachments:
                 return "Please attach an image of your outfit to submit for the trend challenge."
             
-            image_url = message.attachments[0].url
-            print(f"Processing image from URL: {image_url}")  # Debug log
+            # Photos of the same outfit (front, back, details) are analyzed concurrently
+            attachments = message.attachments[:SUBMIT_MAX_IMAGES]
+            print(f"Processing {len(attachments)} image(s): {', '.join(a.url for a in attachments)}")  # Debug log
             
-            try:
-                # Download and process the image
-                response = requests.get(image_url)
-                print(f"Image download status: {response.status_code}")  # Debug log
-                
-                if response.status_code != 200:
-                    return "Error downloading the image. Please try again."
-                
-                img_data = BytesIO(response.content)
-                img = Image.open(img_data)
-                
-                # Convert image to RGB if it's not
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-                
-                # Resize if image is too large
-                max_size = (1024, 1024)
-                if img.size[0] > max_size[0] or img.size[1] > max_size[1]:
-                    img.thumbnail(max_size, Image.Resampling.LANCZOS)
-                
-                print(f"Image processed successfully. Mode: {img.mode}, Size: {img.size}")  # Debug log
-                
-                # Create the prompt for Gemini
-                prompt = f"""Analyze this outfit for the {active_trend['name']} trend challenge.
-
-REQUIREMENTS:
-1. Be extremely specific about colors and items you can see
-2. Only describe what is clearly visible
-3. Rate on three criteria (1-10 scale)
-
-FORMAT YOUR RESPONSE EXACTLY LIKE THIS:
-
-## Visual Inventory
-- Top: [exact description]
-- Bottom: [exact description]
-- Footwear: [if visible]
-- Accessories: [only visible items]
-- Colors: [exact colors seen]
-
-## Style Analysis
-[How the outfit relates to the {active_trend['name']} trend]
-
-## Ratings
-Trend Accuracy: [X]/10
-[Specific justification]
-
-Creativity: [X]/10
-[Specific justification]
-
-Overall Fit: [X]/10
-[Specific justification]
-
-## Summary
-[Brief assessment]
-
-## Improvement Tips
-[2-3 specific suggestions to improve this outfit]"""
+            slots = asyncio.Semaphore(SUBMIT_IMAGE_CONCURRENCY)
+            
+            async def analyze(index, attachment):
+                async with slots:
+                    return await self._analyze_outfit_image(attachment, active_trend, index, len(attachments))
+            
+            results = await asyncio.gather(*(analyze(i, a) for i, a in enumerate(attachments)), return_exceptions=True)
+            photos = [result for result in results if not isinstance(result, BaseException)]
+            if not photos:
+                return self._image_error_reply(results[0])
+            
+            # One rating for the outfit: the mean of each criterion over the analyzed photos
+            trend_accuracy = sum(photo["ratings"][0] for photo in photos) / len(photos)
+            creativity = sum(photo["ratings"][1] for photo in photos) / len(photos)
+            fit = sum(photo["ratings"][2] for photo in photos) / len(photos)
+            
+            if len(attachments) == 1:
+                analysis = photos[0]["analysis"]
+            else:
+                sections = []
+                for index, result in enumerate(results):
+                    if isinstance(result, BaseException):
+                        sections.append(f"### Photo {index + 1}\n{self._image_error_reply(result)}")
+                    else:
+                        sections.append(f"### Photo {index + 1}\n{result['analysis']}")
+                analysis = "\n\n".join(sections) + f"""
 
-                print("Sending request to Gemini...")  # Debug log
-                
-                # Convert image to base64 for Gemini
-                img_byte_arr = BytesIO()
-                img.save(img_byte_arr, format='JPEG')
-                img_byte_arr = img_byte_arr.getvalue()
-                img_b64 = base64.b64encode(img_byte_arr).decode('utf-8')
-                
-                # Get Gemini's analysis
-                try:
-                    response = self.vision_model.generate_content([
-                        prompt,
-                        {
-                            "mime_type": "image/jpeg",
-                            "data": img_b64
-                        }
-                    ])
-                    print(f"Gemini response received: {response}")  # Debug log
-                    
-                except Exception as e:
-                    print(f"Gemini API error: {str(e)}")
-                    if "deprecated" in str(e).lower():
-                        print(f"Full error: {str(e)}")  # Additional debug logging
-                        return "Sorry, there was an error with the image analysis service. Please contact the bot administrator."
-                    return "Error analyzing the image. Please try again."
-                
-                if not response.text:
-                    return "Sorry, I couldn't analyze the image. Please try again."
-                    
-                analysis = response.text
-                print(f"Analysis text: {analysis[:100]}...")  # Debug log
-                
-                # Extract ratings using regex
-                trend_match = re.search(r'Trend Accuracy:\s*(\d+)', analysis)
-                creativity_match = re.search(r'Creativity:\s*(\d+)', analysis)
-                fit_match = re.search(r'Overall Fit:\s*(\d+)', analysis)
-                
-                trend_accuracy = float(trend_match.group(1)) if trend_match else 5.0
-                creativity = float(creativity_match.group(1)) if creativity_match else 5.0
-                fit = float(fit_match.group(1)) if fit_match else 5.0
-                
-                # Save submission and ratings with analysis text
-                success, submission = self.data_manager.submit_outfit(
-                    message.author.id,
-                    message.author.name,
-                    image_url,
-                    analysis_text=analysis
-                )
-                
-                if not success:
-                    return f"Error submitting your outfit: {submission}"
-                
-                # Save the ratings
-                self.data_manager.rate_submission(
-                    message.author.id,
-                    trend_accuracy,
-                    creativity,
-                    fit,
-                    submission_id=submission["id"],
-                    username=message.author.name
-                )
-                
-                # Get updated user info
-                user_info = self.data_manager.get_user(message.author.id)
-                
-                # Format response
-                response_text = f"""
+## Combined Rating ({len(photos)} of {len(attachments)} photos)
+Trend Accuracy: {trend_accuracy:.1f}/10
+Creativity: {creativity:.1f}/10
+Overall Fit: {fit:.1f}/10"""
+            
+            # Save submission and ratings with analysis text. The first photo stands
+            # for the outfit in !similar and !feedback --image.
+            main = photos[0]
+            success, submission = await dm.submit_outfit(
+                message.author.id,
+                message.author.name,
+                main["url"],
+                analysis_text=analysis,
+                image_profile=merge_profiles([photo["profile"] for photo in photos])
+            )
+            
+            if not success:
+                return f"Error submitting your outfit: {submission}"
+            
+            await dm.add_outfit_features(submission, main["features"])
+            await dm.cache_submission_image(submission["id"], main["image_bytes"])
+            
+            # Save the ratings
+            await dm.rate_submission(
+                message.author.id,
+                trend_accuracy,
+                creativity,
+                fit,
+                submission_id=submission["id"],
+                username=message.author.name
+            )
+            
+            # Get updated user info
+            user_info = await dm.get_user(message.author.id)
+            
+            # Format response
+            response_text = f"""
 ## Outfit Submission for {active_trend['name']}
 
 {analysis}
@@ -375,28 +568,16 @@ Overall Fit: [X]/10
 Thank you for participating! Check the leaderboard with `!leaderboard`
 Need more feedback? Ask me with `!feedback YOUR QUESTION`
 """
-                
-                # Save message in chat history
-                self.data_manager.add_to_chat_history(
-                    message.author.id,
-                    f"!submit [image]",
-                    response_text,
-                    submission_id=submission["id"]
-                )
-                
-                return self.split_message(response_text)
-                
-            except requests.RequestException as e:
-                print(f"Error downloading image: {str(e)}")
-                return "Error downloading the image. Please try again."
-            except Image.UnidentifiedImageError:
-                print("Error: Could not identify image format")
-                return "Error: The image format is not supported. Please try a different image."
-            except Exception as e:
-                print(f"Error processing image: {str(e)}")
-                import traceback
-                traceback.print_exc()
-                return "Error processing the image. Please try again."
+            
+            # Save message in chat history
+            await dm.add_to_chat_history(
+                message.author.id,
+                f"!submit [image]",
+                response_text,
+                submission_id=submission["id"]
+            )
+            
+            return self.split_message(response_text)
             
         except Exception as e:
             print(f"General error in handle_submit_command: {str(e)}")
@@ -404,8 +585,193 @@ Need more feedback? Ask me with `!feedback YOUR QUESTION`
             traceback.print_exc()
             return "Sorry, there was an error analyzing your image. Please try again."
     
+    async def _analyze_outfit_image(self, attachment, active_trend, index=0, count=1):
+        """
+        Download, preprocess and analyze one submitted photo. Download and
+        preprocessing run under the memory budget, and every blocking stage runs in
+        a worker thread, so several photos of one submission overlap.
+        
+        Returns:
+            dict: url, analysis, ratings (trend accuracy, creativity, fit),
+            features, profile and image_bytes (the model-ready JPEG)
+        
+        Raises:
+            ImageAnalysisError: With the message to show the user (other
+                download and decoding errors are passed through)
+        """
+        from palette import describe_profile, with_measured_colors
+        
+        image_url = attachment.url
+        
+        # Refuse oversized images before downloading them (see image_admission.py)
+        size = getattr(attachment, "size", None)
+        width, height = getattr(attachment, "width", None), getattr(attachment, "height", None)
+        check_image(size, width, height, getattr(attachment, "content_type", None), self.image_budget.max_pixels)
+        if width and height:
+            cost = estimate_cost(size or MAX_IMAGE_BYTES, width, height)
+        else:
+            cost = size or MAX_IMAGE_BYTES  # only the download until the header is read
+        
+        # Download and preprocess in worker threads once the memory budget allows
+        async with self.image_budget.reserve(cost) as reservation:
+            opened = await asyncio.to_thread(self._open_image, image_url)
+            if opened is None:
+                raise ImageAnalysisError("Error downloading the image. Please try again.")
+            img, body_bytes = opened
+            await reservation.resize(estimate_cost(body_bytes, *img.size, len(img.getbands())))
+            img_byte_arr, img_b64, features, profile = await asyncio.to_thread(self._preprocess_image, img)
+        
+        # The trend's instructions are a reusable prefix; only the photo and its
+        # measurements differ. Colors are measured locally (palette.py), so the
+        # model doesn't list them.
+        colors, facts = describe_profile(profile)
+        contents = [
+            self.prompts.submit_prefix(active_trend['name']),
+            {
+                "mime_type": "image/jpeg",
+                "data": img_b64
+            },
+            self.prompts.submit_suffix(colors, facts, index, count)
+        ]
+
+        print("Sending request to Gemini...")  # Debug log
+        
+        # Get Gemini's analysis
+        try:
+            with stage("model_call"):
+                response = await asyncio.to_thread(self.vision_model.generate_content, contents)
+            print(f"Gemini response received: {response}")  # Debug log
+            record_usage("!submit", contents, response)
+            
+        except Exception as e:
+            print(f"Gemini API error: {str(e)}")
+            if "deprecated" in str(e).lower():
+                print(f"Full error: {str(e)}")  # Additional debug logging
+                raise ImageAnalysisError("Sorry, there was an error with the image analysis service. Please contact the bot administrator.")
+            raise ImageAnalysisError("Error analyzing the image. Please try again.")
+        
+        if not response.text:
+            raise ImageAnalysisError("Sorry, I couldn't analyze the image. Please try again.")
+            
+        analysis = with_measured_colors(response.text, colors)
+        print(f"Analysis text: {analysis[:100]}...")  # Debug log
+        
+        # Extract ratings using regex
+        trend_match = re.search(r'Trend Accuracy:\s*(\d+)', analysis)
+        creativity_match = re.search(r'Creativity:\s*(\d+)', analysis)
+        fit_match = re.search(r'Overall Fit:\s*(\d+)', analysis)
+        
+        return {
+            "url": image_url,
+            "analysis": analysis,
+            "ratings": (
+                float(trend_match.group(1)) if trend_match else 5.0,
+                float(creativity_match.group(1)) if creativity_match else 5.0,
+                float(fit_match.group(1)) if fit_match else 5.0,
+            ),
+            "features": features,
+            "profile": profile,
+            "image_bytes": img_byte_arr,
+        }
+    
+    def _image_error_reply(self, error):
+        """Message for a photo that could not be analyzed."""
+        import requests
+        from PIL import Image
+        
+        if isinstance(error, (ImageAnalysisError, ImageRejected)):
+            print(f"Image not analyzed: {str(error)}")  # Debug log
+            return str(error)
+        if isinstance(error, requests.RequestException):
+            print(f"Error downloading image: {str(error)}")
+            return "Error downloading the image. Please try again."
+        if isinstance(error, Image.UnidentifiedImageError):
+            print("Error: Could not identify image format")
+            return "Error: The image format is not supported. Please try a different image."
+        print(f"Error processing image: {str(error)}")
+        import traceback
+        traceback.print_exception(error)
+        return "Error processing the image. Please try again."
+    
+    def download_image(self, image_url):
+        """Fetch an attachment. Returns an object with `status_code` and `content`."""
+        import requests
+
+        return requests.get(image_url)
+
+    def _open_image(self, image_url):
+        """
+        Download an attachment and read its header (blocking). Nothing is decoded yet.
+
+        Returns:
+            tuple: (lazily loaded PIL image, downloaded bytes), or None if the download failed
+        """
+        from PIL import Image
+
+        # PIL's own decompression bomb guard, as a backstop to check_image
+        Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+        with stage("download"):
+            response = self.download_image(image_url)
+        print(f"Image download status: {response.status_code}")  # Debug log
+        if response.status_code != 200:
+            return None
+
+        body_bytes = len(response.content)
+        check_image(body_bytes)
+        try:
+            img = Image.open(BytesIO(response.content))
+        except Image.DecompressionBombError:
+            raise ImageRejected("That image is too large to process. Please upload a smaller one.")
+        check_image(width=img.size[0], height=img.size[1], max_pixels=self.image_budget.max_pixels)
+        return img, body_bytes
+
+    def _preprocess_image(self, img):
+        """
+        Decode, convert and resize an image for the vision model (blocking).
+
+        Returns:
+            tuple: (JPEG bytes, base64 JPEG, outfit_features vector, image_profile dict)
+        """
+        from PIL import Image
+        from similarity import outfit_features
+        from palette import image_profile
+
+        original_size = img.size
+        with stage("preprocess"):
+            # Convert image to RGB if it's not
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+            
+            # Resize if image is too large
+            max_size = (MODEL_IMAGE_SIZE, MODEL_IMAGE_SIZE)
+            if img.size[0] > max_size[0] or img.size[1] > max_size[1]:
+                img.thumbnail(max_size, Image.Resampling.LANCZOS)
+            
+            # Convert image to base64 for Gemini
+            img_byte_arr = BytesIO()
+            img.save(img_byte_arr, format='JPEG')
+            img_byte_arr = img_byte_arr.getvalue()
+            img_b64 = base64.b64encode(img_byte_arr).decode('utf-8')
+            
+            # Cheap local descriptor for !similar
+            features = outfit_features(img)
+            
+            # Dominant colors and image statistics for the prompt and the stored submission
+            profile = image_profile(img)
+            profile["width"], profile["height"] = original_size
+            profile["aspect"] = round(original_size[0] / original_size[1], 3)
+        
+        print(f"Image processed successfully. Mode: {img.mode}, Size: {img.size}")  # Debug log
+        return img_byte_arr, img_b64, features, profile
+
     async def handle_leaderboard_command(self, message: discord.Message):
-        leaderboard = self.data_manager.get_leaderboard(10)
+        dm = self.data_manager_for(message)
+        return await self.cached_reply(dm, ("leaderboard",), ("leaderboard",),
+                                       lambda: self._render_leaderboard(dm))
+    
+    async def _render_leaderboard(self, dm):
+        leaderboard = await dm.get_leaderboard(10)
         
         if not leaderboard:
             return "No participants in the leaderboard yet."
@@ -424,35 +790,137 @@ Earn points by submitting outfits to trend challenges and winning competitions!
 """
     
     async def handle_points_command(self, message: discord.Message):
-        user_info = self.data_manager.get_user(message.author.id)
+        dm = self.data_manager_for(message)
+        # The card shows the current Discord name, so it is part of the key
+        return await self.cached_reply(dm, ("points", message.author.id, message.author.name),
+                                       (f"user:{message.author.id}",),
+                                       lambda: self._render_points(dm, message.author))
+    
+    async def _render_points(self, dm, author):
+        user_info = await dm.get_user(author.id)
         
         if not user_info:
             return "You haven't participated in any challenges yet. Submit an outfit to get started!"
         
         return f"""
-## Style Stats for {message.author.name}
+## Style Stats for {author.name}
 
 **Points:** {user_info['points']}
 **Participations:** {user_info['participations']}
 **Competition Wins:** {user_info['wins']}
 
 Keep styling to earn more points and unlock rewards!
+"""
+    
+    async def handle_similar_command(self, message: discord.Message):
+        dm = self.data_manager_for(message)
+
+        matches = await dm.find_similar_outfits(message.author.id)
+        if matches is None:
+            return "Submit an outfit with `!submit` first, then I can find similar looks!"
+        if not matches:
+            return "No other outfits to compare with yet."
+        
+        lines = [
+            f"{i + 1}. **{entry['username']}** for *{entry['trend_id']}* - {score * 100:.0f}% similar\n{entry['image_url']}"
+            for i, (entry, score) in enumerate(matches)
+        ]
+        return "## 👯 Outfits Similar to Your Latest Submission\n\n" + "\n".join(lines)
+    
+    async def handle_stats_command(self, message: discord.Message, parts):
+        dm = self.data_manager_for(message)
+        action = parts[1].lower() if len(parts) > 1 else "trends"
+        
+        if action not in ("trends", "trend", "me", "movers", "colors", "help"):
+            # `!stats Y2K Revival` is the same as `!stats trend Y2K Revival`
+            parts = parts[:1] + ["trend"] + parts[1:]
+            action = "trend"
+        
+        if action in ("trends", "trend"):
+            trend = " ".join(parts[2:]) or None
+            summaries = await dm.get_trend_stats(trend)
+            if not summaries:
+                return f"No rated submissions for '{trend}' yet." if trend else "No rated submissions yet."
+            lines = [
+                f"**{summary['trend']}** ({summary['count']} submissions)\n"
+                f"Average {summary['average']:.1f}/10 (p25 {summary['p25']:.1f}, median {summary['p50']:.1f}, p90 {summary['p90']:.1f}) - "
+                f"Trend Accuracy {summary['trend_accuracy']:.1f}, Creativity {summary['creativity']:.1f}, Fit {summary['fit']:.1f}"
+                for summary in summaries
+            ]
+            return "## 📊 Trend Ratings\n\n" + "\n\n".join(lines)
+        
+        elif action == "me":
+            trajectory = await dm.get_user_trajectory(message.author.id)
+            if not trajectory:
+                return "You don't have any rated submissions yet. Submit an outfit with `!submit`!"
+            lines = [
+                f"- {point['date']} **{point['trend']}**: {point['average']:.1f}/10 (running average {point['running_average']:.1f})"
+                for point in trajectory
+            ]
+            return f"## 📈 Rating History for {message.author.name}\n\n" + "\n".join(lines)
+        
+        elif action == "movers":
+            days = int(parts[2]) if len(parts) > 2 and parts[2].isdigit() else 7
+            deltas = await dm.get_leaderboard_deltas(days)
+            if not deltas:
+                return "No rated submissions yet."
+            lines = []
+            for delta in deltas:
+                if delta["previous_rank"] is None:
+                    movement = "new"
+                elif delta["previous_rank"] == delta["rank"]:
+                    movement = "="
+                else:
+                    change = delta["previous_rank"] - delta["rank"]
+                    movement = f"{'▲' if change > 0 else '▼'}{abs(change)}"
+                lines.append(f"{delta['rank']}. **{delta['username']}** - {delta['points']} points (+{delta['gained']}, {movement})")
+            return f"## 🚀 Rating Points Movers (last {days} days)\n\n" + "\n".join(lines)
+        
+        elif action == "colors":
+            trend = " ".join(parts[2:]) or None
+            colors = await dm.get_color_stats(trend)
+            if not colors:
+                return f"No color data for '{trend}' yet." if trend else "No color data yet. Colors are measured for new submissions."
+            lines = [
+                f"- **{color['color']}** - {color['count']} outfit{'s' if color['count'] != 1 else ''} ({color['share'] * 100:.0f}%), average rating {color['average']:.1f}/10"
+                for color in colors
+            ]
+            title = f"Dominant Colors in {trend}" if trend else "Dominant Colors"
+            return f"## 🎨 {title}\n\n" + "\n".join(lines)
+        
+        return """
+**Stats Command Help**
+- `!stats` - Rating distributions for recent trends
+- `!stats [trend name]` - Rating distribution for one trend (also `!stats trend [name]`)
+- `!stats me` - Your ratings over time
+- `!stats movers [days]` - Rank changes from rating points (default 7 days)
+- `!stats colors [trend name]` - Most common dominant outfit colors and how they rate
 """
     
     async def handle_competition_command(self, message: discord.Message, parts):
+        dm = self.data_manager_for(message)
+
         # Check if user has admin permissions for certain actions
         if len(parts) < 2:
             return """
 **Competition Command Help**
 - `!competition start [name]` - Start a new styling competition
+- `!competition start --reactions [name]` - Start a competition voted on with reactions
 - `!competition end` - End the current competition
 - `!competition status` - Show current active competition
+- `!competition standings` - Show the current vote standings
 - `!competition submit` - Submit an entry (with image attachment)
+- `!competition history` - Show recent past competitions and winners
 """
         
         action = parts[1].lower()
         
         if action == "start":
+            voting = "command"
+            if len(parts) >= 3 and parts[2].lower() == "--reactions":
+                voting = "reactions"
+                parts = parts[:2] + parts[3:]
+            
             if len(parts) < 3:
                 return "Please provide a name for the competition."
                 
@@ -460,20 +928,30 @@ Keep styling to earn more points and unlock rewards!
             
             # Generate description using the text model
             description_prompt = f"Create a description for a fashion styling competition called '{competition_name}'. Include what contestants should focus on and criteria for winning. Keep it under 100 words."
-            response = self.text_model.generate_content(description_prompt)
+            with stage("model_call"):
+                response = await asyncio.to_thread(self.text_model.generate_content, description_prompt)
             description = response.text
             
             # Generate sponsor
             sponsors = ["StyleCo", "Fashion Forward", "Trend Setters", "ChicBoutique", "Urban Edge"]
             sponsor = random.choice(sponsors)
             
-            success, result = self.data_manager.start_competition(
+            success, result = await dm.start_competition(
                 competition_name, 
                 description, 
-                sponsor
+                sponsor,
+                COMPETITION_DURATION_DAYS,
+                voting=voting,
+                channel_id=message.channel.id
             )
             
             if success:
+                self.scheduler.schedule(challenge_deadline(result), message.guild.id if message.guild else None,
+                                        "competition", result["start_date"])
+                if voting == "reactions":
+                    how_to_vote = f"Vote by reacting with {VOTE_EMOJI} to your favorite entries (one vote each)"
+                else:
+                    how_to_vote = "Other users can vote for their favorites with `!vote [username]`"
                 return f"""
 ## 🏆 New Styling Competition: {competition_name} 🏆
 
@@ -485,53 +963,37 @@ Keep styling to earn more points and unlock rewards!
 1. Style your best outfit for this theme
 2. Take a photo
 3. Submit with `!competition submit` and attach your image
-4. Other users can vote for their favorites with `!vote [username]`
+4. {how_to_vote}
 
-Competition runs for {result['duration_days']} days. The winner gets 100 bonus points!
+Competition runs for {result['duration_days']:g} days. The winner gets 100 bonus points!
 """
             else:
                 return f"Could not start competition: {result}"
                 
         elif action == "end":
-            success, result = self.data_manager.end_competition()
+            active_comp = await dm.get_active_competition()
+            if active_comp and active_comp.get("voting") == "reactions":
+                # Count reactions cast while offline (and drop removed ones) before picking a winner
+                async def fetch_entry_message(channel_id, message_id):
+                    channel = message.guild.get_channel(channel_id) if message.guild else None
+                    return await (channel or message.channel).fetch_message(message_id)
+                
+                await self.reaction_tally_for(dm).reconcile(fetch_entry_message)
+            
+            success, result = await dm.end_competition()
             
             if success:
-                winner_text = ""
-                if "winner" in result:
-                    winner_text = f"🎉 **WINNER: {result['winner']['username']}** with {result['winner']['votes']} votes! 🎉"
-                
-                return f"""
-## Competition Ended: {result['name']}
-
-{winner_text}
-
-Thank you to all {len(result['participants'])} participants!
-The winner has been awarded 100 bonus points.
-
-Stay tuned for the next competition!
-"""
+                return self._render_competition_result(result)
             else:
                 return f"Error: {result}"
                 
         elif action == "status":
-            active_comp = self.data_manager.get_active_competition()
-            
-            if not active_comp:
-                return "No active competition at the moment."
-                
-            participant_count = len(active_comp['participants'])
-                
-            return f"""
-## Active Competition: {active_comp['name']}
-
-{active_comp['description']}
-
-**Sponsored by:** {active_comp['sponsor']}
-**Participants:** {participant_count}
-**Started:** {active_comp['start_date']}
-
-Submit your entry with `!competition submit` and attach a photo!
-"""
+            return await self.cached_reply(dm, ("competition status",), ("competition",),
+                                           lambda: self._render_competition_status(dm))
+        
+        elif action == "standings":
+            return await self.cached_reply(dm, ("competition standings",), ("standings",),
+                                           lambda: self._render_competition_standings(dm))
         
         elif action == "submit":
             # Check for image attachment
@@ -547,13 +1009,24 @@ Submit your entry with `!competition submit` and attach a photo!
             else:
                 description = "No description provided."
                 
-            success, result = self.data_manager.submit_competition_entry(
+            success, result = await dm.submit_competition_entry(
                 message.author.id,
                 message.author.name,
                 image_url,
                 description
             )
             
+            active_comp = await dm.get_active_competition() if success else None
+            if active_comp and active_comp.get("voting") == "reactions":
+                # Post the entry on its own so people can vote on it with a reaction
+                entry_message = await message.channel.send(
+                    f"**Entry by {message.author.name}** - react with {VOTE_EMOJI} to vote!\n{description}\n{image_url}"
+                )
+                await entry_message.add_reaction(VOTE_EMOJI)
+                await dm.register_entry_message(entry_message.id, entry_message.channel.id, message.author.id)
+                self.reaction_tally_for(dm).invalidate()
+                return f"Your entry for the current competition has been posted. Votes are {VOTE_EMOJI} reactions on it - good luck!"
+            
             if success:
                 return f"""
 ## Competition Entry Submitted!
@@ -568,9 +1041,74 @@ Good luck!
             else:
                 return f"Error submitting your entry: {result}"
         
+        elif action == "history":
+            past_competitions = await dm.get_past_competitions(limit=10)
+            if not past_competitions:
+                return "No past competitions yet."
+            lines = []
+            for competition in past_competitions:
+                winner = competition.get("winner")
+                winner_text = f"won by {winner['username']} ({winner['votes']} votes)" if winner else "no winner"
+                lines.append(f"- **{competition['name']}** - {winner_text}")
+            return "**Past Competitions:**\n" + "\n".join(lines)
+        
         return "Unknown competition command. Try `!competition` for help."
     
+    def _render_competition_result(self, result):
+        winner_text = ""
+        if "winner" in result:
+            winner_text = f"🎉 **WINNER: {result['winner']['username']}** with {result['winner']['votes']} votes! 🎉"
+        
+        return f"""
+## Competition Ended: {result['name']}
+
+{winner_text}
+
+Thank you to all {len(result['participants'])} participants!
+The winner has been awarded 100 bonus points.
+
+Stay tuned for the next competition!
+"""
+    
+    async def _render_competition_standings(self, dm):
+        active_comp, standings = await dm.get_competition_standings(limit=10)
+        
+        if not active_comp:
+            return "No active competition at the moment."
+        if not standings:
+            return f"No entries in **{active_comp['name']}** yet. Submit one with `!competition submit`!"
+        
+        lines = [f"{rank}. **{standing['username']}** - {standing['votes']} vote{'s' if standing['votes'] != 1 else ''}"
+                 for rank, standing in enumerate(standings, 1)]
+        note = ""
+        if active_comp.get("voting") == "reactions":
+            note = "\n_Reaction votes are counted in batches and can take up to 30 seconds to show up._"
+        return f"**Standings: {active_comp['name']}**\n" + "\n".join(lines) + note
+    
+    async def _render_competition_status(self, dm):
+        active_comp = await dm.get_active_competition()
+        
+        if not active_comp:
+            return "No active competition at the moment."
+            
+        participant_count = len(active_comp['participants'])
+            
+        return f"""
+## Active Competition: {active_comp['name']}
+
+{active_comp['description']}
+
+**Sponsored by:** {active_comp['sponsor']}
+**Participants:** {participant_count}
+**Started:** {active_comp['start_date']}
+**Ends:** <t:{int(challenge_deadline(active_comp))}:R>
+
+Submit your entry with `!competition submit` and attach a photo!
+"""
+    
     async def handle_vote_command(self, message: discord.Message, parts):
+        dm = self.data_manager_for(message)
+
         if len(parts) < 2:
             return "Please specify a username to vote for: `!vote [username]`"
             
@@ -585,7 +1123,7 @@ Good luck!
         if not target_user:
             return f"Could not find user '{username}'. Please check the spelling."
             
-        success, result = self.data_manager.vote_for_submission(
+        success, result = await dm.vote_for_submission(
             message.author.id,
             target_user.id
         )
@@ -602,25 +1140,34 @@ Good luck!
 
 ### Outfit Analysis
 - **!submit** - Submit an outfit image for the current trend challenge
-- **!feedback [question]** - Ask for more detailed feedback or advice about your last outfit submission
+- **!feedback [--image] [question]** - Ask for more detailed feedback or advice about your last outfit submission (`--image` lets the AI look at the photo again)
+- **!similar** - Find other people's outfits that look like your latest submission
 
 ### Trends
 - **!trend** - View current trend challenge info
 - **!trend new [name] [description]** - (Admin) Start a new trend challenge
 - **!trend end** - (Admin) End the current trend challenge
+- **!trend history** - View recent past trend challenges
 
 ### Competitions
 - **!competition** - View active competition
 - **!competition new [name] [description] [sponsor]** - (Admin) Start a new competition
 - **!competition end** - (Admin) End the competition and calculate winners
-- **!vote [@user]** - Vote for someone's competition entry
+- **!competition standings** - View the current vote standings
+- **!competition history** - View recent past competitions and winners
+- **!vote [@user]** - Vote for someone's competition entry (or react to it, in reaction-voted competitions)
 
 ### Personal Stats
 - **!points** - Check your current points
 - **!leaderboard** - View the top users and their points
+- **!stats [trend name | me | movers | colors]** - Rating distributions, your progress, leaderboard movers and outfit colors
 
 ### General
 - **!help** - Show this help message
+- **!debug profile [duration]** - (Admin) Profile CPU and memory use and post a report
+- **!debug models** - (Admin) Show per-key usage of the model pool
+- **!debug prompts** - (Admin) Show prompt tokens per call and how many were served from cache
+- **!debug reload** - (Admin) Reload the bot's code, prompts and settings without restarting
 
 For any fashion advice, just message me directly!
 """
@@ -631,56 +1178,60 @@ For any fashion advice, just message me directly!
         Handle feedback requests about outfit submissions.
         This allows users to ask follow-up questions about their outfits.
         """
+        dm = self.data_manager_for(message)
+
         try:
             # Get user's chat history
-            user_history = self.data_manager.get_chat_history(message.author.id)
+            user_history = await dm.get_chat_history(message.author.id)
             
             # Get user's recent submissions
-            recent_submissions = self.data_manager.get_outfit_submissions_history(message.author.id)
+            recent_submissions = await dm.get_outfit_submissions_history(message.author.id)
             
             if not recent_submissions:
                 response = "You don't have any recent outfit submissions. Submit an outfit first with `!submit`."
-                self.data_manager.add_to_chat_history(message.author.id, message.content, response)
+                await dm.add_to_chat_history(message.author.id, message.content, response)
                 return response
             
             # Get user's query from the message
             user_query = message.content.replace("!feedback", "", 1).strip()
+            with_image = os.getenv("FEEDBACK_WITH_IMAGE", "0") == "1"
+            if user_query.startswith("--image"):
+                with_image = True
+                user_query = user_query[len("--image"):].strip()
             if not user_query:
                 response = "Please include a question about your outfit. For example: `!feedback How can I improve my color coordination?`"
-                self.data_manager.add_to_chat_history(message.author.id, message.content, response)
+                await dm.add_to_chat_history(message.author.id, message.content, response)
                 return response
             
             # Get most recent submission with analysis
             most_recent = recent_submissions[0]
             
-            # Create a prompt for the AI
-            prompt = f"""You are a fashion advisor analyzing a user's outfit. They submitted an outfit and received feedback, and now they're asking for more information.
-
-Here is the original analysis of their outfit:
-{most_recent.get('analysis_text', 'No analysis available')}
-
-The ratings were:
-Trend Accuracy: {most_recent.get('ratings', {}).get('trend_accuracy', 'N/A')}/10
-Creativity: {most_recent.get('ratings', {}).get('creativity', 'N/A')}/10
-Overall Fit: {most_recent.get('ratings', {}).get('fit', 'N/A')}/10
-
-The user is asking: "{user_query}"
-
-Give them specific, constructive advice based on the original analysis. Be encouraging while providing practical tips they can use.
-Focus on:
-1. Direct answers to their questions
-2. Specific, actionable improvement suggestions
-3. Encouragement and positive reinforcement
-4. Trend-relevant advice
-
-Format your response in clear, helpful paragraphs with bullet points for specific tips.
-"""
+            # Show the model the outfit again if the preprocessed image is still cached
+            image_bytes = None
+            if with_image:
+                image_bytes = await dm.get_submission_image(most_recent.get('id'))
+                if image_bytes is None:
+                    print(f"No cached image for submission {most_recent.get('id')}, answering from the analysis")  # Debug log
+            
+            # The analysis is a reusable prefix for every question about this submission
+            contents = [self.prompts.feedback_prefix(most_recent)]
+            if image_bytes:
+                contents.append({
+                    "mime_type": "image/jpeg",
+                    "data": base64.b64encode(image_bytes).decode('utf-8')
+                })
+            contents.append(self.prompts.feedback_suffix(user_query, with_image=bool(image_bytes)))
             try:
-                response = self.text_model.generate_content(prompt)
+                with stage("model_call"):
+                    if image_bytes:
+                        response = await asyncio.to_thread(self.vision_model.generate_content, contents)
+                    else:
+                        response = await asyncio.to_thread(self.text_model.generate_content, contents)
+                record_usage("!feedback", contents, response)
                 ai_response = response.text
                 
                 # Save to chat history
-                self.data_manager.add_to_chat_history(
+                await dm.add_to_chat_history(
                     message.author.id,
                     message.content,
                     ai_response,
@@ -699,6 +1250,92 @@ Format your response in clear, helpful paragraphs with bullet points for specifi
             traceback.print_exc()
             return "Sorry, there was an error processing your feedback request. Please try again."
 
+    def is_admin(self, member):
+        """Admins are listed in ADMIN_USER_IDS or have the guild Administrator permission."""
+        if member.id in ADMIN_USER_IDS:
+            return True
+        permissions = getattr(member, "guild_permissions", None)
+        return bool(permissions and permissions.administrator)
+
+    async def handle_debug_command(self, message: discord.Message, parts):
+        """Admin-only diagnostics: `!debug profile 60s [pstats]`, `!debug profile stop`, `!debug models`, `!debug prompts` and `!debug reload`."""
+        if not self.is_admin(message.author):
+            return "Sorry, `!debug` is only available to server admins."
+
+        if len(parts) == 2 and parts[1].lower() == "models":
+            # Per-key usage of the model pool (LLM_BACKEND=pool)
+            pool = self.text_model
+            if not hasattr(pool, "format_usage"):
+                return f"The model pool is not enabled (backend: {getattr(pool, 'name', 'custom')}). Set `LLM_BACKEND=pool` to use several keys."
+            return pool.format_usage()
+
+        if len(parts) == 2 and parts[1].lower() == "prompts":
+            # Prompt tokens of !submit and !feedback, and how many came from cached prefixes
+            return format_prompt_usage()
+
+        if len(parts) == 2 and parts[1].lower() == "reload":
+            # New agent code, prompts and .env without reconnecting (see hot_reload.py)
+            from hot_reload import reload_agent, ReloadError
+            try:
+                modules, seconds = reload_agent(self)
+            except ReloadError as e:
+                return f"Reload failed, the previous code is still running: {e}"
+            return f"Reloaded {', '.join(modules)} and `.env` in {seconds * 1000:.0f} ms."
+
+        if len(parts) < 3 or parts[1].lower() != "profile":
+            return """
+**Debug Command Help**
+- `!debug profile [duration]` - Sample CPU and memory for a while (e.g. `60s`, `2m`), then post a report
+- `!debug profile [duration] pstats` - Same, but with cProfile (higher overhead, exact call counts)
+- `!debug profile stop` - Finish the running profile early
+- `!debug models` - Requests, 429s and tokens per API key and model in the model pool
+- `!debug prompts` - Prompt tokens per call of `!submit` and `!feedback`, and how many came from cache
+- `!debug reload` - Reload the agent code, prompts and `.env` without reconnecting
+"""
+
+        if parts[2].lower() == "stop":
+            if not self.profile_session:
+                return "No profile is running."
+            await self._finish_profile(message)
+            return None
+
+        if self.profile_session:
+            return "A profile is already running. Use `!debug profile stop` to finish it."
+
+        try:
+            duration = parse_duration(parts[2])
+        except ValueError:
+            return "Please give a duration like `60s` or `2m`."
+        if duration <= 0 or duration > MAX_PROFILE_SECONDS:
+            return f"Profile duration must be between 0 and {MAX_PROFILE_SECONDS} seconds."
+
+        mode = "pstats" if len(parts) > 3 and parts[3].lower() == "pstats" else "sample"
+        session = ProfileSession(duration, mode=mode)
+        session.start()
+        self.profile_session = session
+        session.timer = asyncio.get_running_loop().call_later(
+            duration, lambda: asyncio.ensure_future(self._finish_profile(message, session)))
+        return f"Profiling ({mode}) for {duration:g}s. The report will be posted to the admin channel."
+
+    async def _finish_profile(self, message: discord.Message, session=None):
+        """Stop the running profile and post its summary to the admin channel."""
+        if not self.profile_session or (session and session is not self.profile_session):
+            return
+        session = self.profile_session
+        self.profile_session = None
+        session.timer.cancel()
+
+        # cProfile has to be disabled on the loop thread; the snapshot and reports are written off it
+        session.halt()
+        summary, paths = await asyncio.to_thread(session.write_reports)
+        print(f"Profile written to {', '.join(paths)}")  # Debug log
+
+        channel = message.channel
+        if ADMIN_CHANNEL_ID and message.guild:
+            channel = message.guild.get_channel(ADMIN_CHANNEL_ID) or channel
+        for chunk in self.split_message(summary):
+            await channel.send(chunk)
+
     def split_message(self, message, limit=1900):
         """Split a message into chunks that fit within Discord's character limit."""
         if not message:
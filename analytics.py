@@ -0,0 +1,260 @@
+"""
+Columnar view of submission ratings for !stats.
+
+Every rated trend submission (hot and archived) becomes one row in a set of
+NumPy columns: the three ratings, the average, points, submission time, and
+integer codes for the user, the trend and the dominant color measured by
+palette.py (-1 when the submission predates color profiles). Summaries are vectorized over those
+columns instead of walking the nested dicts in trends.json. DataManager builds
+the index on first use and appends to it on every rate_submission.
+"""
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+
+
+class RatingsIndex:
+    FLOAT_COLUMNS = ("trend_accuracy", "creativity", "fit", "average")
+
+    def __init__(self, capacity=1024):
+        self._lock = threading.Lock()
+        self.size = 0
+        self._columns = {name: np.zeros(capacity, dtype=np.float32) for name in self.FLOAT_COLUMNS}
+        self._columns["points"] = np.zeros(capacity, dtype=np.int32)
+        self._columns["timestamp"] = np.zeros(capacity, dtype=np.float64)
+        self._columns["user"] = np.zeros(capacity, dtype=np.int32)
+        self._columns["trend"] = np.zeros(capacity, dtype=np.int32)
+        self._columns["color"] = np.full(capacity, -1, dtype=np.int32)
+        self._rows = {}  # submission id -> row
+        self.user_ids = []
+        self.usernames = []
+        self.trend_names = []
+        self.color_names = []
+        self._user_codes = {}
+        self._trend_codes = {}
+        self._color_codes = {}
+
+    @classmethod
+    def build(cls, submissions):
+        """Index many submissions at once (column-wise instead of one add() per row)."""
+        rated = [submission for submission in submissions if submission.ratings.average is not None]
+
+        index = cls(capacity=max(1024, len(rated)))
+        n = index.size = len(rated)
+        columns = index._columns
+        for name in cls.FLOAT_COLUMNS:
+            columns[name][:n] = [getattr(submission.ratings, name) or 0.0 for submission in rated]
+        columns["points"][:n] = [submission.ratings.points or 0 for submission in rated]
+        columns["timestamp"][:n] = [datetime.fromisoformat(submission.submission_date).timestamp()
+                                    for submission in rated]
+
+        users, trends, colors = [], [], []
+        for row, submission in enumerate(rated):
+            index._rows[submission.id] = row
+            user_id = str(submission.user_id)
+            user = index._code(index._user_codes, index.user_ids, user_id)
+            if user == len(index.usernames):
+                index.usernames.append(submission.username or user_id)
+            users.append(user)
+            trends.append(index._code(index._trend_codes, index.trend_names, submission.trend_id or ""))
+            colors.append(index._color(submission))
+        columns["user"][:n] = users
+        columns["trend"][:n] = trends
+        columns["color"][:n] = colors
+        return index
+
+    def _code(self, codes, names, key):
+        code = codes.get(key)
+        if code is None:
+            code = codes[key] = len(names)
+            names.append(key)
+        return code
+
+    def _color(self, submission):
+        """Code of the submission's dominant color, or -1 without a color profile."""
+        profile = submission.image_profile
+        if not profile or not profile.get("colors"):
+            return -1
+        return self._code(self._color_codes, self.color_names, profile["colors"][0]["name"])
+
+    def add(self, submission):
+        """Add (or update) a rated Submission record. Unrated submissions are ignored."""
+        ratings = submission.ratings
+        if ratings.average is None:
+            return
+
+        with self._lock:
+            row = self._rows.get(submission.id)
+            if row is None:
+                row = self.size
+                if row == len(self._columns["points"]):
+                    for name, column in self._columns.items():
+                        self._columns[name] = np.resize(column, len(column) * 2)
+                    self._columns["color"][row:] = -1
+                self._rows[submission.id] = row
+                self.size += 1
+
+            user_id = str(submission.user_id)
+            user = self._code(self._user_codes, self.user_ids, user_id)
+            if user == len(self.usernames):
+                self.usernames.append(submission.username or user_id)
+            else:
+                self.usernames[user] = submission.username or self.usernames[user]
+
+            columns = self._columns
+            for name in self.FLOAT_COLUMNS:
+                columns[name][row] = getattr(ratings, name) or 0.0
+            columns["points"][row] = ratings.points or 0
+            columns["timestamp"][row] = datetime.fromisoformat(submission.submission_date).timestamp()
+            columns["user"][row] = user
+            columns["trend"][row] = self._code(self._trend_codes, self.trend_names, submission.trend_id or "")
+            columns["color"][row] = self._color(submission)
+
+    def columns(self):
+        """
+        Views of the filled part of every column. Rows are only ever appended, and a
+        resize swaps in new arrays, so the views stay consistent while rows are added.
+        """
+        with self._lock:
+            return {name: column[:self.size] for name, column in self._columns.items()}
+
+    # QUERIES
+
+    def trend_summary(self, trend=None, limit=5):
+        """
+        Rating distribution per trend, most recently active trends first.
+
+        Returns:
+            list: dicts with the trend name, submission count, mean of each rating
+            and 25th/50th/90th percentiles of the average
+        """
+        columns = self.columns()
+        if not len(columns["trend"]):
+            return []
+
+        # Group rows by trend once: every trend's rows are a contiguous slice of `order`
+        trend_count = len(self.trend_names)
+        order = np.argsort(columns["trend"], kind="stable")
+        counts = np.bincount(columns["trend"], minlength=trend_count)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+        if trend is not None:
+            code = self._trend_codes.get(trend)
+            if code is None or code >= trend_count or not counts[code]:
+                return []
+            codes = [code]
+        else:
+            # Order trends by their latest submission
+            present = np.flatnonzero(counts)
+            latest = np.maximum.reduceat(columns["timestamp"][order], starts[present])
+            codes = [int(code) for code in present[np.argsort(-latest)][:limit]]
+
+        summaries = []
+        for code in codes:
+            rows = order[starts[code]:starts[code] + counts[code]]
+            averages = columns["average"][rows]
+            p25, p50, p90 = np.percentile(averages, [25, 50, 90])
+            summaries.append({
+                "trend": self.trend_names[code],
+                "count": int(counts[code]),
+                "trend_accuracy": float(columns["trend_accuracy"][rows].mean()),
+                "creativity": float(columns["creativity"][rows].mean()),
+                "fit": float(columns["fit"][rows].mean()),
+                "average": float(averages.mean()),
+                "p25": float(p25),
+                "p50": float(p50),
+                "p90": float(p90),
+            })
+        return summaries
+
+    def user_trajectory(self, user_id, limit=10):
+        """A user's most recent rated submissions in time order, with a running mean of the average."""
+        columns = self.columns()
+        code = self._user_codes.get(str(user_id))
+        if code is None:
+            return []
+
+        rows = np.flatnonzero(columns["user"] == code)
+        rows = rows[np.argsort(columns["timestamp"][rows], kind="stable")]
+        averages = columns["average"][rows]
+        running = np.cumsum(averages) / np.arange(1, len(rows) + 1)
+        return [
+            {
+                "date": datetime.fromtimestamp(columns["timestamp"][row]).strftime("%Y-%m-%d"),
+                "trend": self.trend_names[columns["trend"][row]],
+                "average": float(columns["average"][row]),
+                "running_average": float(running[i]),
+            }
+            for i, row in list(enumerate(rows))[-limit:]
+        ]
+
+    def leaderboard_deltas(self, days=7, limit=10):
+        """
+        Rank movement over the last `days` by points earned from ratings.
+
+        Returns:
+            list: dicts with username, points, points gained, rank now and rank
+            before the period (None if unranked then), for the current top `limit`
+        """
+        columns = self.columns()
+        if not len(columns["user"]):
+            return []
+
+        cutoff = (datetime.now() - timedelta(days=days)).timestamp()
+        user_count = len(self.user_ids)
+        points = columns["points"].astype(np.int64)
+        now = np.bincount(columns["user"], weights=points, minlength=user_count)
+        before_mask = columns["timestamp"] < cutoff
+        before = np.bincount(columns["user"][before_mask], weights=points[before_mask], minlength=user_count)
+
+        def ranks(totals):
+            order = np.argsort(-totals, kind="stable")
+            result = np.empty(user_count, dtype=np.int64)
+            result[order] = np.arange(1, user_count + 1)
+            return result
+
+        rank_now, rank_before = ranks(now), ranks(before)
+        top = np.argsort(-now, kind="stable")[:limit]
+        return [
+            {
+                "username": self.usernames[code],
+                "points": int(now[code]),
+                "gained": int(now[code] - before[code]),
+                "rank": int(rank_now[code]),
+                "previous_rank": int(rank_before[code]) if before[code] > 0 else None,
+            }
+            for code in top
+        ]
+
+    def color_summary(self, trend=None, limit=8):
+        """
+        Dominant colors of rated submissions (in one trend, or overall), most common first.
+
+        Returns:
+            list: dicts with the color name, submission count, share of profiled
+            submissions and mean average rating
+        """
+        columns = self.columns()
+        mask = columns["color"] >= 0
+        if trend is not None:
+            code = self._trend_codes.get(trend)
+            if code is None:
+                return []
+            mask &= columns["trend"] == code
+        colors = columns["color"][mask]
+        if not len(colors):
+            return []
+
+        counts = np.bincount(colors, minlength=len(self.color_names))
+        totals = np.bincount(colors, weights=columns["average"][mask], minlength=len(self.color_names))
+        return [
+            {
+                "color": self.color_names[code],
+                "count": int(counts[code]),
+                "share": float(counts[code] / len(colors)),
+                "average": float(totals[code] / counts[code]),
+            }
+            for code in np.argsort(-counts, kind="stable")[:limit]
+            if counts[code]
+        ]
@@ -0,0 +1,162 @@
+"""
+Cold storage for old trends, competitions and submissions.
+
+The hot files (trends.json, competitions.json) only keep the current trend's
+submissions and the most recent past trends and competitions. Everything older
+is moved here, into immutable gzip-compressed segment files under
+<data folder>/archive/. A small manifest.json lists every segment with the
+names it holds and the users who have submissions in it, so lookups only open
+the segments they need. Segments are decoded on demand and a few recently used
+ones are kept in memory.
+
+Callers must hold the owning DataManager's store lock while appending.
+"""
+import os
+import gzip
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+import records
+from records import Submission, CompetitionEntry, encode_table, decode_table
+from metrics import storage
+
+
+class Archive:
+    def __init__(self, folder, max_cached_segments=4):
+        """
+        Args:
+            folder (str): Folder holding the manifest and segment files
+            max_cached_segments (int): Decoded segments kept in memory
+        """
+        self.folder = folder
+        self.manifest_file = os.path.join(folder, "manifest.json")
+        self.max_cached_segments = max_cached_segments
+        self._segments = OrderedDict()
+        self._manifest = None
+        self._manifest_stamp = None
+        self._cache_lock = threading.Lock()
+
+    # MANIFEST
+
+    def manifest(self):
+        """Return the manifest, re-reading it only if another writer changed it."""
+        try:
+            stat = os.stat(self.manifest_file)
+        except FileNotFoundError:
+            return {"segments": []}
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp != self._manifest_stamp:
+            with open(self.manifest_file, "rb") as f:
+                self._manifest = records.loads(f.read())
+            self._manifest_stamp = stamp
+        return self._manifest
+
+    def _save_manifest(self, manifest):
+        tmp_path = f"{self.manifest_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(records.dumps(manifest))
+        os.replace(tmp_path, self.manifest_file)
+
+    # WRITING
+
+    def append(self, kind, entries, submissions=None):
+        """
+        Write one new segment.
+
+        Args:
+            kind (str): "trends" or "competitions"
+            entries (list): Trend or competition dicts, oldest first
+            submissions (dict, optional): submission id -> Submission for trends
+
+        Returns:
+            str: The segment file name, or None if there was nothing to archive
+        """
+        submissions = submissions or {}
+        if not entries and not submissions:
+            return None
+
+        os.makedirs(self.folder, exist_ok=True)
+        manifest = self.manifest()
+        file_name = f"{kind}-{len(manifest['segments']) + 1:06d}.json.gz"
+
+        if kind == "competitions":
+            payload = {"entries": [self._encode_competition(entry) for entry in entries]}
+            users = sorted({user_id for entry in entries for user_id in entry.get("submissions", {})})
+        else:
+            payload = {"entries": entries, "submissions": encode_table(submissions, Submission)}
+            users = sorted({str(submission["user_id"]) for submission in submissions.values()})
+
+        path = os.path.join(self.folder, file_name)
+        with storage("archive", kind):
+            with open(path + ".tmp", "wb") as f:
+                f.write(gzip.compress(records.dumps(payload)))
+            os.replace(path + ".tmp", path)
+
+        segments = manifest["segments"] + [{
+            "file": file_name,
+            "kind": kind,
+            "created": datetime.now().isoformat(),
+            "names": [entry.get("name") for entry in entries],
+            "users": users,
+        }]
+        self._save_manifest({**manifest, "segments": segments})
+        return file_name
+
+    @staticmethod
+    def _encode_competition(competition):
+        return {**competition, "submissions": encode_table(
+            competition.get("submissions", {}), CompetitionEntry, many=True)}
+
+    # READING
+
+    def load_segment(self, file_name):
+        """Decode one segment (cached). Trend segments also carry their submissions."""
+        with self._cache_lock:
+            segment = self._segments.get(file_name)
+            if segment is not None:
+                self._segments.move_to_end(file_name)
+                return segment
+
+        with storage("load", "archive"):
+            with open(os.path.join(self.folder, file_name), "rb") as f:
+                segment = records.loads(gzip.decompress(f.read()))
+        if "submissions" in segment:
+            segment["submissions"] = decode_table(segment["submissions"], Submission)
+        for entry in segment["entries"]:
+            if "submissions" in entry:
+                entry["submissions"] = decode_table(entry["submissions"], CompetitionEntry, many=True)
+
+        with self._cache_lock:
+            self._segments[file_name] = segment
+            if len(self._segments) > self.max_cached_segments:
+                self._segments.popitem(last=False)
+        return segment
+
+    def _segments_newest_first(self, kind, user_id=None):
+        for info in reversed(self.manifest()["segments"]):
+            if info["kind"] != kind:
+                continue
+            if user_id is not None and str(user_id) not in info["users"]:
+                continue
+            yield info["file"]
+
+    def past_entries(self, kind, limit=None):
+        """Archived trends or competitions, most recent first."""
+        found = []
+        for file_name in self._segments_newest_first(kind):
+            found.extend(reversed(self.load_segment(file_name)["entries"]))
+            if limit is not None and len(found) >= limit:
+                return found[:limit]
+        return found
+
+    def user_submissions(self, user_id, limit):
+        """A user's archived trend submissions, newest first. Only opens segments that list the user."""
+        found = []
+        for file_name in self._segments_newest_first("trends", user_id):
+            submissions = self.load_segment(file_name)["submissions"].values()
+            found.extend(sub for sub in submissions if str(sub.get("user_id")) == str(user_id))
+            if len(found) >= limit:
+                break
+        found.sort(key=lambda x: x.get("submission_date", ""), reverse=True)
+        return found[:limit]
@@ -0,0 +1,414 @@
+"""
+Offline benchmark suite for agent commands and DataManager at scale.
+
+Builds synthetic data stores (users, trend submissions, competition entries and
+chat history), drives MistralAgent with fake Discord objects and the fake model
+backend, and reports per-command latency percentiles, throughput under
+concurrency and memory high-water marks. Results are written as JSON so runs
+from different releases can be compared.
+
+Usage:
+    python benchmark.py --sizes 1k,100k,1m --iterations 50 --concurrency 1,8,32
+    python benchmark.py --sizes 1k --label my-branch --compare benchmark_results/v0.1.json
+"""
+import os
+import io
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import tracemalloc
+import contextlib
+import subprocess
+from datetime import datetime, timedelta
+
+from fakes import FakeUser, FakeGuild, FakeAttachment, FakeMessage, FakeHTTPResponse, make_test_image
+
+
+COMMANDS = ["submit", "leaderboard", "vote", "points", "run", "feedback", "stats"]
+DATA_MANAGER_OPS = ["get_leaderboard", "get_user", "add_points", "get_outfit_submissions_history",
+                    "add_to_chat_history", "vote_for_submission"]
+
+
+def parse_size(text):
+    """Parse '1k', '100k', '1m' or a plain integer."""
+    text = text.strip().lower()
+    multiplier = 1
+    if text.endswith("k"):
+        multiplier, text = 1_000, text[:-1]
+    elif text.endswith("m"):
+        multiplier, text = 1_000_000, text[:-1]
+    return int(float(text) * multiplier)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def summarize_latencies(latencies):
+    values = sorted(latencies)
+    return {
+        "n": len(values),
+        "mean_ms": sum(values) / len(values) * 1000 if values else 0.0,
+        "p50_ms": percentile(values, 50) * 1000,
+        "p90_ms": percentile(values, 90) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+        "max_ms": values[-1] * 1000 if values else 0.0,
+    }
+
+
+def max_rss_bytes():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS reports bytes
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def user_id_for(index):
+    return 10_000_000_000 + index
+
+
+def generate_store(folder, n_users, n_submissions, analysis_bytes=400, seed=0):
+    """
+    Write a synthetic data store in the same layout DataManager uses.
+
+    Every user gets points, a trend submission (round-robin until n_submissions),
+    a competition entry and a couple of chat turns.
+    """
+    rng = random.Random(seed)
+    os.makedirs(folder, exist_ok=True)
+    start = datetime(2025, 1, 1)
+    filler = ("Neutral tones with a structured blazer and wide-leg trousers. " * 20)[:analysis_bytes]
+
+    users = {}
+    for i in range(n_users):
+        users[str(user_id_for(i))] = {
+            "username": f"user{i}",
+            "points": rng.randint(0, 5000),
+            "participations": rng.randint(0, 50),
+            "wins": rng.randint(0, 3),
+        }
+
+    submissions = {}
+    for j in range(n_submissions):
+        uid = user_id_for(j % max(1, n_users))
+        when = start + timedelta(seconds=j)
+        sid = f"{uid}_{when.strftime('%Y%m%d%H%M%S')}"
+        ta, cr, fit = rng.randint(1, 10), rng.randint(1, 10), rng.randint(1, 10)
+        average = (ta + cr + fit) / 3
+        submissions[sid] = {
+            "id": sid,
+            "user_id": uid,
+            "username": f"user{j % max(1, n_users)}",
+            "trend_id": "Benchmark Trend",
+            "image_url": f"https://cdn.example.invalid/{sid}.jpg",
+            "submission_date": when.isoformat(),
+            "ratings": {"trend_accuracy": ta, "creativity": cr, "fit": fit,
+                        "average": average, "points": int(average * 10)},
+            "analysis_text": f"Trend Accuracy: {ta}/10\nCreativity: {cr}/10\nOverall Fit: {fit}/10\n{filler}",
+        }
+
+    trends = {
+        "active_trend": {
+            "name": "Benchmark Trend",
+            "description": "Synthetic trend used for benchmarking.",
+            "start_date": start.isoformat(),
+            "end_date": start.isoformat(),
+            "duration_days": 7,
+            "participants": [user_id_for(i) for i in range(min(n_users, n_submissions))],
+        },
+        "past_trends": [],
+        "submissions": submissions,
+    }
+
+    competition_submissions = {}
+    for i in range(n_users):
+        uid = str(user_id_for(i))
+        competition_submissions[uid] = [{
+            "user_id": uid,
+            "username": f"user{i}",
+            "image_url": f"https://cdn.example.invalid/comp_{uid}.jpg",
+            "description": "Benchmark entry",
+            "timestamp": start.isoformat(),
+            "votes": 0,
+        }]
+    competitions = {
+        "active_competition": {
+            "name": "Benchmark Competition",
+            "description": "Synthetic competition used for benchmarking.",
+            "sponsor": "StyleCo",
+            "start_date": start.isoformat(),
+            "end_date": start.isoformat(),
+            "duration_days": 7,
+            "participants": [user_id_for(i) for i in range(n_users)],
+            "submissions": competition_submissions,
+        },
+        "past_competitions": [],
+        "votes": {},
+    }
+
+    chat = {"user_histories": {}}
+    for i in range(n_users):
+        chat["user_histories"][str(user_id_for(i))] = [{
+            "timestamp": start.isoformat(),
+            "user_message": "what should I wear tonight?",
+            "ai_response": filler,
+            "submission_id": None,
+        }]
+
+    for name, data in (("users.json", {"users": users}), ("trends.json", trends),
+                       ("competitions.json", competitions), ("chat_history.json", chat)):
+        with open(os.path.join(folder, name), "w") as f:
+            json.dump(data, f, indent=4)
+
+
+class Harness:
+    """Holds one agent wired to a synthetic store and builds messages for it."""
+
+    def __init__(self, folder, n_users, latency, image_bytes):
+        from agent import MistralAgent
+        from data_manager import DataManager
+        from llm_backends import FakeBackend
+
+        self.n_users = n_users
+        self.guild = FakeGuild(guild_id=1, name="Benchmark Guild")
+        for i in range(n_users):
+            self.guild.add_member(FakeUser(user_id_for(i), f"user{i}"))
+
+        self.agent = MistralAgent(
+            text_model=FakeBackend(latency=latency, seed=1),
+            vision_model=FakeBackend(latency=latency, seed=2),
+            data_manager=DataManager(folder),
+        )
+        # Serve attachments from memory instead of the Discord CDN
+        self.agent.download_image = lambda url: FakeHTTPResponse(image_bytes)
+        self.image_bytes = image_bytes
+        self._voters = 0
+
+    def _author(self, rng):
+        index = rng.randrange(max(1, self.n_users))
+        return FakeUser(user_id_for(index), f"user{index}")
+
+    def message_for(self, command, rng):
+        author = self._author(rng)
+        if command == "submit":
+            attachment = FakeAttachment(f"https://cdn.example.invalid/{rng.random()}.jpg", self.image_bytes)
+            return FakeMessage("!submit", author, guild=self.guild, attachments=[attachment])
+        if command == "leaderboard":
+            return FakeMessage("!leaderboard", author, guild=self.guild)
+        if command == "points":
+            return FakeMessage("!points", author, guild=self.guild)
+        if command == "feedback":
+            return FakeMessage("!feedback how can I improve the colours?", author, guild=self.guild)
+        if command == "vote":
+            # Fresh voter each time so every vote is accepted and written
+            self._voters += 1
+            voter = FakeUser(user_id_for(self.n_users + self._voters), f"voter{self._voters}")
+            target = rng.randrange(max(1, self.n_users))
+            return FakeMessage(f"!vote user{target}", voter, guild=self.guild)
+        if command == "run":
+            return FakeMessage("what shoes go with wide-leg trousers?", author, guild=self.guild)
+        if command == "stats":
+            return FakeMessage(rng.choice(["!stats", "!stats me", "!stats movers"]), author, guild=self.guild)
+        raise ValueError(f"Unknown command '{command}'")
+
+    async def execute(self, command, rng):
+        message = self.message_for(command, rng)
+        if command == "run":
+            return await self.agent.run(message)
+        return await self.agent.process_command(message)
+
+    def data_manager_call(self, op, rng):
+        dm = self.agent.data_manager
+        uid = user_id_for(rng.randrange(max(1, self.n_users)))
+        if op == "get_leaderboard":
+            return dm.get_leaderboard(10)
+        if op == "get_user":
+            return dm.get_user(uid)
+        if op == "add_points":
+            return dm.add_points(uid, 10)
+        if op == "get_outfit_submissions_history":
+            return dm.get_outfit_submissions_history(uid)
+        if op == "add_to_chat_history":
+            return dm.add_to_chat_history(uid, "benchmark", "benchmark reply")
+        if op == "vote_for_submission":
+            self._voters += 1
+            return dm.vote_for_submission(user_id_for(self.n_users + self._voters), uid)
+        raise ValueError(f"Unknown DataManager op '{op}'")
+
+
+async def measure_command(harness, command, iterations, concurrency_levels, memory_iterations, seed):
+    rng = random.Random(seed)
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await harness.execute(command, rng)
+        latencies.append(time.perf_counter() - start)
+
+    throughput = {}
+    for concurrency in concurrency_levels:
+        total = max(concurrency, iterations)
+
+        async def worker(count):
+            for _ in range(count):
+                await harness.execute(command, rng)
+
+        per_worker = [total // concurrency + (1 if i < total % concurrency else 0) for i in range(concurrency)]
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(count) for count in per_worker))
+        elapsed = time.perf_counter() - start
+        throughput[str(concurrency)] = total / elapsed if elapsed else float("inf")
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    for _ in range(memory_iterations):
+        await harness.execute(command, rng)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "latency": summarize_latencies(latencies),
+        "throughput_ops_per_s": throughput,
+        "peak_traced_bytes": peak,
+    }
+
+
+def measure_data_manager(harness, op, iterations, memory_iterations, seed):
+    rng = random.Random(seed)
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        harness.data_manager_call(op, rng)
+        latencies.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    for _ in range(memory_iterations):
+        harness.data_manager_call(op, rng)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"latency": summarize_latencies(latencies), "peak_traced_bytes": peak}
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(old, new):
+    """Print p50/p99 deltas for every (size, command) present in both runs."""
+    print(f"\nComparison: {old['meta'].get('label')} -> {new['meta'].get('label')}")
+    for size, commands in new["results"].items():
+        old_commands = old["results"].get(size, {})
+        for name, result in commands.items():
+            if name not in old_commands:
+                continue
+            for key in ("p50_ms", "p99_ms"):
+                before = old_commands[name]["latency"][key]
+                after = result["latency"][key]
+                change = (after - before) / before * 100 if before else 0.0
+                print(f"  {size:>8} {name:<34} {key:<7} {before:10.2f} -> {after:10.2f} ({change:+.1f}%)")
+
+
+def print_report(size_label, results):
+    print(f"\n=== {size_label} ===")
+    print(f"  {'command':<34} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'peak MB':>9}  throughput (ops/s by concurrency)")
+    for name, result in results.items():
+        latency = result["latency"]
+        throughput = result.get("throughput_ops_per_s", {})
+        throughput_text = ", ".join(f"{c}: {ops:.1f}" for c, ops in throughput.items())
+        print(f"  {name:<34} {latency['p50_ms']:9.2f} {latency['p90_ms']:9.2f} {latency['p99_ms']:9.2f} "
+              f"{result['peak_traced_bytes'] / 1e6:9.2f}  {throughput_text}")
+
+
+async def run_benchmarks(args):
+    sizes = [s for s in args.sizes.split(",") if s.strip()]
+    concurrency_levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    commands = [c for c in args.commands.split(",") if c.strip()]
+    image_bytes = make_test_image()
+
+    report = {
+        "meta": {
+            "label": args.label,
+            "git_revision": git_revision(),
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "iterations": args.iterations,
+            "concurrency": concurrency_levels,
+            "fake_latency": args.latency,
+        },
+        "results": {},
+    }
+
+    for size_label in sizes:
+        n_users = parse_size(size_label)
+        folder = os.path.join(args.work_dir, size_label)
+        print(f"Generating store with {n_users} users/submissions in {folder}...")
+        start = time.perf_counter()
+        generate_store(folder, n_users, n_users, analysis_bytes=args.analysis_bytes)
+        print(f"  generated in {time.perf_counter() - start:.1f}s")
+
+        harness = Harness(folder, n_users, args.latency, image_bytes)
+        results = {}
+        # The agent prints debug lines on every call; keep them out of the report
+        with contextlib.redirect_stdout(io.StringIO()) if not args.verbose else contextlib.nullcontext():
+            for index, command in enumerate(commands):
+                results[f"!{command}" if command != "run" else "run()"] = await measure_command(
+                    harness, command, args.iterations, concurrency_levels, args.memory_iterations, seed=index)
+            for index, op in enumerate(DATA_MANAGER_OPS):
+                results[f"DataManager.{op}"] = measure_data_manager(
+                    harness, op, args.iterations, args.memory_iterations, seed=100 + index)
+
+        report["results"][size_label] = results
+        print_report(size_label, results)
+
+    report["meta"]["max_rss_bytes"] = max_rss_bytes()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark FashionBot commands against synthetic data stores.")
+    parser.add_argument("--sizes", default="1k,100k,1m", help="Comma-separated store sizes (users and submissions)")
+    parser.add_argument("--commands", default=",".join(COMMANDS), help="Comma-separated commands to measure")
+    parser.add_argument("--iterations", type=int, default=50, help="Sequential calls per command for latency")
+    parser.add_argument("--memory-iterations", type=int, default=5, help="Calls traced for memory high-water")
+    parser.add_argument("--concurrency", default="1,8,32", help="Concurrency levels for throughput")
+    parser.add_argument("--latency", default="fixed:0", help="Fake model latency spec (see llm_backends)")
+    parser.add_argument("--analysis-bytes", type=int, default=400, help="Size of synthetic analysis_text")
+    parser.add_argument("--work-dir", default=os.path.join("bench_data"), help="Where synthetic stores are written")
+    parser.add_argument("--output-dir", default="benchmark_results", help="Where JSON results are saved")
+    parser.add_argument("--label", default=None, help="Name for this run (defaults to git revision)")
+    parser.add_argument("--compare", default=None, help="Previous results JSON to compare against")
+    parser.add_argument("--verbose", action="store_true", help="Show the agent's debug output")
+    args = parser.parse_args(argv)
+    args.label = args.label or git_revision() or "local"
+
+    report = asyncio.run(run_benchmarks(args))
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_path = os.path.join(args.output_dir, f"{args.label}-{datetime.now().strftime('%Y%m%d%H%M%S')}.json")
+    with open(output_path, "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"\nResults saved to {output_path}")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            compare_results(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Content-addressed, compressed storage for large text payloads.
+
+Outfit analyses and AI responses are the bulk of trends.json and
+chat_history.json, and they were rewritten on every save of those files. With
+the blob store, a record only holds a reference ("blob:<sha256>") and the text
+lives under <data folder>/blobs/ as zlib-compressed objects named by their hash.
+Inline text that starts like a reference (a user can type "blob:...") is stored
+with ESCAPE_PREFIX in front, so it is never looked up in the store.
+
+Text is split into paragraphs, and each longer paragraph is stored as its own
+object. A stored text is an index object listing its paragraphs. Identical
+content is therefore stored once, even when it appears inside a larger text. For
+example, the !submit reply saved in chat history embeds the analysis that is
+already stored for the submission.
+"""
+import os
+import re
+import json
+import zlib
+import hashlib
+import threading
+from collections import OrderedDict
+
+from metrics import storage
+
+
+REF_PREFIX = "blob:"
+_REF_PATTERN = re.compile(r"^blob:[0-9a-f]{64}$")
+# Marks inline text starting with REF_PREFIX ("=" is never part of a digest)
+ESCAPE_PREFIX = "blob:="
+
+# Paragraphs shorter than this stay inline in the index object
+CHUNK_MIN_CHARS = 128
+
+_TEXT = b"T"
+_INDEX = b"I"
+
+
+def is_ref(value):
+    return isinstance(value, str) and _REF_PATTERN.match(value) is not None
+
+
+def escape(text):
+    """Stored form of text kept inline."""
+    if isinstance(text, str) and text.startswith(REF_PREFIX):
+        return ESCAPE_PREFIX + text
+    return text
+
+
+class BlobStore:
+    def __init__(self, folder, min_chars=512, max_cached=256):
+        """
+        Args:
+            folder (str): Folder holding the blob objects
+            min_chars (int): Texts shorter than this stay inline in their record
+            max_cached (int): Resolved texts kept in memory
+        """
+        self.folder = folder
+        self.min_chars = min_chars
+        self.max_cached = max_cached
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def _path(self, digest):
+        return os.path.join(self.folder, digest[:2], digest)
+
+    def _write_object(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(zlib.compress(data))
+            os.replace(tmp_path, path)
+        return digest
+
+    def _read_object(self, digest):
+        with open(self._path(digest), "rb") as f:
+            return zlib.decompress(f.read())
+
+    # TEXT
+
+    def put(self, text):
+        """Store text and return its reference."""
+        parts = []
+        with storage("save", "blobs"):
+            for paragraph in text.split("\n\n"):
+                if len(paragraph) >= CHUNK_MIN_CHARS:
+                    parts.append({"ref": self._write_object(_TEXT + paragraph.encode("utf-8"))})
+                else:
+                    parts.append(paragraph)
+            digest = self._write_object(_INDEX + json.dumps(parts, separators=(",", ":")).encode("utf-8"))
+        ref = REF_PREFIX + digest
+        self._remember(ref, text)
+        return ref
+
+    def get(self, ref):
+        """Return the text for a reference."""
+        with self._cache_lock:
+            text = self._cache.get(ref)
+            if text is not None:
+                self._cache.move_to_end(ref)
+                return text
+
+        with storage("load", "blobs"):
+            parts = json.loads(self._read_object(ref[len(REF_PREFIX):])[1:])
+            text = "\n\n".join(
+                part if isinstance(part, str) else self._read_object(part["ref"])[1:].decode("utf-8")
+                for part in parts
+            )
+        self._remember(ref, text)
+        return text
+
+    def _remember(self, ref, text):
+        with self._cache_lock:
+            self._cache[ref] = text
+            self._cache.move_to_end(ref)
+            if len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+
+    def store_large(self, text):
+        """Stored form of text: a reference for texts of at least `min_chars`, else the (escaped) text."""
+        if isinstance(text, str) and len(text) >= self.min_chars:
+            return self.put(text)
+        return escape(text)
+
+    def resolve(self, value):
+        """Text for a stored value (a reference or escaped inline text); any other value is returned as is."""
+        if is_ref(value):
+            try:
+                return self.get(value)
+            except FileNotFoundError:
+                # Written before inline text was escaped: a message that only looks like a reference
+                return value
+        if isinstance(value, str) and value.startswith(ESCAPE_PREFIX):
+            return value[len(ESCAPE_PREFIX):]
+        return value
+
+    # MAINTENANCE
+
+    def sweep(self, live_refs):
+        """
+        Delete objects not reachable from `live_refs`.
+
+        Callers must hold the store lock so no put() is in flight.
+
+        Returns:
+            int: Number of objects removed
+        """
+        live = set()
+        for ref in live_refs:
+            digest = ref[len(REF_PREFIX):]
+            try:
+                parts = json.loads(self._read_object(digest)[1:])
+            except FileNotFoundError:
+                continue
+            live.add(digest)
+            live.update(part["ref"] for part in parts if not isinstance(part, str))
+
+        removed = 0
+        if not os.path.isdir(self.folder):
+            return removed
+        for prefix in os.listdir(self.folder):
+            prefix_folder = os.path.join(self.folder, prefix)
+            for name in os.listdir(prefix_folder):
+                if name not in live and not name.endswith(".tmp"):
+                    os.remove(os.path.join(prefix_folder, name))
+                    removed += 1
+        return removed
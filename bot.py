@@ -1,30 +1,113 @@
+import time
+
+# Reference point for the startup timing report
+STARTUP_STARTED = time.perf_counter()
+
 import os
+import json
+import queue
+import signal
+import asyncio
 import discord
 import logging
+import logging.handlers
+from datetime import datetime
 
 from discord.ext import commands
 from dotenv import load_dotenv
 from agent import MistralAgent
+from metrics import trace_message, stage, start_metrics_server
+from username_sync import UsernameSync
+from hot_reload import reload_agent, ReloadError
+from vote_tally import VOTE_EMOJI
 
 PREFIX = "!"
 
+# Seconds since process start at which each startup milestone was reached
+startup_timings = {"imports": time.perf_counter() - STARTUP_STARTED}
+
 # Setup logging
 logger = logging.getLogger("discord")
-handler = logging.FileHandler(filename="discord.log", encoding="utf-8", mode="w")
-handler.setFormatter(logging.Formatter("%(asctime)s:%(levelname)s:%(name)s: %(message)s"))
-logger.addHandler(handler)
 logger.setLevel(logging.INFO)
 
+
+def setup_logging():
+    """Send bot logs to discord.log. Only done when running the bot, so importing this
+    module (e.g. from replay.py) doesn't truncate an existing log."""
+    handler = logging.FileHandler(filename="discord.log", encoding="utf-8", mode="w")
+    handler.setFormatter(logging.Formatter("%(asctime)s:%(levelname)s:%(name)s: %(message)s"))
+    logger.addHandler(handler)
+
+
+# Captured messages go through a queue; a QueueListener thread appends them to the file
+capture_logger = logging.getLogger("fashionbot.capture")
+capture_logger.setLevel(logging.INFO)
+capture_logger.propagate = False
+
+
+def setup_traffic_capture(path):
+    """
+    Start writing captured messages to `path` (JSONL, appended) from a background thread.
+
+    Returns:
+        logging.handlers.QueueListener: Stop it on shutdown to write what is still queued
+    """
+    records = queue.SimpleQueue()
+    handler = logging.FileHandler(filename=path, encoding="utf-8", mode="a")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    listener = logging.handlers.QueueListener(records, handler)
+    capture_logger.addHandler(logging.handlers.QueueHandler(records))
+    listener.start()
+    return listener
+
+
 # Load the environment variables
 load_dotenv()
 
+# Optional JSONL capture of incoming traffic for replay.py
+TRAFFIC_CAPTURE_FILE = os.getenv("TRAFFIC_CAPTURE_FILE")
+
+# Local Prometheus/traces endpoint (disabled unless a port is set)
+METRICS_PORT = os.getenv("METRICS_PORT")
+
+# Commands that get their own metrics label; anything else is "other"
+AGENT_COMMANDS = {"!trend", "!submit", "!leaderboard", "!points", "!competition", "!vote", "!help", "!feedback",
+                  "!stats", "!similar", "!debug"}
+
 # Create the bot with all intents
 # The message content and members intent must be enabled in the Discord Developer Portal for the bot to work.
 intents = discord.Intents.all()
-bot = commands.Bot(command_prefix=PREFIX, intents=intents)
+
+# Sharding: SHARD_COUNT switches to AutoShardedBot. SHARD_IDS (e.g. "0,1") runs only
+# those shards in this process; other processes run the rest against the same data
+# folder, so storage switches to cross-process locking.
+SHARD_COUNT = os.getenv("SHARD_COUNT")
+SHARD_IDS = [int(shard) for shard in os.getenv("SHARD_IDS", "").split(",") if shard.strip()]
+if SHARD_COUNT:
+    bot = commands.AutoShardedBot(
+        command_prefix=PREFIX,
+        intents=intents,
+        shard_count=int(SHARD_COUNT),
+        shard_ids=SHARD_IDS or None,
+    )
+    if SHARD_IDS:
+        os.environ.setdefault("DATA_PROCESS_SAFE", "1")
+else:
+    bot = commands.Bot(command_prefix=PREFIX, intents=intents)
 
 # Import the Mistral agent from the agent.py file
+# (cheap: model backends and image libraries are loaded by warm_up_agent after connecting)
 agent = MistralAgent()
+startup_timings["agent"] = time.perf_counter() - STARTUP_STARTED
+
+# Keeps stored usernames current from member/user update events, one per guild store
+username_syncs = {}
+
+
+def username_sync_for(guild):
+    if guild.id not in username_syncs:
+        username_syncs[guild.id] = UsernameSync(agent.data_managers.get(guild.id))
+    return username_syncs[guild.id]
 
 # Get the token from the environment variables
 token = os.getenv("DISCORD_TOKEN")
@@ -39,10 +122,19 @@ async def on_ready():
     https://discordpy.readthedocs.io/en/latest/api.html#discord.on_ready
     """
     logger.info(f"{bot.user} has connected to Discord!")
+    startup_timings.setdefault("connected", time.perf_counter() - STARTUP_STARTED)
     
-    # Update usernames in the database
+    # Keep usernames in the database current. Only starts once; reconnects reuse the
+    # running flusher, and the reconcile resumes/skips based on its saved progress.
     for guild in bot.guilds:
-        agent.data_manager.update_usernames_in_database(guild)
+        username_sync_for(guild).start([guild])
+    
+    # Close trends and competitions at their deadlines (also those that passed while offline)
+    if not agent.scheduler.started:
+        await agent.start_scheduler(bot, [None] + [guild.id for guild in bot.guilds])
+        # `kill -HUP <pid>` reloads the agent after a deploy, keeping the gateway session
+        if hasattr(signal, "SIGHUP"):
+            asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, reload_on_signal)
     
     # Set up a custom status for the bot
     await bot.change_presence(activity=discord.Activity(
@@ -52,6 +144,100 @@ async def on_ready():
     
     print(f"FashionBot is ready! Logged in as {bot.user}")
 
+    # on_ready fires again after every reconnect; only warm up once
+    if not agent.warmed_up and "ready" not in startup_timings:
+        startup_timings["ready"] = time.perf_counter() - STARTUP_STARTED
+        asyncio.create_task(warm_up_agent())
+
+
+async def warm_up_agent():
+    """Load the model SDK and image libraries in a worker thread, then log startup timings."""
+    try:
+        steps = await asyncio.to_thread(agent.warm_up)
+    except Exception as e:
+        logger.error(f"Warm-up failed, models will be initialized on first use: {e}")
+        return
+    startup_timings["warm"] = time.perf_counter() - STARTUP_STARTED
+    details = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in steps.items())
+    logger.info(f"Startup timing: {format_startup_timings()} (warm-up: {details})")
+
+
+def reload_on_signal():
+    try:
+        modules, seconds = reload_agent(agent)
+    except ReloadError as e:
+        logger.error(f"Hot reload failed, the previous code is still running: {e}")
+        return
+    logger.info(f"Hot reload of {', '.join(modules)} took {seconds * 1000:.0f} ms")
+
+
+def format_startup_timings():
+    return ", ".join(f"{name} at {seconds:.2f}s" for name, seconds in startup_timings.items())
+
+
+@bot.event
+async def on_member_update(before: discord.Member, after: discord.Member):
+    username_sync_for(after.guild).note_rename(before, after)
+
+
+@bot.event
+async def on_user_update(before: discord.User, after: discord.User):
+    # User-level renames apply to every guild store the user is a member of
+    for guild in bot.guilds:
+        if guild.get_member(after.id):
+            username_sync_for(guild).note_rename(before, after)
+
+
+@bot.event
+async def on_raw_reaction_add(payload: discord.RawReactionActionEvent):
+    await handle_vote_reaction(payload, added=True)
+
+
+@bot.event
+async def on_raw_reaction_remove(payload: discord.RawReactionActionEvent):
+    await handle_vote_reaction(payload, added=False)
+
+
+async def handle_vote_reaction(payload: discord.RawReactionActionEvent, added):
+    """Forward vote reactions to the agent's in-memory tally (raw events also cover uncached messages)."""
+    if payload.guild_id is None or str(payload.emoji) != VOTE_EMOJI:
+        return
+    if payload.user_id == bot.user.id or (payload.member is not None and payload.member.bot):
+        return
+    await agent.handle_vote_reaction(payload.guild_id, payload.message_id, payload.user_id, added)
+
+
+def capture_message(message: discord.Message):
+    """Queue a message for TRAFFIC_CAPTURE_FILE in the format replay.py reads. Nothing is written on the event loop."""
+    record = {
+        "timestamp": datetime.now().isoformat(),
+        "message_id": message.id,
+        "author_id": message.author.id,
+        "author": message.author.name,
+        "guild_id": message.guild.id if message.guild else None,
+        "channel_id": message.channel.id,
+        "content": message.content,
+        "attachments": [
+            {"size": attachment.size, "content_type": attachment.content_type}
+            for attachment in message.attachments
+        ],
+    }
+    capture_logger.info(json.dumps(record))
+
+
+def record_first_reply():
+    if "first_reply" not in startup_timings:
+        startup_timings["first_reply"] = time.perf_counter() - STARTUP_STARTED
+        logger.info(f"First reply sent. Startup timing: {format_startup_timings()}")
+
+
+def command_label(content):
+    """Bounded metrics label for a message: its command, "other" or "chat"."""
+    if not content.startswith("!"):
+        return "chat"
+    command = content.split()[0].lower() if content.split() else "!"
+    return command if command in AGENT_COMMANDS else "other"
+
 
 @bot.event
 async def on_message(message: discord.Message):
@@ -63,24 +249,32 @@ async def on_message(message: discord.Message):
     # Ignore messages from self or other bots to prevent infinite loops.
     if message.author.bot:
         return
+
+    if TRAFFIC_CAPTURE_FILE:
+        capture_message(message)
     
-    # Process fashionbot commands through the agent if it starts with !
-    if message.content.startswith("!"):
-        logger.info(f"Processing command from {message.author}: {message.content}")
-        agent_response = await agent.process_command(message)
-        if agent_response:
-            await message.reply(agent_response)
-        return
+    with trace_message(message.id, command_label(message.content)):
+        # Process fashionbot commands through the agent if it starts with !
+        if message.content.startswith("!"):
+            logger.info(f"Processing command from {message.author}: {message.content}")
+            agent_response = await agent.process_command(message)
+            if agent_response:
+                with stage("discord_send"):
+                    await message.reply(agent_response)
+                record_first_reply()
+            return
 
-    # Only process Discord built-in commands if not already handled by the agent
-    await bot.process_commands(message)
+        # Only process Discord built-in commands if not already handled by the agent
+        await bot.process_commands(message)
 
-    # For regular messages, use the agent for fashion advice
-    logger.info(f"Processing message from {message.author}: {message.content}")
-    response = await agent.run(message)
+        # For regular messages, use the agent for fashion advice
+        logger.info(f"Processing message from {message.author}: {message.content}")
+        response = await agent.run(message)
 
-    # Send the response back to the channel
-    await message.reply(response)
+        # Send the response back to the channel
+        with stage("discord_send"):
+            await message.reply(response)
+        record_first_reply()
 
 
 # Commands that we want to handle directly in bot.py
@@ -94,4 +288,14 @@ async def ping(ctx, *, arg=None):
 
 
 # Start the bot, connecting it to the gateway
-bot.run(token)
+if __name__ == "__main__":
+    setup_logging()
+    capture_listener = setup_traffic_capture(TRAFFIC_CAPTURE_FILE) if TRAFFIC_CAPTURE_FILE else None
+    if METRICS_PORT:
+        start_metrics_server(int(METRICS_PORT))
+        logger.info(f"Serving metrics on http://127.0.0.1:{METRICS_PORT}/metrics")
+    try:
+        bot.run(token)
+    finally:
+        if capture_listener:
+            capture_listener.stop()
@@ -0,0 +1,115 @@
+"""
+Closes trend challenges and competitions when their time is up.
+
+`announce_trend` and `start_competition` store an `end_date` (start plus
+`duration_days`) with the challenge. The bot keeps one timer heap of these
+deadlines for every store: a single task sleeps until the earliest one, or
+until an earlier deadline is scheduled, and then hands it to `on_due`. Each
+deadline is keyed by (guild id, kind, challenge id), with the start date as
+the challenge id. A challenge that was ended by hand or replaced before its
+deadline is therefore recognised and skipped when the timer fires. Deadlines
+live in the JSON stores, so after a restart they are scheduled again from the
+active challenges, and challenges that expired while the bot was offline are
+closed straight away.
+"""
+import time
+import heapq
+import asyncio
+from datetime import datetime, timedelta
+
+
+# Longest single sleep, so a wall clock change is noticed within the hour
+MAX_SLEEP = 3600
+
+
+def challenge_deadline(challenge):
+    """
+    Unix time at which a trend or competition ends.
+
+    Challenges stored before deadlines were recorded have end_date equal to
+    start_date. Their deadline is start_date plus duration_days.
+    """
+    start = datetime.fromisoformat(challenge["start_date"])
+    end = datetime.fromisoformat(challenge.get("end_date") or challenge["start_date"])
+    if end <= start:
+        end = start + timedelta(days=challenge.get("duration_days", 7))
+    return end.timestamp()
+
+
+class ChallengeScheduler:
+    def __init__(self, on_due, clock=time.time):
+        """
+        Args:
+            on_due: Coroutine function (guild_id, kind, challenge_id) called when a
+                deadline passes
+            clock: Returns the current Unix time
+        """
+        self.on_due = on_due
+        self.clock = clock
+        self._heap = []  # (deadline, sequence, key)
+        self._deadlines = {}  # key -> deadline currently scheduled
+        self._sequence = 0
+        self._wake = asyncio.Event()
+        self._task = None
+
+    @property
+    def started(self):
+        return self._task is not None
+
+    def start(self):
+        if not self.started:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def schedule(self, deadline, guild_id, kind, challenge_id):
+        """Call on_due(guild_id, kind, challenge_id) at `deadline`, replacing any earlier deadline for it."""
+        key = (guild_id, kind, challenge_id)
+        if self._deadlines.get(key) == deadline:
+            return
+        self._deadlines[key] = deadline
+        self._sequence += 1
+        heapq.heappush(self._heap, (deadline, self._sequence, key))
+        if self._heap[0][2] == key:
+            self._wake.set()  # new earliest deadline
+
+    def cancel(self, guild_id, kind, challenge_id):
+        # The heap entry stays and is skipped when it comes up
+        self._deadlines.pop((guild_id, kind, challenge_id), None)
+
+    def pending(self):
+        """Scheduled deadlines as (deadline, guild_id, kind, challenge_id), earliest first."""
+        return sorted((deadline,) + key for key, deadline in self._deadlines.items())
+
+    def _pop_due(self, now):
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, _, key = heapq.heappop(self._heap)
+            if self._deadlines.get(key) == deadline:
+                del self._deadlines[key]
+                due.append(key)
+        return due
+
+    async def _run(self):
+        while True:
+            self._wake.clear()
+            for key in self._pop_due(self.clock()):
+                try:
+                    await self.on_due(*key)
+                except Exception as e:
+                    print(f"Closing {key[1]} {key[2]} failed: {str(e)}")
+                    import traceback
+                    traceback.print_exc()
+
+            # Skip cancelled entries at the top so they don't cause early wake-ups
+            while self._heap and self._deadlines.get(self._heap[0][2]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            delay = min(self._heap[0][0] - self.clock(), MAX_SLEEP) if self._heap else MAX_SLEEP
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
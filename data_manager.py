@@ -1,23 +1,128 @@
-import json
 import os
-from datetime import datetime
-import random
+import shutil
+import asyncio
+import weakref
+import functools
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from dataclasses import replace
+from datetime import datetime, timedelta
+from metrics import storage
+from store_lock import store_lock
+from archive import Archive
+from blob_store import BlobStore, escape, is_ref
+from image_cache import ImageCache
+from render_cache import RenderCache
+from standings import Standings, entrant_votes
+import records
+from records import User, Ratings, Submission, CompetitionEntry, ChatTurn, encode_table, decode_table
+
+
+def _exclusive(method):
+    """Run a load-modify-save method under the store lock so no update is lost."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
 
 class DataManager:
-    def __init__(self):
-        self.data_folder = "data"
+    def __init__(self, data_folder="data", process_safe=None, compact=None, keep_recent=None):
+        """
+        Args:
+            data_folder (str): Folder holding the JSON files
+            process_safe (bool, optional): Also lock across processes (several shard
+                processes sharing one store). Defaults to DATA_PROCESS_SAFE=1.
+            compact (bool, optional): Write the compact table encoding (see records.py).
+                Defaults to True unless DATA_FORMAT=legacy. Both formats are always readable.
+            keep_recent (int, optional): Past trends and competitions kept in the hot
+                files; older ones move to the archive. Defaults to ARCHIVE_KEEP_RECENT or 5.
+        """
+        if process_safe is None:
+            process_safe = os.getenv("DATA_PROCESS_SAFE", "0") == "1"
+        if compact is None:
+            compact = os.getenv("DATA_FORMAT", "compact") != "legacy"
+        if keep_recent is None:
+            keep_recent = int(os.getenv("ARCHIVE_KEEP_RECENT", "5"))
+        self.data_folder = data_folder
+        self.process_safe = process_safe
+        self.compact = compact
+        self.keep_recent = keep_recent
         self.trends_file = os.path.join(self.data_folder, "trends.json")
         self.users_file = os.path.join(self.data_folder, "users.json")
         self.competitions_file = os.path.join(self.data_folder, "competitions.json")
         self.chat_history_file = os.path.join(self.data_folder, "chat_history.json")
+        self.archive = Archive(os.path.join(self.data_folder, "archive"))
+        self.blobs = BlobStore(os.path.join(self.data_folder, "blobs"),
+                               min_chars=int(os.getenv("BLOB_MIN_CHARS", "512")))
+        self.images = ImageCache(os.path.join(self.data_folder, "images"),
+                                 max_bytes=int(os.getenv("IMAGE_CACHE_MAX_MB", "200")) * 1024 * 1024,
+                                 max_age=float(os.getenv("IMAGE_CACHE_MAX_DAYS", "30")) * 24 * 60 * 60)
+        
+        # Files whose record collections are typed: path -> (decode, encode)
+        self._codecs = {
+            self.users_file: (self._decode_users, self._encode_users),
+            self.trends_file: (self._decode_trends, self._encode_trends),
+            self.competitions_file: (self._decode_competitions, self._encode_competitions),
+            self.chat_history_file: (self._decode_chat_history, self._encode_chat_history),
+        }
         
         # Create data folder if it doesn't exist
         if not os.path.exists(self.data_folder):
             os.makedirs(self.data_folder)
         
+        self._lock = store_lock(self.data_folder, process_safe)
+        self._async_facade = None
+        # Columnar ratings view for !stats, built on first use (see analytics.py),
+        # and the trends.json modification time and size it reflects
+        self._ratings_index = None
+        self._ratings_stamp = None
+        # Image feature index for !similar, loaded on first use (see similarity.py)
+        self._similarity_index = None
+        # Live standings of the active competition (see standings.py), valid while
+        # competitions.json still has the modification time and size recorded here
+        self._standings = None
+        self._standings_stamp = None
+        # Rendered replies of read-only commands (see render_cache.py). Other processes
+        # don't invalidate it, so shared stores also compare file modification times.
+        self._topic_files = {
+            "leaderboard": self.users_file,
+            "user": self.users_file,
+            "trend": self.trends_file,
+            "competition": self.competitions_file,
+            "standings": self.competitions_file,
+        }
+        self.renders = RenderCache(signature=self._file_signature if process_safe else None)
+        
         # Initialize data files if they don't exist
         self._initialize_files()
     
+    @property
+    def aio(self):
+        """Async facade over this store (see AsyncDataManager)."""
+        if self._async_facade is None:
+            self._async_facade = AsyncDataManager(self)
+        return self._async_facade
+    
+    def _file_signature(self, topics):
+        """Modification time and size of the files behind `topics` (for RenderCache)."""
+        signature = ()
+        for topic in topics:
+            signature += self._file_stamp(self._topic_files[topic.split(":")[0]])
+        return signature
+    
+    @staticmethod
+    def _file_stamp(file_path):
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+    
+    @_exclusive
     def _initialize_files(self):
         # Trends data structure
         if not os.path.exists(self.trends_file):
@@ -49,18 +154,271 @@ class DataManager:
     
     def _load_json(self, file_path):
         try:
-            with open(file_path, 'r') as f:
-                return json.load(f)
+            with storage("load", os.path.basename(file_path)):
+                with open(file_path, 'rb') as f:
+                    data = records.loads(f.read())
         except FileNotFoundError:
             return {}
+        codec = self._codecs.get(file_path)
+        return codec[0](data) if codec else data
     
     def _save_json(self, file_path, data):
-        with open(file_path, 'w') as f:
-            json.dump(data, f, indent=4)
+        codec = self._codecs.get(file_path)
+        if codec:
+            data = codec[1](data)
+        # Write to a temp file and swap it in, so readers (in any process) never see
+        # a half-written file
+        tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with storage("save", os.path.basename(file_path)):
+            with open(tmp_path, 'wb') as f:
+                f.write(records.dumps(data, compact=self.compact))
+            os.replace(tmp_path, file_path)
+    
+    # RECORD ENCODING
+    # Loaded files hold typed records (records.py); these convert whole files
+    # between that form and the on-disk layout.
+    
+    def _decode_users(self, data):
+        data["users"] = decode_table(data.get("users"), User)
+        return data
+    
+    def _encode_users(self, data):
+        return {**data, "users": encode_table(data.get("users", {}), User, compact=self.compact)}
+    
+    def _decode_trends(self, data):
+        data["submissions"] = decode_table(data.get("submissions"), Submission)
+        return data
+    
+    def _encode_trends(self, data):
+        return {**data, "submissions": encode_table(data.get("submissions", {}), Submission, compact=self.compact)}
+    
+    def _decode_competitions(self, data):
+        for competition in [data.get("active_competition")] + data.get("past_competitions", []):
+            if competition:
+                competition["submissions"] = decode_table(
+                    competition.get("submissions"), CompetitionEntry, many=True)
+        return data
+    
+    def _encode_competitions(self, data):
+        def encode(competition):
+            if not competition:
+                return competition
+            return {**competition, "submissions": encode_table(
+                competition.get("submissions", {}), CompetitionEntry, many=True, compact=self.compact)}
+        return {
+            **data,
+            "active_competition": encode(data.get("active_competition")),
+            "past_competitions": [encode(competition) for competition in data.get("past_competitions", [])],
+        }
+    
+    def _decode_chat_history(self, data):
+        data["user_histories"] = decode_table(data.get("user_histories"), ChatTurn, many=True)
+        return data
+    
+    def _encode_chat_history(self, data):
+        return {**data, "user_histories": encode_table(
+            data.get("user_histories", {}), ChatTurn, many=True, compact=self.compact)}
+    
+    # LARGE TEXT
+    # Analyses and AI responses live in the blob store; records hold a reference.
+    
+    def _externalize(self, text):
+        # The legacy format is for rolling back to code that can't read references
+        return self.blobs.store_large(text) if self.compact else escape(text)
+    
+    @_exclusive
+    def relocate_text(self, to_blobs=True):
+        """
+        Move large texts in the hot files into the blob store, or back inline.
+        
+        Returns:
+            int: Number of texts moved
+        """
+        def convert(value):
+            if to_blobs:
+                return value if is_ref(value) else self.blobs.store_large(self.blobs.resolve(value))
+            return escape(self.blobs.resolve(value))
+        
+        trends_data = self._load_json(self.trends_file)
+        chat_data = self._load_json(self.chat_history_file)
+        
+        moved = 0
+        for submission in trends_data["submissions"].values():
+            value = convert(submission.analysis_text)
+            moved += value != submission.analysis_text
+            submission.analysis_text = value
+        for history in chat_data["user_histories"].values():
+            for turn in history:
+                for name in ("user_message", "ai_response"):
+                    value = convert(turn[name])
+                    moved += value != turn[name]
+                    turn[name] = value
+        
+        if moved:
+            self._save_json(self.trends_file, trends_data)
+            self._save_json(self.chat_history_file, chat_data)
+        return moved
+    
+    @_exclusive
+    def sweep_blobs(self):
+        """Delete blobs no longer referenced by the hot files or the archive (e.g. trimmed chat turns)."""
+        live = []
+        submissions = list(self._load_json(self.trends_file)["submissions"].values())
+        for segment in self.archive.manifest()["segments"]:
+            if segment["kind"] == "trends":
+                submissions.extend(self.archive.load_segment(segment["file"])["submissions"].values())
+        live.extend(submission.analysis_text for submission in submissions)
+        for history in self._load_json(self.chat_history_file)["user_histories"].values():
+            for turn in history:
+                live.extend((turn.user_message, turn.ai_response))
+        return self.blobs.sweep(value for value in live if is_ref(value))
+    
+    # ARCHIVAL
+    # The hot files keep the current trend's submissions and the `keep_recent` most
+    # recent past trends/competitions; anything older moves to the archive.
+    
+    def _overflow(self, past):
+        """Split a past list into (entries to archive, entries to keep)."""
+        cut = max(len(past) - self.keep_recent, 0)
+        return past[:cut], past[cut:]
+    
+    def _archive_trends(self, trends_data, include_submissions=False):
+        old_trends, trends_data["past_trends"] = self._overflow(trends_data.get("past_trends", []))
+        submissions = trends_data.get("submissions", {}) if include_submissions else {}
+        self.archive.append("trends", old_trends, submissions)
+        if include_submissions:
+            trends_data["submissions"] = {}
+    
+    def _archive_competitions(self, comp_data):
+        old_competitions, comp_data["past_competitions"] = self._overflow(comp_data.get("past_competitions", []))
+        self.archive.append("competitions", old_competitions)
+    
+    @_exclusive
+    def archive_old_history(self):
+        """Move past trends and competitions beyond `keep_recent` out of the hot files."""
+        trends_data = self._load_json(self.trends_file)
+        comp_data = self._load_json(self.competitions_file)
+        archived = len(trends_data.get("past_trends", [])) + len(comp_data.get("past_competitions", []))
+        
+        self._archive_trends(trends_data)
+        self._archive_competitions(comp_data)
+        archived -= len(trends_data["past_trends"]) + len(comp_data["past_competitions"])
+        
+        if archived:
+            self._save_json(self.trends_file, trends_data)
+            self._save_json(self.competitions_file, comp_data)
+        return archived
+    
+    def get_past_trends(self, limit=5):
+        """Most recent past trends first, reading the archive only if the hot file has too few."""
+        trends_data = self._load_json(self.trends_file)
+        past = list(reversed(trends_data.get("past_trends", [])))[:limit]
+        if len(past) < limit:
+            past.extend(self.archive.past_entries("trends", limit - len(past)))
+        return past
+    
+    def get_past_competitions(self, limit=5):
+        """Most recent past competitions first, reading the archive only if the hot file has too few."""
+        comp_data = self._load_json(self.competitions_file)
+        past = list(reversed(comp_data.get("past_competitions", [])))[:limit]
+        if len(past) < limit:
+            past.extend(self.archive.past_entries("competitions", limit - len(past)))
+        return past
+    
+    # STATISTICS
+    
+    def ratings_index(self):
+        """
+        Return the RatingsIndex over every rated submission, hot and archived.
+        
+        It is built once under the store lock and then read without it. In
+        process-safe mode it is rebuilt when trends.json was changed by another
+        process (or by a write this store didn't add to the index).
+        """
+        index = self._ratings_index
+        if index is not None and (not self.process_safe or self._ratings_stamp == self._file_stamp(self.trends_file)):
+            return index
+        
+        with self._lock:
+            stamp = self._file_stamp(self.trends_file)
+            if self._ratings_index is None or (self.process_safe and stamp != self._ratings_stamp):
+                from analytics import RatingsIndex
+                
+                submissions = list(self._load_json(self.trends_file)["submissions"].values())
+                for segment in self.archive.manifest()["segments"]:
+                    if segment["kind"] == "trends":
+                        submissions.extend(self.archive.load_segment(segment["file"])["submissions"].values())
+                self._ratings_index = RatingsIndex.build(submissions)
+                self._ratings_stamp = stamp
+            return self._ratings_index
+    
+    def get_trend_stats(self, trend=None, limit=5):
+        return self.ratings_index().trend_summary(trend, limit)
+    
+    def get_user_trajectory(self, user_id, limit=10):
+        return self.ratings_index().user_trajectory(user_id, limit)
+    
+    def get_leaderboard_deltas(self, days=7, limit=10):
+        return self.ratings_index().leaderboard_deltas(days, limit)
+    
+    def get_color_stats(self, trend=None, limit=8):
+        return self.ratings_index().color_summary(trend, limit)
+    
+    def similarity_index(self):
+        if self._similarity_index is None:
+            from similarity import SimilarityIndex
+            self._similarity_index = SimilarityIndex(os.path.join(self.data_folder, "similar"))
+        return self._similarity_index
+    
+    @_exclusive
+    def add_outfit_features(self, submission, features):
+        """Index the image features of a new submission for !similar."""
+        self.similarity_index().add({
+            "id": submission["id"],
+            "user_id": str(submission["user_id"]),
+            "username": submission["username"],
+            "trend_id": submission["trend_id"],
+            "image_url": submission["image_url"],
+        }, features)
+    
+    def find_similar_outfits(self, user_id, limit=5):
+        """
+        Submissions by other users that look most like the user's latest indexed outfit.
+        
+        Returns:
+            list: (submission details, cosine similarity) pairs, best first, or
+            None if the user has no indexed submission
+        """
+        index = self.similarity_index()
+        row = index.latest_for_user(user_id)
+        if row is None:
+            return None
+        return index.search(row, limit)
+    
+    # IMAGE CACHE
+    
+    def cache_submission_image(self, submission_id, image_bytes):
+        """Keep the model-ready JPEG of a submission for visual follow-ups in !feedback."""
+        self.images.put(submission_id, image_bytes)
+    
+    def get_submission_image(self, submission_id):
+        """
+        Returns:
+            bytes: The cached JPEG, or None if it was never cached or has been evicted
+        """
+        return self.images.get(submission_id)
     
     # TREND MANAGEMENT
     
-    def announce_trend(self, trend_name, description, duration_days=7):
+    @_exclusive
+    def announce_trend(self, trend_name, description, duration_days=7, channel_id=None):
+        """
+        Start a trend challenge. It is closed automatically at end_date (see challenge_scheduler.py).
+        
+        Args:
+            duration_days (float): Days until the challenge ends
+            channel_id (int, optional): Channel the challenge was announced in, where its end is announced
+        """
         trends_data = self._load_json(self.trends_file)
         
         # Check if there's already an active trend
@@ -68,25 +426,30 @@ class DataManager:
             return False, "There's already an active trend challenge"
         
         # Create new trend
+        start = datetime.now()
         new_trend = {
             "name": trend_name,
             "description": description,
-            "start_date": datetime.now().isoformat(),
-            "end_date": datetime.now().isoformat(),  # Will be calculated based on duration
+            "start_date": start.isoformat(),
+            "end_date": (start + timedelta(days=duration_days)).isoformat(),
             "duration_days": duration_days,
-            "participants": []
+            "participants": [],
+            "channel_id": channel_id
         }
         
         trends_data["active_trend"] = new_trend
-        trends_data["submissions"] = {}
+        # Submissions from earlier trends go to the archive (still reachable by !feedback)
+        self._archive_trends(trends_data, include_submissions=True)
         
         self._save_json(self.trends_file, trends_data)
+        self.renders.invalidate("trend")
         return True, new_trend
     
     def get_active_trend(self):
         trends_data = self._load_json(self.trends_file)
         return trends_data.get("active_trend")
     
+    @_exclusive
     def end_current_trend(self):
         trends_data = self._load_json(self.trends_file)
         
@@ -96,11 +459,14 @@ class DataManager:
         # Move active trend to past trends
         trends_data["past_trends"].append(trends_data["active_trend"])
         trends_data["active_trend"] = None
+        self._archive_trends(trends_data)
         
         self._save_json(self.trends_file, trends_data)
+        self.renders.invalidate("trend")
         return True, "Trend challenge ended successfully"
     
-    def submit_outfit(self, user_id, username, image_url, trend_id=None, analysis_text=None):
+    @_exclusive
+    def submit_outfit(self, user_id, username, image_url, trend_id=None, analysis_text=None, image_profile=None):
         """Submit a new outfit for the current trend challenge."""
         trends_data = self._load_json(self.trends_file)
         
@@ -115,16 +481,17 @@ class DataManager:
         submission_id = f"{user_id}_{datetime.now().strftime('%Y%m%d%H%M%S')}"
         
         # Create submission entry
-        submission = {
-            "id": submission_id,
-            "user_id": user_id,
-            "username": username,
-            "trend_id": trend_id,
-            "image_url": image_url,
-            "submission_date": datetime.now().isoformat(),
-            "ratings": {},
-            "analysis_text": analysis_text  # Store the AI analysis text
-        }
+        submission = Submission(
+            id=submission_id,
+            user_id=user_id,
+            username=username,
+            trend_id=trend_id,
+            image_url=image_url,
+            submission_date=datetime.now().isoformat(),
+            ratings=Ratings(),
+            analysis_text=self._externalize(analysis_text),  # Store the AI analysis text
+            image_profile=image_profile
+        )
         
         # Add submission
         if "submissions" not in trends_data:
@@ -136,8 +503,10 @@ class DataManager:
             trends_data["active_trend"]["participants"].append(user_id)
         
         self._save_json(self.trends_file, trends_data)
-        return True, submission
+        self.renders.invalidate("trend")
+        return True, replace(submission, analysis_text=analysis_text)
     
+    @_exclusive
     def rate_submission(self, user_id, trend_accuracy, creativity, fit, submission_id=None, username=None):
         """Rate a user's outfit submission."""
         trends_data = self._load_json(self.trends_file)
@@ -169,15 +538,23 @@ class DataManager:
         points = int(average_rating * 10)
         
         # Update submission ratings
-        trends_data["submissions"][submission_id]["ratings"] = {
-            "trend_accuracy": trend_accuracy,
-            "creativity": creativity,
-            "fit": fit,
-            "average": average_rating,
-            "points": points
-        }
+        trends_data["submissions"][submission_id]["ratings"] = Ratings(
+            trend_accuracy=trend_accuracy,
+            creativity=creativity,
+            fit=fit,
+            average=average_rating,
+            points=points
+        )
         
+        # A shared store's index may already miss other processes' ratings; it is rebuilt then
+        current = self._ratings_stamp == self._file_stamp(self.trends_file)
         self._save_json(self.trends_file, trends_data)
+        if self._ratings_index is not None:
+            if self.process_safe and not current:
+                self._ratings_index = None
+            else:
+                self._ratings_index.add(trends_data["submissions"][submission_id])
+                self._ratings_stamp = self._file_stamp(self.trends_file)
         
         # Update user points
         self.add_points(user_id, points, username)
@@ -196,21 +573,18 @@ class DataManager:
         users_data = self._load_json(self.users_file)
         return users_data["users"].get(str(user_id))
     
+    @_exclusive
     def add_points(self, user_id, points, username=None):
         users_data = self._load_json(self.users_file)
         
         if str(user_id) not in users_data["users"]:
-            users_data["users"][str(user_id)] = {
-                "username": username or f"User{user_id}",
-                "points": 0,
-                "participations": 0,
-                "wins": 0
-            }
+            users_data["users"][str(user_id)] = User(username=username or f"User{user_id}")
         
         users_data["users"][str(user_id)]["points"] += points
         users_data["users"][str(user_id)]["participations"] += 1
         
         self._save_json(self.users_file, users_data)
+        self.renders.invalidate("leaderboard", f"user:{user_id}")
         return users_data["users"][str(user_id)]
     
     def get_leaderboard(self, limit=10):
@@ -228,73 +602,133 @@ class DataManager:
     def update_usernames_in_database(self, guild):
         """
         Update all username entries in the database with actual Discord usernames.
-        Should be called once during bot initialization.
+        Only rewrites users.json if at least one name changed.
         """
         users_data = self._load_json(self.users_file)
         
-        for user_id in list(users_data["users"].keys()):
+        changes = {}
+        for user_id in users_data["users"].keys():
             # Try to find the member in the guild
             member = guild.get_member(int(user_id))
             if member:
-                # Update the username
-                users_data["users"][user_id]["username"] = member.name
+                changes[user_id] = member.name
         
-        self._save_json(self.users_file, users_data)
+        self.update_usernames(changes)
         return True
     
+    @_exclusive
+    def update_usernames(self, usernames):
+        """
+        Apply a batch of username changes to known users.
+        
+        Args:
+            usernames (dict): user_id -> current username
+            
+        Returns:
+            int: Number of users whose stored name actually changed (0 means no write happened)
+        """
+        if not usernames:
+            return 0
+        
+        users_data = self._load_json(self.users_file)
+        
+        changed = 0
+        for user_id, username in usernames.items():
+            user = users_data["users"].get(str(user_id))
+            if user and user.get("username") != username:
+                user["username"] = username
+                changed += 1
+        
+        if changed:
+            self._save_json(self.users_file, users_data)
+            self.renders.invalidate("leaderboard")
+        return changed
+    
+    def get_usernames(self):
+        """Return (user_id, username) pairs for every stored user, ordered by user id."""
+        users_data = self._load_json(self.users_file)
+        return sorted(
+            ((user_id, user.get("username")) for user_id, user in users_data["users"].items()),
+            key=lambda pair: int(pair[0])
+        )
+    
     # COMPETITION MANAGEMENT
     
-    def start_competition(self, name, description, sponsor, duration_days=7):
+    @_exclusive
+    def start_competition(self, name, description, sponsor, duration_days=7, voting="command", channel_id=None):
+        """
+        Start a competition. It is closed automatically at end_date (see challenge_scheduler.py).
+        
+        Args:
+            duration_days (float): Days until the competition ends
+            voting (str): "command" (votes cast with !vote) or "reactions" (votes are
+                reactions on the posted entry messages, see vote_tally.py)
+            channel_id (int, optional): Channel the competition was started in, where its result is announced
+        """
         comp_data = self._load_json(self.competitions_file)
         
         if comp_data.get("active_competition"):
             return False, "There's already an active competition"
         
         # Create new competition
+        start = datetime.now()
         new_competition = {
             "name": name,
             "description": description,
             "sponsor": sponsor,
-            "start_date": datetime.now().isoformat(),
-            "end_date": datetime.now().isoformat(),  # Will be calculated based on duration
+            "start_date": start.isoformat(),
+            "end_date": (start + timedelta(days=duration_days)).isoformat(),
             "duration_days": duration_days,
             "participants": [],
-            "submissions": {}
+            "submissions": {},
+            "voting": voting,
+            "channel_id": channel_id
         }
+        if voting == "reactions":
+            new_competition["entry_messages"] = {}
         
         comp_data["active_competition"] = new_competition
         comp_data["votes"] = {}
         
         self._save_json(self.competitions_file, comp_data)
+        self._standings = Standings(new_competition)
+        self._standings_stamp = self._file_stamp(self.competitions_file)
+        self.renders.invalidate("competition", "standings")
         return True, new_competition
     
+    @_exclusive
     def submit_competition_entry(self, user_id, username, image_url, description):
         comp_data = self._load_json(self.competitions_file)
         
         if not comp_data.get("active_competition"):
             return False, "No active competition to submit to"
+        standings = self._current_standings(comp_data)
         
         # Add submission
         if str(user_id) not in comp_data["active_competition"]["submissions"]:
             comp_data["active_competition"]["submissions"][str(user_id)] = []
         
-        submission = {
-            "user_id": str(user_id),
-            "username": username,
-            "image_url": image_url,
-            "description": description,
-            "timestamp": datetime.now().isoformat(),
-            "votes": 0
-        }
+        submission = CompetitionEntry(
+            user_id=str(user_id),
+            username=username,
+            image_url=image_url,
+            description=description,
+            timestamp=datetime.now().isoformat()
+        )
         
         comp_data["active_competition"]["submissions"][str(user_id)].append(submission)
         
         if user_id not in comp_data["active_competition"]["participants"]:
             comp_data["active_competition"]["participants"].append(user_id)
         
+        competition = comp_data["active_competition"]
         self._save_json(self.competitions_file, comp_data)
+        standings.update(str(user_id), username, entrant_votes(competition, competition["submissions"][str(user_id)]))
+        self._standings_stamp = self._file_stamp(self.competitions_file)
+        self.renders.invalidate("competition", "standings")
         return True, submission
     
+    @_exclusive
     def vote_for_submission(self, voter_id, user_id):
         comp_data = self._load_json(self.competitions_file)
         
@@ -307,6 +741,7 @@ class DataManager:
         # Check if voter has already voted
         if str(voter_id) in comp_data["votes"]:
             return False, "You have already voted in this competition"
+        standings = self._current_standings(comp_data)
         
         # Record vote
         comp_data["votes"][str(voter_id)] = str(user_id)
@@ -318,9 +753,79 @@ class DataManager:
         # Update submission
         comp_data["active_competition"]["submissions"][str(user_id)][-1] = latest_submission
         
+        competition = comp_data["active_competition"]
         self._save_json(self.competitions_file, comp_data)
+        standings.update(str(user_id), latest_submission["username"],
+                         entrant_votes(competition, competition["submissions"][str(user_id)]))
+        self._standings_stamp = self._file_stamp(self.competitions_file)
+        self.renders.invalidate("standings")
         return True, "Vote recorded successfully"
     
+    @_exclusive
+    def register_entry_message(self, message_id, channel_id, user_id):
+        """Link a posted entry message to the user's latest entry, so reactions on it count as votes."""
+        comp_data = self._load_json(self.competitions_file)
+        competition = comp_data.get("active_competition")
+        
+        if not competition or str(user_id) not in competition["submissions"]:
+            return False
+        
+        competition.setdefault("entry_messages", {})[str(message_id)] = {
+            "channel_id": channel_id,
+            "user_id": str(user_id),
+            "entry": len(competition["submissions"][str(user_id)]) - 1
+        }
+        
+        self._current_standings(comp_data)  # unchanged by this write
+        self._save_json(self.competitions_file, comp_data)
+        self._standings_stamp = self._file_stamp(self.competitions_file)
+        return True
+    
+    def get_competition_votes(self):
+        """Return the active competition and its recorded votes (voter id -> vote target)."""
+        comp_data = self._load_json(self.competitions_file)
+        return comp_data.get("active_competition"), comp_data.get("votes", {})
+    
+    @_exclusive
+    def checkpoint_votes(self, competition_id, reaction_votes):
+        """
+        Store a snapshot of reaction votes and recount every entry's votes.
+        
+        Args:
+            competition_id (str): start_date of the competition the tally belongs to
+            reaction_votes (dict): voter id -> "<user id>/<entry index>"
+            
+        Returns:
+            bool: False if that competition is no longer active
+        """
+        comp_data = self._load_json(self.competitions_file)
+        competition = comp_data.get("active_competition")
+        
+        if not competition or competition["start_date"] != competition_id:
+            return False
+        
+        # Votes cast with !vote are kept; a voter's !vote takes precedence over a reaction
+        votes = {voter: target for voter, target in comp_data.get("votes", {}).items() if "/" not in target}
+        for voter, target in reaction_votes.items():
+            votes.setdefault(voter, target)
+        comp_data["votes"] = votes
+        
+        for entries in competition["submissions"].values():
+            for entry in entries:
+                entry["votes"] = 0
+        for target in votes.values():
+            user_id, _, index = target.partition("/")
+            entries = competition["submissions"].get(user_id)
+            if entries:
+                entries[int(index) if index else -1]["votes"] += 1
+        # Checkpoints recount every entry anyway, so the standings are rebuilt with them
+        self._save_json(self.competitions_file, comp_data)
+        self._standings = Standings(competition)
+        self._standings_stamp = self._file_stamp(self.competitions_file)
+        self.renders.invalidate("standings")
+        return True
+    
+    @_exclusive
     def end_competition(self):
         comp_data = self._load_json(self.competitions_file)
         users_data = self._load_json(self.users_file)
@@ -328,14 +833,9 @@ class DataManager:
         if not comp_data.get("active_competition"):
             return False, "No active competition to end"
         
-        # Determine winner (submission with most votes)
-        winner_id = None
-        max_votes = -1
-        
-        for user_id, submissions in comp_data["active_competition"]["submissions"].items():
-            if submissions[-1]["votes"] > max_votes:
-                max_votes = submissions[-1]["votes"]
-                winner_id = user_id
+        # The winner is the standings leader (see standings.py for how entries count)
+        leader = self._current_standings(comp_data).leader()
+        winner_id, max_votes = leader if leader else (None, -1)
         
         # Add winner information to competition
         if winner_id:
@@ -351,22 +851,62 @@ class DataManager:
                 users_data["users"][str(winner_id)]["points"] += 100  # Bonus points for winning
         
         # Move to past competitions
-        comp_data["past_competitions"].append(comp_data["active_competition"])
+        ended = comp_data["active_competition"]
+        comp_data["past_competitions"].append(ended)
         comp_data["active_competition"] = None
         comp_data["votes"] = {}
+        self._archive_competitions(comp_data)
         
         self._save_json(self.competitions_file, comp_data)
         self._save_json(self.users_file, users_data)
+        self._standings = None
+        self._standings_stamp = self._file_stamp(self.competitions_file)
+        self.renders.invalidate("competition", "standings")
+        if winner_id and str(winner_id) in users_data["users"]:
+            self.renders.invalidate("leaderboard", f"user:{winner_id}")
         
-        return True, comp_data["past_competitions"][-1]
+        return True, ended
     
     def get_active_competition(self):
         """Get the currently active competition data."""
         comp_data = self._load_json(self.competitions_file)
         return comp_data.get("active_competition")
     
+    def get_competition_standings(self, limit=10):
+        """
+        Current standings of the active competition, from the live standings kept in memory.
+        Only reads competitions.json if another process or store has written it since.
+        
+        Returns:
+            tuple: (dict with the competition's name and voting, list of
+            {"user_id", "username", "votes"} with the most votes first, ties in
+            entry order), or (None, []) without a competition
+        """
+        if self._standings_stamp is None or self._standings_stamp != self._file_stamp(self.competitions_file):
+            with self._lock:
+                self._current_standings(self._load_json(self.competitions_file))
+        standings = self._standings
+        if standings is None:
+            return None, []
+        return {"name": standings.name, "voting": standings.voting}, standings.top(limit)
+    
+    def _current_standings(self, comp_data):
+        """
+        The live standings, rebuilt from `comp_data` if competitions.json changed
+        since they were last brought up to date. Writers call it under the lock
+        before changing `comp_data`, and update the standings once the file is saved.
+        """
+        competition = comp_data.get("active_competition")
+        stamp = self._file_stamp(self.competitions_file)
+        if (stamp != self._standings_stamp or (self._standings is None) != (competition is None)
+                or (competition and self._standings.competition_id != competition["start_date"])):
+            self._standings = Standings(competition) if competition else None
+            self._standings_stamp = stamp
+        return self._standings
+    
     # CHAT HISTORY MANAGEMENT
     
+    @_exclusive
     def add_to_chat_history(self, user_id, message_content, ai_response, submission_id=None):
         """
         Add a message and response pair to a user's chat history.
@@ -384,12 +924,12 @@ class DataManager:
             chat_data["user_histories"][str(user_id)] = []
         
         # Add the new message pair
-        message_pair = {
-            "timestamp": datetime.now().isoformat(),
-            "user_message": message_content,
-            "ai_response": ai_response,
-            "submission_id": submission_id
-        }
+        message_pair = ChatTurn(
+            timestamp=datetime.now().isoformat(),
+            user_message=self._externalize(message_content),
+            ai_response=self._externalize(ai_response),
+            submission_id=submission_id
+        )
         
         # Limit chat history to the most recent 20 message pairs
         user_history = chat_data["user_histories"][str(user_id)]
@@ -416,8 +956,11 @@ class DataManager:
         if str(user_id) not in chat_data["user_histories"]:
             return []
         
-        user_history = chat_data["user_histories"][str(user_id)]
-        return user_history[-limit:]
+        user_history = chat_data["user_histories"][str(user_id)][-limit:]
+        for turn in user_history:
+            turn.user_message = self.blobs.resolve(turn.user_message)
+            turn.ai_response = self.blobs.resolve(turn.ai_response)
+        return user_history
     
     def get_outfit_submissions_history(self, user_id, limit=3):
         """
@@ -440,4 +983,247 @@ class DataManager:
         # Sort by submission date, newest first
         user_submissions.sort(key=lambda x: x.get("submission_date", ""), reverse=True)
         
-        return user_submissions[:limit]
\ No newline at end of file
+        # Older submissions were archived when their trend was replaced
+        if len(user_submissions) < limit:
+            user_submissions.extend(self.archive.user_submissions(user_id, limit - len(user_submissions)))
+        
+        user_submissions = user_submissions[:limit]
+        return [replace(submission, analysis_text=self.blobs.resolve(submission.analysis_text))
+                for submission in user_submissions]
+
+
+# File I/O and JSON (de)serialization for every store runs on this pool, never on
+# the event loop
+_io_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="datamanager")
+
+
+class AsyncDataManager:
+    """
+    Awaitable version of every public DataManager method.
+    
+    Calls run on a worker thread so a slow disk or a large trends.json never stalls
+    the event loop. Writes to a store are queued behind an asyncio.Lock, so only one
+    worker thread at a time waits on the store lock. Reads skip the queue: saves
+    replace files atomically, so a read always sees a complete file.
+    """
+    
+    def __init__(self, data_manager):
+        self.sync = data_manager
+        self._write_lock = asyncio.Lock()
+    
+    async def _read(self, method, *args, **kwargs):
+        # copy_context keeps the caller's trace attached to the storage spans
+        context = contextvars.copy_context()
+        call = functools.partial(context.run, method, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(_io_executor, call)
+    
+    async def _write(self, method, *args, **kwargs):
+        async with self._write_lock:
+            return await self._read(method, *args, **kwargs)
+    
+    # LARGE TEXT
+    
+    async def relocate_text(self, to_blobs=True):
+        return await self._write(self.sync.relocate_text, to_blobs)
+    
+    async def sweep_blobs(self):
+        return await self._write(self.sync.sweep_blobs)
+    
+    # ARCHIVAL
+    
+    async def archive_old_history(self):
+        return await self._write(self.sync.archive_old_history)
+    
+    async def get_past_trends(self, limit=5):
+        return await self._read(self.sync.get_past_trends, limit)
+    
+    async def get_past_competitions(self, limit=5):
+        return await self._read(self.sync.get_past_competitions, limit)
+    
+    # STATISTICS
+    
+    async def get_trend_stats(self, trend=None, limit=5):
+        return await self._read(self.sync.get_trend_stats, trend, limit)
+    
+    async def get_user_trajectory(self, user_id, limit=10):
+        return await self._read(self.sync.get_user_trajectory, user_id, limit)
+    
+    async def get_leaderboard_deltas(self, days=7, limit=10):
+        return await self._read(self.sync.get_leaderboard_deltas, days, limit)
+    
+    async def get_color_stats(self, trend=None, limit=8):
+        return await self._read(self.sync.get_color_stats, trend, limit)
+    
+    async def add_outfit_features(self, submission, features):
+        return await self._write(self.sync.add_outfit_features, submission, features)
+    
+    async def find_similar_outfits(self, user_id, limit=5):
+        return await self._read(self.sync.find_similar_outfits, user_id, limit)
+    
+    # IMAGE CACHE
+    # The cache has its own lock and replaces files atomically, so neither call
+    # needs to queue behind store writes.
+    
+    async def cache_submission_image(self, submission_id, image_bytes):
+        return await self._read(self.sync.cache_submission_image, submission_id, image_bytes)
+    
+    async def get_submission_image(self, submission_id):
+        return await self._read(self.sync.get_submission_image, submission_id)
+    
+    # TREND MANAGEMENT
+    
+    async def announce_trend(self, trend_name, description, duration_days=7, channel_id=None):
+        return await self._write(self.sync.announce_trend, trend_name, description, duration_days, channel_id)
+    
+    async def get_active_trend(self):
+        return await self._read(self.sync.get_active_trend)
+    
+    async def end_current_trend(self):
+        return await self._write(self.sync.end_current_trend)
+    
+    async def submit_outfit(self, user_id, username, image_url, trend_id=None, analysis_text=None, image_profile=None):
+        return await self._write(self.sync.submit_outfit, user_id, username, image_url,
+                                 trend_id=trend_id, analysis_text=analysis_text, image_profile=image_profile)
+    
+    async def rate_submission(self, user_id, trend_accuracy, creativity, fit, submission_id=None, username=None):
+        return await self._write(self.sync.rate_submission, user_id, trend_accuracy, creativity, fit,
+                                 submission_id=submission_id, username=username)
+    
+    # USER/POINTS MANAGEMENT
+    
+    async def get_user(self, user_id):
+        return await self._read(self.sync.get_user, user_id)
+    
+    async def add_points(self, user_id, points, username=None):
+        return await self._write(self.sync.add_points, user_id, points, username)
+    
+    async def get_leaderboard(self, limit=10):
+        return await self._read(self.sync.get_leaderboard, limit)
+    
+    async def update_usernames(self, usernames):
+        return await self._write(self.sync.update_usernames, usernames)
+    
+    async def get_usernames(self):
+        return await self._read(self.sync.get_usernames)
+    
+    # COMPETITION MANAGEMENT
+    
+    async def start_competition(self, name, description, sponsor, duration_days=7, voting="command", channel_id=None):
+        return await self._write(self.sync.start_competition, name, description, sponsor, duration_days, voting,
+                                 channel_id)
+    
+    async def submit_competition_entry(self, user_id, username, image_url, description):
+        return await self._write(self.sync.submit_competition_entry, user_id, username, image_url, description)
+    
+    async def vote_for_submission(self, voter_id, user_id):
+        return await self._write(self.sync.vote_for_submission, voter_id, user_id)
+    
+    async def register_entry_message(self, message_id, channel_id, user_id):
+        return await self._write(self.sync.register_entry_message, message_id, channel_id, user_id)
+    
+    async def get_competition_votes(self):
+        return await self._read(self.sync.get_competition_votes)
+    
+    async def checkpoint_votes(self, competition_id, reaction_votes):
+        return await self._write(self.sync.checkpoint_votes, competition_id, reaction_votes)
+    
+    async def end_competition(self):
+        return await self._write(self.sync.end_competition)
+    
+    async def get_active_competition(self):
+        return await self._read(self.sync.get_active_competition)
+    
+    async def get_competition_standings(self, limit=10):
+        return await self._read(self.sync.get_competition_standings, limit)
+    
+    # CHAT HISTORY MANAGEMENT
+    
+    async def add_to_chat_history(self, user_id, message_content, ai_response, submission_id=None):
+        return await self._write(self.sync.add_to_chat_history, user_id, message_content, ai_response,
+                                 submission_id=submission_id)
+    
+    async def get_chat_history(self, user_id, limit=5):
+        return await self._read(self.sync.get_chat_history, user_id, limit)
+    
+    async def get_outfit_submissions_history(self, user_id, limit=3):
+        return await self._read(self.sync.get_outfit_submissions_history, user_id, limit)
+
+
+class GuildDataManagers:
+    """
+    One DataManager per guild, each with its own folder under data/guilds/<guild_id>/.
+
+    Guilds get independent active trends, competitions, leaderboards and files, so
+    writes in one guild never touch another guild's data. Up to `max_cached`
+    recently used managers are kept; colder guilds are evicted and rebuilt on demand.
+    An evicted manager that something else still holds (a ReactionTally, a
+    UsernameSync) is handed out again instead, so a guild never has two managers
+    with separate render caches and indexes. Messages without a guild (DMs) use
+    the top-level data/ folder.
+    """
+    
+    def __init__(self, base_folder="data", max_cached=256, legacy_guild_id=None, process_safe=None):
+        """
+        Args:
+            base_folder (str): Root data folder
+            max_cached (int): Number of guild managers kept in memory
+            legacy_guild_id (int, optional): Guild whose partition is seeded from the
+                pre-partitioning files in base_folder the first time it is created
+            process_safe (bool, optional): Passed to every DataManager
+        """
+        self.base_folder = base_folder
+        self.guilds_folder = os.path.join(base_folder, "guilds")
+        self.max_cached = max_cached
+        self.legacy_guild_id = str(legacy_guild_id) if legacy_guild_id else None
+        self.process_safe = process_safe
+        self._managers = OrderedDict()
+        self._live = weakref.WeakValueDictionary()  # guild id -> manager, including evicted ones still in use
+        self.default = DataManager(base_folder, process_safe)
+    
+    def get(self, guild_id):
+        """Return the DataManager for a guild id (or the default store for None)."""
+        if guild_id is None:
+            return self.default
+        
+        key = str(guild_id)
+        manager = self._managers.get(key)
+        if manager is not None:
+            self._managers.move_to_end(key)
+            return manager
+        
+        manager = self._live.get(key)
+        if manager is None:
+            folder = os.path.join(self.guilds_folder, key)
+            if key == self.legacy_guild_id and not os.path.exists(folder):
+                self._seed_from_legacy(folder)
+            manager = DataManager(folder, self.process_safe)
+            self._live[key] = manager
+        self._managers[key] = manager
+        if len(self._managers) > self.max_cached:
+            self._managers.popitem(last=False)
+        return manager
+    
+    def loaded(self):
+        """Every DataManager currently in memory, the default store first."""
+        return [self.default] + list(self._live.values())
+    
+    def _seed_from_legacy(self, folder):
+        os.makedirs(folder)
+        for name in ("trends.json", "users.json", "competitions.json", "chat_history.json"):
+            legacy_file = os.path.join(self.base_folder, name)
+            if os.path.exists(legacy_file):
+                shutil.copy2(legacy_file, os.path.join(folder, name))
+        for name in ("archive", "blobs"):
+            legacy_folder = os.path.join(self.base_folder, name)
+            if os.path.isdir(legacy_folder):
+                shutil.copytree(legacy_folder, os.path.join(folder, name))
+    
+    def cached_guild_ids(self):
+        return list(self._managers.keys())
+    
+    def guild_ids(self):
+        """All guild ids that have a data partition on disk."""
+        if not os.path.exists(self.guilds_folder):
+            return []
+        return sorted(name for name in os.listdir(self.guilds_folder)
+                      if os.path.isdir(os.path.join(self.guilds_folder, name)))
@@ -0,0 +1,134 @@
+"""
+Lightweight stand-ins for the discord.py objects the agent touches.
+
+Only the attributes MistralAgent and bot.py actually read are modelled, which keeps
+them cheap enough to build a guild with a million members for benchmarks and
+traffic replay. None of these classes import discord.
+"""
+import io
+import itertools
+
+
+_message_ids = itertools.count(1)
+
+
+class FakeUser:
+    def __init__(self, user_id, name, bot=False):
+        self.id = user_id
+        self.name = name
+        self.display_name = name
+        self.bot = bot
+
+    def __str__(self):
+        return self.name
+
+
+class FakeAttachment:
+    def __init__(self, url, content=b"", content_type="image/jpeg", filename="outfit.jpg"):
+        self.url = url
+        self.content_type = content_type
+        self.filename = filename
+        self.size = len(content)
+        self._content = content
+
+    async def read(self):
+        return self._content
+
+
+class FakeGuild:
+    def __init__(self, guild_id=1, name="Fake Guild", members=None):
+        self.id = guild_id
+        self.name = name
+        self.members = list(members or [])
+        self._members_by_id = {member.id: member for member in self.members}
+        self.channels = {}
+
+    def add_member(self, member):
+        self.members.append(member)
+        self._members_by_id[member.id] = member
+
+    def get_member(self, user_id):
+        return self._members_by_id.get(user_id)
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+
+class FakeChannel:
+    def __init__(self, channel_id=1, name="general", guild=None):
+        self.id = channel_id
+        self.name = name
+        self.guild = guild
+        self.sent = []
+        self.messages = {}
+        if guild is not None:
+            guild.channels[channel_id] = self
+
+    async def send(self, content=None, **kwargs):
+        self.sent.append(content)
+        message = FakeMessage(content or "", author=FakeUser(0, "FashionBot", bot=True),
+                              channel=self, guild=self.guild)
+        self.messages[message.id] = message
+        return message
+
+    async def fetch_message(self, message_id):
+        return self.messages[message_id]
+
+
+class FakeReaction:
+    def __init__(self, emoji):
+        self.emoji = emoji
+        self.reactors = []
+
+    @property
+    def count(self):
+        return len(self.reactors)
+
+    async def users(self):
+        for user in list(self.reactors):
+            yield user
+
+
+class FakeMessage:
+    def __init__(self, content, author, guild=None, channel=None, attachments=None, message_id=None):
+        self.id = message_id if message_id is not None else next(_message_ids)
+        self.content = content
+        self.author = author
+        self.guild = guild
+        self.channel = channel or FakeChannel(guild=guild)
+        self.attachments = list(attachments or [])
+        self.replies = []
+        self.reactions = []
+
+    def reaction(self, emoji):
+        for reaction in self.reactions:
+            if reaction.emoji == emoji:
+                return reaction
+        reaction = FakeReaction(emoji)
+        self.reactions.append(reaction)
+        return reaction
+
+    async def add_reaction(self, emoji, user=None):
+        self.reaction(emoji).reactors.append(user or FakeUser(0, "FashionBot", bot=True))
+
+    async def reply(self, content=None, **kwargs):
+        self.replies.append(content)
+        return await self.channel.send(content, **kwargs)
+
+
+class FakeHTTPResponse:
+    """Shape of `requests.Response` as used by MistralAgent.download_image callers."""
+
+    def __init__(self, content, status_code=200):
+        self.content = content
+        self.status_code = status_code
+
+
+def make_test_image(width=1280, height=1706, color=(200, 120, 160)):
+    """Encode a solid-colour JPEG of the given size (requires Pillow)."""
+    from PIL import Image
+
+    img = Image.new("RGB", (width, height), color)
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG")
+    return buffer.getvalue()
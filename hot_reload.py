@@ -0,0 +1,101 @@
+"""
+Hot reload of the agent's code, prompts and configuration while the bot stays connected.
+
+`reload_agent` re-reads `.env`, overriding the values loaded at startup. It
+then loads fresh copies of the agent modules in dependency order (palette.py,
+prompts.py, agent.py) and switches the running MistralAgent to the new class. The
+instance keeps its state: the stores and their caches, reaction tallies, the
+challenge scheduler, in-flight image reservations and the model backends.
+`MistralAgent.reloaded` rebuilds what comes from code and configuration, such
+as trend ideas, prompt templates, the image memory budget and cached replies.
+The gateway session, member caches and bot.py's event handlers are untouched,
+so a deploy is a `git pull` plus `!debug reload` (or SIGHUP), with no
+re-identify and no cold start.
+
+The old module objects are not modified. If any module fails to compile or
+import, or the agent fails to switch over, the old modules, environment and
+class are put back, so the previous code really is still running. Storage,
+sharding and model backend settings, and the image limits IMAGE_MAX_BYTES and
+IMAGE_MAX_PIXELS (image_admission.py), are read once at startup and still need
+a restart. Exception classes that cross a reload, like ImageAnalysisError, live
+in modules that aren't reloaded.
+"""
+import os
+import sys
+import time
+import importlib.util
+
+from dotenv import load_dotenv
+
+
+# Leaf modules first, so agent.py imports the new versions
+RELOADABLE_MODULES = ("palette", "prompts", "agent")
+
+
+class ReloadError(Exception):
+    """A reload that was refused or failed. The message is shown to the admin."""
+
+
+def _load_fresh(module):
+    """Execute a module's current source as a new module object registered under the same name."""
+    spec = importlib.util.spec_from_file_location(module.__name__, module.__file__)
+    fresh = importlib.util.module_from_spec(spec)
+    sys.modules[module.__name__] = fresh
+    spec.loader.exec_module(fresh)
+    return fresh
+
+
+def reload_agent(agent, env_file=".env"):
+    """
+    Reload the agent modules and `.env` into a running MistralAgent.
+
+    Args:
+        agent (MistralAgent): The bot's agent, updated in place
+        env_file (str): Environment file to re-read
+
+    Returns:
+        tuple: (names of the reloaded modules, seconds taken)
+
+    Raises:
+        ReloadError: If a module doesn't compile or fails to import; nothing is reloaded
+    """
+    start = time.perf_counter()
+    # Modules that were never imported (palette is imported on first !submit) pick up the new code anyway
+    modules = [sys.modules[name] for name in RELOADABLE_MODULES if name in sys.modules]
+
+    for module in modules:
+        with open(module.__file__, "r", encoding="utf-8") as f:
+            source = f.read()
+        try:
+            compile(source, module.__file__, "exec")
+        except SyntaxError as e:
+            raise ReloadError(f"{os.path.basename(module.__file__)} line {e.lineno}: {e.msg}")
+
+    saved_environ = dict(os.environ)
+    saved_class = agent.__class__
+    load_dotenv(env_file, override=True)
+    try:
+        for module in modules:
+            try:
+                _load_fresh(module)
+            except Exception as e:
+                raise ReloadError(f"{module.__name__} failed to import: {str(e)}")
+        agent.__class__ = sys.modules["agent"].MistralAgent
+        try:
+            agent.reloaded()
+        except Exception as e:
+            raise ReloadError(f"The agent could not switch to the new code: {str(e)}")
+    except ReloadError:
+        for name in RELOADABLE_MODULES:
+            sys.modules.pop(name, None)
+        sys.modules.update((module.__name__, module) for module in modules)
+        os.environ.clear()
+        os.environ.update(saved_environ)
+        if agent.__class__ is not saved_class:
+            agent.__class__ = saved_class
+            agent.reloaded()
+        raise
+    names = [module.__name__ for module in modules]
+    seconds = time.perf_counter() - start
+    print(f"Hot reload: {', '.join(names)} in {seconds * 1000:.0f} ms")  # Debug log
+    return names, seconds
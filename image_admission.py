@@ -0,0 +1,212 @@
+"""
+Memory-budgeted admission control for `!submit` image processing.
+
+A submission holds several copies of the image at the same time: the downloaded
+body, the decoded bitmap, its RGB conversion, the resized copy, and the JPEG
+and base64 encodings sent to the model. `estimate_cost` adds these up from the
+attachment size and pixel dimensions. Discord reports both before the download,
+and PIL reads them from the header before anything is decoded. A job only starts
+once its estimate fits in the shared `MemoryBudget` (IMAGE_MEMORY_BUDGET_MB).
+Otherwise it waits in FIFO order, so peak memory stays bounded however many
+submissions arrive together. A job that reserved only its download and then
+finds the image is larger keeps what it holds and queues for the difference,
+ahead of jobs that haven't started. Images over IMAGE_MAX_BYTES, or with more
+pixels than IMAGE_MAX_PIXELS or than fit in the budget (`pixel_limit`), are
+rejected before they are downloaded or decoded.
+"""
+import os
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+
+from metrics import stage
+
+
+MAX_IMAGE_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(25 * 1024 * 1024)))
+MAX_IMAGE_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", str(40_000_000)))
+# Longest side of the image sent to the model (see MistralAgent._preprocess_image)
+MODEL_IMAGE_SIZE = 1024
+
+
+class ImageRejected(ValueError):
+    """An image refused before it is decoded. The message is shown to the user."""
+
+
+class ImageAnalysisError(Exception):
+    """
+    A submitted photo that could not be analyzed. The message is shown to the user.
+    Defined here rather than in agent.py so a hot reload doesn't replace the class
+    while photos are being analyzed.
+    """
+
+
+def check_image(size=None, width=None, height=None, content_type=None, max_pixels=MAX_IMAGE_PIXELS):
+    """Reject images that are too big to process from whatever is known about them so far."""
+    if content_type and not content_type.startswith("image/"):
+        raise ImageRejected("Please attach an image file (JPEG, PNG or WebP) of your outfit.")
+    if size and size > MAX_IMAGE_BYTES:
+        raise ImageRejected(f"That image is too large ({size / 1024 / 1024:.0f} MB). "
+                            f"Please upload one under {MAX_IMAGE_BYTES / 1024 / 1024:.0f} MB.")
+    if width and height and width * height > max_pixels:
+        raise ImageRejected(f"That image is too large ({width}x{height} pixels). "
+                            f"Please upload one under {max_pixels / 1_000_000:.0f} megapixels.")
+
+
+def estimate_cost(body_bytes, width, height, bands=4):
+    """
+    Peak bytes held while downloading and preprocessing one image.
+
+    Args:
+        body_bytes (int): Size of the downloaded file
+        width (int): Pixel width
+        height (int): Pixel height
+        bands (int): Channels of the decoded image (4 covers RGBA and CMYK)
+    """
+    pixels = width * height
+    scale = min(1.0, MODEL_IMAGE_SIZE / max(width, height, 1))
+    model_pixels = int(pixels * scale * scale)
+    jpeg = model_pixels // 2  # generous upper bound for a JPEG at PIL's default quality
+    return (
+        body_bytes
+        + pixels * bands  # decoded
+        + pixels * 3  # RGB conversion
+        + model_pixels * 3  # resized for the model
+        + jpeg * 3  # JPEG, its base64 string and the request body
+    )
+
+
+def pixel_limit(budget_bytes, body_bytes=MAX_IMAGE_BYTES, bands=4):
+    """
+    Most pixels an image with a `body_bytes` download can have and still fit in
+    `budget_bytes` (the inverse of `estimate_cost`), capped at MAX_IMAGE_PIXELS.
+    """
+    # The resized copy and its encodings take 4.5 bytes per model pixel, and
+    # there are at most MODEL_IMAGE_SIZE squared of those
+    per_pixel = bands + 3
+    large = (budget_bytes - body_bytes - 4.5 * MODEL_IMAGE_SIZE ** 2) / per_pixel
+    pixels = large if large >= MODEL_IMAGE_SIZE ** 2 else (budget_bytes - body_bytes) / (per_pixel + 4.5)
+    return max(0, min(MAX_IMAGE_PIXELS, int(pixels)))
+
+
+class MemoryBudget:
+    def __init__(self, budget_bytes):
+        """
+        Args:
+            budget_bytes (int): Total estimated bytes that admitted jobs may hold at once
+        """
+        self.budget = budget_bytes
+        self.in_use = 0
+        # (cost, future, held), oldest first. `held` is what a growing job already
+        # has reserved; growing jobs queue ahead of jobs that haven't started.
+        self._waiters = deque()
+        self._held_waiting = 0
+
+    @property
+    def max_pixels(self):
+        """Largest image, in pixels, whose estimate fits in the budget."""
+        return pixel_limit(self.budget)
+
+    def _fits(self, cost):
+        return self.in_use + cost <= self.budget
+
+    async def acquire(self, cost, held=0):
+        """
+        Reserve `cost` more bytes, waiting until they fit.
+
+        Args:
+            cost (int): Bytes to add
+            held (int): Bytes the caller already has reserved and keeps while waiting
+        """
+        if held + cost > self.budget:
+            raise ImageRejected("That image is too large to process. Please upload a smaller one.")
+        growing = self._growing()
+        if (not self._waiters or (held and not growing)) and self._fits(cost):
+            self.in_use += cost
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = (cost, future, held)
+        if held:
+            self._waiters.insert(growing, waiter)
+            self._held_waiting += held
+        else:
+            self._waiters.append(waiter)
+        self._wake()  # may be the growing job that leaves nothing else to wait for
+        print(f"Image admission: queued a {cost / 1024 / 1024:.1f} MB job "
+              f"({self.in_use / 1024 / 1024:.1f} of {self.budget / 1024 / 1024:.0f} MB in use, "
+              f"{len(self._waiters)} waiting)")  # Debug log
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(cost)  # admitted just as we were cancelled
+            else:
+                self._waiters.remove(waiter)
+                self._held_waiting -= held
+                self._wake()
+            raise
+
+    def _growing(self):
+        """Number of growing jobs at the head of the queue."""
+        count = 0
+        for _, _, held in self._waiters:
+            if not held:
+                break
+            count += 1
+        return count
+
+    def release(self, cost):
+        self.in_use -= cost
+        self._wake()
+
+    def set_budget(self, budget_bytes):
+        """Change the budget (e.g. after a config reload). Admitted jobs keep their reservations."""
+        self.budget = budget_bytes
+        self._wake()
+
+    def _wake(self):
+        # Strict FIFO: a large job at the head is not overtaken by smaller ones behind it.
+        # If all memory in use belongs to growing jobs that are waiting, none of it will
+        # be released, so the head goes ahead over budget rather than deadlocking.
+        while self._waiters and (self._fits(self._waiters[0][0]) or self.in_use == self._held_waiting):
+            cost, future, held = self._waiters.popleft()
+            self._held_waiting -= held
+            if not future.done():
+                self.in_use += cost
+                future.set_result(None)
+
+    @asynccontextmanager
+    async def reserve(self, cost):
+        """Hold `cost` bytes of the budget for the block. Yields a Reservation that can be resized."""
+        start = time.perf_counter()
+        with stage("admission"):
+            await self.acquire(cost)
+        reservation = Reservation(self, cost, time.perf_counter() - start)
+        try:
+            yield reservation
+        finally:
+            self.release(reservation.cost)
+
+    def snapshot(self):
+        return {"budget": self.budget, "in_use": self.in_use, "waiting": len(self._waiters)}
+
+
+class Reservation:
+    def __init__(self, budget, cost, waited):
+        self.budget = budget
+        self.cost = cost
+        self.waited = waited
+
+    async def resize(self, cost):
+        """
+        Change the reserved amount once the real dimensions are known. When
+        growing, the current reservation (covering the downloaded body) is kept
+        and only the extra is queued for.
+        """
+        if cost <= self.cost:
+            self.budget.release(self.cost - cost)
+        else:
+            with stage("admission"):
+                await self.budget.acquire(cost - self.cost, held=self.cost)
+        self.cost = cost
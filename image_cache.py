@@ -0,0 +1,116 @@
+"""
+Bounded on-disk cache of model-ready outfit images.
+
+`!submit` stores the preprocessed JPEG (RGB, at most 1024px) it sent to the
+vision model under the submission id. `!feedback --image` can then show the
+model the outfit again, without re-downloading from a Discord CDN link that may
+have expired and without transcoding again. The cache is bounded by total size
+and by age. The least recently used images are evicted first, and a read
+counts as a use. Expired images are also swept from `put` at most every
+SWEEP_INTERVAL seconds, so a store that stays under its size cap still drops
+them.
+
+Each DataManager has its own cache, so the limits apply per guild store.
+"""
+import os
+import time
+import threading
+
+
+# Seconds between sweeps for expired images on put
+SWEEP_INTERVAL = 60 * 60
+
+
+class ImageCache:
+    def __init__(self, folder, max_bytes=200 * 1024 * 1024, max_age=30 * 24 * 60 * 60):
+        """
+        Args:
+            folder (str): Folder holding the cached images
+            max_bytes (int): Total size above which the least recently used images are evicted
+            max_age (float): Seconds after which an unused image is evicted
+        """
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._total_bytes = None
+        self._next_sweep = 0.0
+
+    def _path(self, submission_id):
+        return os.path.join(self.folder, f"{submission_id}.jpg")
+
+    def _entries(self):
+        """(last used, size, path) for every cached image."""
+        entries = []
+        if os.path.isdir(self.folder):
+            for entry in os.scandir(self.folder):
+                if entry.name.endswith(".jpg"):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def put(self, submission_id, data):
+        os.makedirs(self.folder, exist_ok=True)
+        path = self._path(submission_id)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+
+        with self._lock:
+            # Replacing an image (e.g. a re-submission) only adds the difference
+            try:
+                replaced = os.path.getsize(path)
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp_path, path)
+
+            now = time.time()
+            if self._total_bytes is not None:
+                self._total_bytes += len(data) - replaced
+            if self._total_bytes is None or self._total_bytes > self.max_bytes or now >= self._next_sweep:
+                self.evict()
+                self._next_sweep = now + SWEEP_INTERVAL
+
+    def get(self, submission_id):
+        """Cached image bytes, or None if the image was never cached or has been evicted."""
+        path = self._path(submission_id)
+        try:
+            with open(path, "rb") as f:
+                # The open file stays readable even if it is evicted meanwhile
+                if time.time() - os.fstat(f.fileno()).st_mtime > self.max_age:
+                    return None
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            pass
+        return data
+
+    def evict(self):
+        """
+        Remove expired images, then the least recently used ones until under max_bytes.
+        `put` calls this with the cache lock held.
+
+        Returns:
+            int: Number of images removed
+        """
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        cutoff = time.time() - self.max_age
+        removed = 0
+        for last_used, size, path in entries:
+            if last_used >= cutoff and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        self._total_bytes = total
+        return removed
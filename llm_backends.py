@@ -0,0 +1,548 @@
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+
+
+DEFAULT_MODEL_NAME = "gemini-1.5-flash"
+
+
+DEFAULT_GEMINI_ENDPOINT = "https://generativelanguage.googleapis.com"
+
+# Prompt tokens Gemini bills for one inline image
+IMAGE_TOKENS = 258
+
+# Smallest prefix (in estimated tokens) worth caching. The API refuses explicit
+# caches below its per-model minimum and only applies implicit caching above it.
+DEFAULT_MIN_CACHE_TOKENS = 1024
+# How long a refused cache is remembered before creating it is tried again
+CACHE_REFUSAL_TTL = 600
+
+
+def min_cache_tokens_setting():
+    return int(os.getenv("PROMPT_CACHE_MIN_TOKENS", str(DEFAULT_MIN_CACHE_TOKENS)))
+
+
+def estimate_tokens(text):
+    """Rough token count of a prompt (about four characters per token)."""
+    return len(text) // 4
+
+
+class CachedPrefix(str):
+    """
+    Prompt text that starts many requests unchanged, such as the instructions for
+    the active trend (see prompts.py). It must be the first part of `contents`.
+    Backends that support context caching register it once and then send only
+    the parts after it. Every other backend treats it as an ordinary prompt string.
+    """
+
+    def __new__(cls, text):
+        prefix = super().__new__(cls, text)
+        prefix.cache_key = hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+        return prefix
+
+
+def cached_prefix(contents):
+    """The CachedPrefix that starts `contents`, or None."""
+    if isinstance(contents, CachedPrefix):
+        return contents
+    if isinstance(contents, (list, tuple)) and contents and isinstance(contents[0], CachedPrefix):
+        return contents[0]
+    return None
+
+
+class BackendResponse:
+    """Minimal stand-in for a Gemini response: only `.text` is used by the agent."""
+
+    def __init__(self, text, usage=None):
+        self.text = text
+        # Token counts reported by the API (usageMetadata), when known
+        self.usage = usage or {}
+
+    def __repr__(self):
+        return f"BackendResponse(text={self.text[:40]!r}...)"
+
+
+class ReplayMissError(LookupError):
+    """Raised when a replay backend has no recording for a request."""
+
+
+class RateLimitedError(RuntimeError):
+    """Raised when the API answers 429. `retry_after` is the suggested wait in seconds, if given."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMBackend:
+    """
+    Interface shared by every model backend.
+
+    Backends mirror the subset of `genai.GenerativeModel` the agent relies on:
+    `generate_content(contents)` returns an object with a `.text` attribute.
+    `contents` is either a prompt string or a list mixing prompt strings and
+    inline image dicts (`{"mime_type": ..., "data": <base64 str>}`). A list may
+    start with a CachedPrefix.
+    """
+
+    name = "base"
+    # True if a leading CachedPrefix is sent once as cached context rather than with every request
+    caches_prefixes = False
+
+    def __init__(self, model_name=DEFAULT_MODEL_NAME):
+        self.model_name = model_name
+
+    def generate_content(self, contents):
+        raise NotImplementedError
+
+
+class GeminiBackend(LLMBackend):
+    """Backend that talks to the real Gemini API."""
+
+    name = "gemini"
+
+    def __init__(self, model_name=DEFAULT_MODEL_NAME, api_key=None):
+        super().__init__(model_name)
+        api_key = api_key or os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY not found in environment variables")
+
+        # Imported here so that offline backends never pay for (or need) the SDK
+        import google.generativeai as genai
+
+        print(f"Initializing Gemini with API key: {api_key[:5]}...")  # Debug log
+        genai.configure(api_key=api_key)
+        self._model = genai.GenerativeModel(model_name)
+
+    def generate_content(self, contents):
+        return self._model.generate_content(contents)
+
+
+def _parse_retry_delay(value):
+    """Seconds from a Retry-After header or a google.rpc.RetryInfo delay ("37s", "1.5s")."""
+    if not value:
+        return None
+    try:
+        return float(str(value).rstrip("s"))
+    except ValueError:
+        return None
+
+
+class GeminiHTTPBackend(LLMBackend):
+    """
+    Backend that calls the Gemini REST API (generateContent) directly.
+
+    Unlike GeminiBackend, which configures the SDK globally, every instance has its
+    own API key and endpoint. This lets ModelPool mix several keys and lets tests
+    point it at a local stub server (see stub_gemini.py). A 429 raises
+    RateLimitedError with the server's suggested retry delay.
+
+    A leading CachedPrefix of at least `min_cache_tokens` is registered as
+    cached context (cachedContents) the first time it is seen and kept for
+    `cache_ttl` seconds. Later requests only send the parts after it. Shorter
+    prefixes, which the API won't cache explicitly, are sent inline first, so
+    the API's implicit prefix caching can still apply to them. The context is
+    created outside the lock that guards the cache table. Calls that arrive
+    while it is being created send the prefix inline instead of waiting, and a
+    refused context is retried after CACHE_REFUSAL_TTL seconds.
+    """
+
+    name = "gemini-http"
+    caches_prefixes = True
+
+    def __init__(self, model_name=DEFAULT_MODEL_NAME, api_key=None, endpoint=DEFAULT_GEMINI_ENDPOINT, timeout=60,
+                 min_cache_tokens=None, cache_ttl=None):
+        super().__init__(model_name)
+        self.api_key = api_key or os.getenv("GEMINI_API_KEY")
+        if not self.api_key:
+            raise ValueError("GEMINI_API_KEY not found in environment variables")
+        self.url = f"{endpoint.rstrip('/')}/v1beta/models/{model_name}:generateContent"
+        self.cache_url = f"{endpoint.rstrip('/')}/v1beta/cachedContents"
+        self.timeout = timeout
+        if min_cache_tokens is None:
+            min_cache_tokens = min_cache_tokens_setting()
+        self.min_cache_tokens = min_cache_tokens
+        self.cache_ttl = cache_ttl or int(os.getenv("PROMPT_CACHE_TTL", "3600"))
+        self._session = None
+        self._caches = {}  # prefix cache key -> (cachedContents name or None if refused, expiry)
+        self._creating = set()  # prefix cache keys whose cached context is being created
+        self._cache_lock = threading.Lock()
+
+    def _post(self, url, body):
+        return self._session.post(url, json=body, headers={"x-goog-api-key": self.api_key}, timeout=self.timeout)
+
+    def _cached_content(self, prefix):
+        """Name of the cached context holding `prefix`, creating it if needed, or None to send it inline."""
+        import requests
+
+        if estimate_tokens(prefix) < self.min_cache_tokens:
+            return None
+        with self._cache_lock:
+            entry = self._caches.get(prefix.cache_key)
+            if entry is not None:
+                name, expiry = entry
+                # A context is renewed a minute before the API would expire it
+                if expiry > time.time() + (60 if name else 0):
+                    return name
+            if prefix.cache_key in self._creating:
+                return None  # another call is creating it
+            self._creating.add(prefix.cache_key)
+
+        name = None
+        expiry = time.time() + CACHE_REFUSAL_TTL
+        try:
+            response = self._post(self.cache_url, {
+                "model": f"models/{self.model_name}",
+                "contents": [{"role": "user", "parts": [{"text": str(prefix)}]}],
+                "ttl": f"{self.cache_ttl}s",
+            })
+            if response.status_code == 200:
+                name = response.json()["name"]
+                expiry = time.time() + self.cache_ttl
+            else:
+                print(f"Prompt cache not created for {self.model_name} ({response.status_code}), sending the prefix inline")  # Debug log
+        except requests.RequestException as e:
+            print(f"Prompt cache not created for {self.model_name} ({str(e)}), sending the prefix inline")  # Debug log
+        finally:
+            with self._cache_lock:
+                self._caches[prefix.cache_key] = (name, expiry)
+                self._creating.discard(prefix.cache_key)
+        return name
+
+    def generate_content(self, contents):
+        import requests
+
+        if self._session is None:
+            self._session = requests.Session()
+
+        # Parts keep their order, so a prefix sent inline still comes first
+        prefix = cached_prefix(contents)
+        cache_name = self._cached_content(prefix) if prefix is not None else None
+        parts = [
+            {"inline_data": {"mime_type": part["mime_type"], "data": part["data"]}} if isinstance(part, dict)
+            else {"text": str(part)}
+            for part in ([contents] if isinstance(contents, str) else contents)
+            if part is not prefix or cache_name is None
+        ]
+        body = {"contents": [{"role": "user", "parts": parts}]}
+        if cache_name:
+            body["cachedContent"] = cache_name
+        response = self._post(self.url, body)
+
+        if cache_name and response.status_code in (400, 403, 404):
+            # The cached context expired or was deleted; it is created again on the next call
+            print(f"Prompt cache {cache_name} is gone ({response.status_code}), sending the prefix inline")  # Debug log
+            with self._cache_lock:
+                self._caches.pop(prefix.cache_key, None)
+            response = self._post(self.url, {"contents": [{"role": "user", "parts": [{"text": str(prefix)}] + parts}]})
+
+        if response.status_code == 429:
+            retry_after = _parse_retry_delay(response.headers.get("Retry-After"))
+            try:
+                for detail in response.json().get("error", {}).get("details", []):
+                    retry_after = _parse_retry_delay(detail.get("retryDelay")) or retry_after
+            except ValueError:
+                pass
+            raise RateLimitedError(f"429 rate limited on {self.model_name}", retry_after)
+        response.raise_for_status()
+
+        data = response.json()
+        candidates = data.get("candidates") or [{}]
+        text = "".join(part.get("text", "") for part in candidates[0].get("content", {}).get("parts", []))
+        return BackendResponse(text, usage=data.get("usageMetadata"))
+
+
+# Canned outputs used by FakeBackend. The submit analysis follows the exact
+# format requested in MistralAgent.handle_submit_command so the rating regexes
+# exercise the same code path as real responses.
+FAKE_ANALYSIS_TEMPLATE = """## Visual Inventory
+- Top: {top}
+- Bottom: {bottom}
+- Footwear: {footwear}
+- Accessories: {accessories}
+- Colors: {colors}
+
+## Style Analysis
+This outfit leans into the trend with a {adjective} take on the key pieces.
+
+## Ratings
+Trend Accuracy: {trend_accuracy}/10
+The silhouette and palette match the brief.
+
+Creativity: {creativity}/10
+Some unexpected pairings keep it interesting.
+
+Overall Fit: {fit}/10
+Proportions are balanced and the pieces sit well.
+
+## Summary
+A {adjective} outfit that reads clearly as the trend.
+
+## Improvement Tips
+- Add one statement accessory
+- Try a contrasting shoe to anchor the look"""
+
+FAKE_TEXT_RESPONSES = [
+    "Great question! Try pairing neutral basics with one bold accessory to make the look feel intentional.",
+    "Layering is your friend here: a light jacket over a fitted top adds depth without bulk.",
+    "Play with texture - mixing knit, denim and leather keeps a simple palette from feeling flat.",
+    "Balance the proportions: if the top is oversized, keep the bottom streamlined, and vice versa.",
+]
+
+FAKE_ITEMS = {
+    "top": ["white cropped tee", "oversized grey hoodie", "black blazer", "pink baby tee"],
+    "bottom": ["low-rise denim jeans", "pleated plaid skirt", "black cargo pants", "linen trousers"],
+    "footwear": ["chunky white sneakers", "combat boots", "ballet flats", "not visible"],
+    "accessories": ["silver hoops", "baseball cap", "leather belt", "none visible"],
+    "colors": ["white, blue", "grey, black", "black, camel", "pink, silver"],
+    "adjective": ["confident", "playful", "polished", "relaxed"],
+}
+
+
+def parse_latency_spec(spec):
+    """
+    Parse a latency distribution spec into (kind, params).
+
+    Supported forms (seconds):
+        "0" / "fixed:0.2"          - constant latency
+        "uniform:0.1,0.5"          - uniform between low and high
+        "normal:0.8,0.2"           - gaussian mean, stddev (clamped at 0)
+        "lognormal:-0.3,0.4"       - lognormal mu, sigma (long tail like real APIs)
+    """
+    if spec is None or spec == "":
+        return "fixed", (0.0,)
+    if isinstance(spec, (int, float)):
+        return "fixed", (float(spec),)
+
+    if ":" not in spec:
+        return "fixed", (float(spec),)
+
+    kind, _, raw_params = spec.partition(":")
+    kind = kind.strip().lower()
+    params = tuple(float(p) for p in raw_params.split(",") if p.strip())
+    expected = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+    if kind not in expected:
+        raise ValueError(f"Unknown latency distribution '{kind}'")
+    if len(params) != expected[kind]:
+        raise ValueError(f"Latency distribution '{kind}' expects {expected[kind]} parameter(s)")
+    return kind, params
+
+
+def sample_latency(rng, kind, params):
+    if kind == "fixed":
+        return params[0]
+    if kind == "uniform":
+        return rng.uniform(params[0], params[1])
+    if kind == "normal":
+        return max(0.0, rng.gauss(params[0], params[1]))
+    if kind == "lognormal":
+        return rng.lognormvariate(params[0], params[1])
+    raise ValueError(f"Unknown latency distribution '{kind}'")
+
+
+def _split_contents(contents):
+    """Return (prompt text, list of image dicts) for either content form."""
+    if isinstance(contents, str):
+        return contents, []
+    texts = []
+    images = []
+    for part in contents:
+        if isinstance(part, dict):
+            images.append(part)
+        else:
+            texts.append(str(part))
+    return "\n".join(texts), images
+
+
+def request_key(model_name, contents):
+    """Stable hash of a request, used to address recordings and seed fakes."""
+    prompt, images = _split_contents(contents)
+    digest = hashlib.sha256()
+    digest.update(model_name.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(prompt.encode("utf-8"))
+    for image in images:
+        digest.update(b"\0")
+        digest.update(str(image.get("mime_type", "")).encode("utf-8"))
+        digest.update(str(image.get("data", "")).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class FakeBackend(LLMBackend):
+    """
+    Deterministic offline backend for tests and load generation.
+
+    The same request always yields the same text, ratings and latency for a given
+    seed, so benchmark runs are comparable. Requests with an image return a full
+    structured outfit analysis; text-only requests return a short canned answer.
+    Responses carry estimated usageMetadata. A CachedPrefix seen before is
+    reported as cached tokens, the way the API reports implicit cache hits, if
+    it is at least `min_cache_tokens` long (the same threshold GeminiHTTPBackend
+    uses, so offline savings aren't overstated).
+    """
+
+    name = "fake"
+
+    def __init__(self, model_name=DEFAULT_MODEL_NAME, latency="fixed:0", seed=0,
+                 error_rate=0.0, sleep=time.sleep, min_cache_tokens=None):
+        super().__init__(model_name)
+        self.latency_kind, self.latency_params = parse_latency_spec(latency)
+        self.seed = seed
+        self.error_rate = error_rate
+        self._sleep = sleep
+        self.calls = 0
+        self.min_cache_tokens = min_cache_tokens_setting() if min_cache_tokens is None else min_cache_tokens
+        self._seen_prefixes = set()
+
+    def _rng(self, key):
+        return random.Random(f"{self.seed}:{key}")
+
+    def generate_content(self, contents):
+        self.calls += 1
+        key = request_key(self.model_name, contents)
+        rng = self._rng(key)
+
+        delay = sample_latency(rng, self.latency_kind, self.latency_params)
+        if delay > 0:
+            self._sleep(delay)
+
+        if self.error_rate and rng.random() < self.error_rate:
+            raise RateLimitedError("FakeBackend injected error (429 Resource has been exhausted)")
+
+        prompt, images = _split_contents(contents)
+        if images:
+            text = self._fake_analysis(rng)
+        else:
+            text = rng.choice(FAKE_TEXT_RESPONSES)
+
+        prefix = cached_prefix(contents)
+        cached = 0
+        if prefix is not None and estimate_tokens(prefix) >= self.min_cache_tokens:
+            if prefix.cache_key in self._seen_prefixes:
+                cached = estimate_tokens(prefix)
+            if len(self._seen_prefixes) >= 4096:
+                self._seen_prefixes.clear()
+            self._seen_prefixes.add(prefix.cache_key)
+        prompt_tokens = estimate_tokens(prompt) + IMAGE_TOKENS * len(images)
+        return BackendResponse(text, usage={
+            "promptTokenCount": prompt_tokens,
+            "cachedContentTokenCount": cached,
+            "candidatesTokenCount": estimate_tokens(text),
+            "totalTokenCount": prompt_tokens + estimate_tokens(text),
+        })
+
+    def _fake_analysis(self, rng):
+        fields = {field: rng.choice(options) for field, options in FAKE_ITEMS.items()}
+        fields["trend_accuracy"] = rng.randint(4, 10)
+        fields["creativity"] = rng.randint(4, 10)
+        fields["fit"] = rng.randint(4, 10)
+        return FAKE_ANALYSIS_TEMPLATE.format(**fields)
+
+
+class RecordReplayBackend(LLMBackend):
+    """
+    Wraps another backend and captures its responses to disk, or replays them.
+
+    In "record" mode each request is forwarded to `inner` and the response text and
+    observed latency are written to `<directory>/<request hash>.json`. In "replay"
+    mode responses are served from those files without touching the network;
+    with `replay_latency=True` the recorded latency is slept to reproduce timing.
+    """
+
+    name = "record"
+
+    def __init__(self, directory, mode="replay", inner=None, model_name=DEFAULT_MODEL_NAME,
+                 replay_latency=False, sleep=time.sleep):
+        if mode not in ("record", "replay"):
+            raise ValueError("mode must be 'record' or 'replay'")
+        if mode == "record" and inner is None:
+            raise ValueError("record mode needs an inner backend to forward requests to")
+        super().__init__(inner.model_name if inner else model_name)
+        self.directory = directory
+        self.mode = mode
+        self.inner = inner
+        self.replay_latency = replay_latency
+        self._sleep = sleep
+
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def generate_content(self, contents):
+        key = request_key(self.model_name, contents)
+        path = self._path(key)
+
+        if self.mode == "replay":
+            try:
+                with open(path, "r") as f:
+                    recording = json.load(f)
+            except FileNotFoundError:
+                raise ReplayMissError(f"No recording for request {key[:12]} in {self.directory}")
+            if self.replay_latency and recording.get("latency"):
+                self._sleep(recording["latency"])
+            return BackendResponse(recording["text"])
+
+        start = time.perf_counter()
+        response = self.inner.generate_content(contents)
+        latency = time.perf_counter() - start
+
+        prompt, images = _split_contents(contents)
+        recording = {
+            "model": self.model_name,
+            "prompt": prompt,
+            "images": len(images),
+            "text": response.text,
+            "latency": latency,
+            "recorded_at": time.time(),
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(recording, f, indent=4)
+        os.replace(tmp_path, path)
+        return response
+
+
+def create_backend(model_name=DEFAULT_MODEL_NAME, kind=None):
+    """
+    Build a backend from environment configuration.
+
+    LLM_BACKEND selects the implementation: "gemini" (default), "fake",
+    "record" (call Gemini and save responses), "replay" (serve saved responses)
+    or "pool" (several keys and models, see model_pool.py).
+    FAKE_LLM_LATENCY / FAKE_LLM_SEED / FAKE_LLM_ERROR_RATE tune the fake backend,
+    LLM_RECORD_DIR sets where recordings live, and LLM_REPLAY_LATENCY=1 makes
+    replay reproduce recorded timings.
+    """
+    kind = (kind or os.getenv("LLM_BACKEND") or "gemini").lower()
+
+    if kind == "gemini":
+        return GeminiBackend(model_name)
+    if kind == "pool":
+        # Text and vision share one pool so quotas are counted once per key
+        from model_pool import shared_pool
+        return shared_pool(model_name)
+    if kind == "fake":
+        return FakeBackend(
+            model_name,
+            latency=os.getenv("FAKE_LLM_LATENCY", "fixed:0"),
+            seed=int(os.getenv("FAKE_LLM_SEED", "0")),
+            error_rate=float(os.getenv("FAKE_LLM_ERROR_RATE", "0")),
+        )
+
+    record_dir = os.getenv("LLM_RECORD_DIR", os.path.join("data", "recordings"))
+    if kind == "record":
+        return RecordReplayBackend(record_dir, mode="record", inner=GeminiBackend(model_name))
+    if kind == "replay":
+        return RecordReplayBackend(
+            record_dir,
+            mode="replay",
+            model_name=model_name,
+            replay_latency=os.getenv("LLM_REPLAY_LATENCY", "0") == "1",
+        )
+
+    raise ValueError(f"Unknown LLM_BACKEND '{kind}'")
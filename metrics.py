@@ -0,0 +1,277 @@
+"""
+In-process metrics and per-message tracing.
+
+Counters and latency histograms are kept in a small registry and exposed in
+Prometheus text format, together with recent traces as JSON, from a local HTTP
+endpoint (see `start_metrics_server`). A trace is opened per incoming message
+with `trace_message`; every `stage`/`storage` span recorded while it is active
+(in the same asyncio task) is attached to it, so one message id ties together
+download, preprocessing, model calls, DataManager loads/saves and the Discord send.
+"""
+import json
+import time
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        return self._values.get(key, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = [0] * len(self.buckets) + [0.0, 0]
+                self._series[key] = series
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        series = self._series.get(key)
+        return series[-1] if series else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, bucket_count in zip(self.buckets, series):
+                    labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+                labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def _register(self, metric):
+        # A module imported again (hot reload) gets its existing metric and values back
+        for existing in self._metrics:
+            if existing.name == metric.name:
+                return existing
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+COMMANDS_TOTAL = REGISTRY.counter(
+    "fashionbot_commands_total", "Messages handled, by command and outcome.", ["command", "outcome"])
+COMMAND_LATENCY = REGISTRY.histogram(
+    "fashionbot_command_seconds", "End-to-end handling time per message, by command.", ["command"])
+STAGE_LATENCY = REGISTRY.histogram(
+    "fashionbot_stage_seconds", "Time spent in each processing stage.", ["stage"])
+STORAGE_LATENCY = REGISTRY.histogram(
+    "fashionbot_storage_seconds", "DataManager JSON load/save time, by file.", ["op", "file"])
+STAGE_ERRORS = REGISTRY.counter(
+    "fashionbot_stage_errors_total", "Stages that raised, by stage.", ["stage"])
+
+
+# TRACING
+
+class Trace:
+    def __init__(self, message_id, command):
+        self.message_id = message_id
+        self.command = command
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+        self.outcome = None
+        self.spans = []
+
+    def add_span(self, name, start, duration, error=None, **labels):
+        self.spans.append({
+            "name": name,
+            "offset_ms": (start - self._start) * 1000,
+            "duration_ms": duration * 1000,
+            "error": error,
+            **labels,
+        })
+
+    def to_dict(self):
+        return {
+            "message_id": self.message_id,
+            "command": self.command,
+            "started_at": self.started_at,
+            "duration_ms": self.duration * 1000 if self.duration is not None else None,
+            "outcome": self.outcome,
+            "spans": list(self.spans),
+        }
+
+
+_current_trace = contextvars.ContextVar("fashionbot_trace", default=None)
+_recent_traces = deque(maxlen=500)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def recent_traces(message_id=None):
+    traces = list(_recent_traces)
+    if message_id is not None:
+        traces = [trace for trace in traces if str(trace.message_id) == str(message_id)]
+    return [trace.to_dict() for trace in traces]
+
+
+@contextmanager
+def trace_message(message_id, command):
+    """
+    Open a trace for one incoming message and record its command-level metrics.
+
+    The yielded Trace's `outcome` defaults to "ok", or "error" if the body raises;
+    callers may set it to something more specific (e.g. "error_reply").
+    """
+    trace = Trace(message_id, command)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    except BaseException:
+        trace.outcome = "error"
+        raise
+    finally:
+        _current_trace.reset(token)
+        trace.duration = time.perf_counter() - trace._start
+        trace.outcome = trace.outcome or "ok"
+        COMMAND_LATENCY.observe(trace.duration, command=command)
+        COMMANDS_TOTAL.inc(command=command, outcome=trace.outcome)
+        _recent_traces.append(trace)
+
+
+@contextmanager
+def span(name, histogram=None, **labels):
+    """Time a block, record it in `histogram` and attach it to the active trace."""
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        if histogram is not None:
+            histogram.observe(duration, **labels)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_span(name, start, duration, error=error, **labels)
+
+
+@contextmanager
+def stage(name):
+    """Time a processing stage: download, preprocess, model_call, discord_send, ..."""
+    try:
+        with span(name, STAGE_LATENCY, stage=name):
+            yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage=name)
+        raise
+
+
+def storage(op, file):
+    """Time a DataManager load or save of `file` (a basename like users.json)."""
+    return span(f"storage_{op}", STORAGE_LATENCY, op=op, file=file)
+
+
+# HTTP ENDPOINT
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/metrics":
+            body = REGISTRY.render().encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif url.path == "/traces":
+            message_id = parse_qs(url.query).get("message_id", [None])[0]
+            body = json.dumps(recent_traces(message_id), indent=2).encode("utf-8")
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would otherwise flood stderr
+        pass
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """Serve /metrics (Prometheus text) and /traces (JSON) from a daemon thread."""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,95 @@
+"""
+Rewrite stored data in the compact record format (or back to the legacy layout).
+
+DataManager reads both formats, so migrating is optional: files are converted
+the next time they are saved anyway. Running this converts everything at once,
+including guild stores that are rarely written. The original of every rewritten
+file is kept next to it as <name>.bak.
+
+Migrating to the compact format also moves large analyses and AI responses into
+the blob store, and deletes blobs that nothing references any more. Going back
+to --legacy puts the text inline again.
+
+Usage:
+    python migrate_data.py                 # data/ and data/guilds/*
+    python migrate_data.py --legacy        # roll back to indented dict-of-dicts JSON
+    python migrate_data.py --data-dir other_data --no-backup
+    python migrate_data.py --archive       # also move old trends/competitions to the archive
+"""
+import os
+import shutil
+import argparse
+
+from data_manager import DataManager
+
+
+def store_folders(base_folder):
+    """The top-level store plus every per-guild store under <base>/guilds."""
+    folders = [base_folder]
+    guilds_folder = os.path.join(base_folder, "guilds")
+    if os.path.isdir(guilds_folder):
+        for name in sorted(os.listdir(guilds_folder)):
+            path = os.path.join(guilds_folder, name)
+            if os.path.isdir(path):
+                folders.append(path)
+    return folders
+
+
+def migrate_store(folder, compact=True, backup=True, archive=False):
+    """
+    Rewrite one store's files in the requested format.
+
+    Returns:
+        list: (file name, size before, size after) for each rewritten file
+    """
+    names = [name for name in ("trends.json", "users.json", "competitions.json", "chat_history.json")
+             if os.path.exists(os.path.join(folder, name))]
+    dm = DataManager(folder, compact=compact)
+    sizes = {}
+    with dm._lock:
+        for name in names:
+            path = os.path.join(folder, name)
+            sizes[name] = os.path.getsize(path)
+            data = dm._load_json(path)
+            if backup:
+                shutil.copy2(path, path + ".bak")
+            dm._save_json(path, data)
+
+        moved = dm.relocate_text(to_blobs=compact)
+        removed = dm.sweep_blobs() if compact else 0
+        if moved or removed:
+            print(f"{folder}: moved {moved} texts {'into' if compact else 'out of'} the blob store, "
+                  f"removed {removed} unused blobs")
+        if archive:
+            archived = dm.archive_old_history()
+            if archived:
+                print(f"{folder}: archived {archived} past trends/competitions")
+
+    return [(name, sizes[name], os.path.getsize(os.path.join(folder, name))) for name in names]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert DataManager stores between storage formats.")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--legacy", action="store_true", help="Write the legacy indented layout instead")
+    parser.add_argument("--no-backup", action="store_true", help="Don't keep .bak copies of the originals")
+    parser.add_argument("--archive", action="store_true",
+                        help="Also move past trends and competitions beyond ARCHIVE_KEEP_RECENT to the archive")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.data_dir):
+        print(f"No data folder at {args.data_dir}")
+        return
+
+    total_before = total_after = 0
+    for folder in store_folders(args.data_dir):
+        results = migrate_store(folder, compact=not args.legacy, backup=not args.no_backup, archive=args.archive)
+        for name, before, after in results:
+            total_before += before
+            total_after += after
+            print(f"{os.path.join(folder, name):<50} {before:>10,} -> {after:>10,} bytes")
+    print(f"Total: {total_before:,} -> {total_after:,} bytes")
+
+
+if __name__ == "__main__":
+    main()
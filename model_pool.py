@@ -0,0 +1,296 @@
+"""
+Quota-aware pool of Gemini API keys and models.
+
+With LLM_BACKEND=pool, every combination of a key in GEMINI_API_KEYS and a model
+in GEMINI_MODELS becomes a pool member with its own quota accounting. Each
+member tracks requests and tokens in the last minute, requests today, calls in
+flight and a 429 cooldown. Each call goes to the best member that still has
+quota: the one with the fewest calls in flight ("least-loaded") or the one with
+the most quota left ("remaining-quota"). A 429 puts that member on exponential
+backoff (or the server's retry delay, but at least the base backoff) and the
+call is retried on another member. Only when every member is out of quota does
+the call wait, up to GEMINI_POOL_MAX_WAIT seconds, before failing with
+PoolExhaustedError. A call also fails once it has been rate limited
+GEMINI_POOL_MAX_ATTEMPTS times, or when its wait has run out.
+
+Per-member usage is exported as fashionbot_model_requests_total and shown by
+`!debug models`. stub_gemini.py runs the pool against a local stub server.
+"""
+import os
+import time
+import random
+import threading
+from collections import deque
+from datetime import datetime, timezone
+
+from metrics import REGISTRY
+from llm_backends import LLMBackend, GeminiHTTPBackend, RateLimitedError, DEFAULT_GEMINI_ENDPOINT, DEFAULT_MODEL_NAME
+
+
+MODEL_REQUESTS = REGISTRY.counter(
+    "fashionbot_model_requests_total", "Model calls per pool member, by outcome.", ["key", "model", "outcome"])
+
+STRATEGIES = ("least-loaded", "remaining-quota")
+
+
+class PoolExhaustedError(RuntimeError):
+    """Raised when no pool member has quota left within the allowed wait."""
+
+
+def is_rate_limit(error):
+    """True for 429s from GeminiHTTPBackend, FakeBackend (RateLimitedError) or the Gemini SDK (ResourceExhausted)."""
+    if isinstance(error, RateLimitedError):
+        return True
+    return getattr(error, "code", None) == 429 or getattr(error, "status_code", None) == 429
+
+
+class PoolMember:
+    def __init__(self, label, backend, rpm=15, rpd=1500, tpm=0):
+        """
+        Args:
+            label (str): Name used in metrics and reports (never the full key)
+            backend (LLMBackend): Backend bound to one key and model
+            rpm (int): Requests per minute allowed for this key and model
+            rpd (int): Requests per day
+            tpm (int): Tokens per minute, 0 for no limit
+        """
+        self.label = label
+        self.backend = backend
+        self.model_name = backend.model_name
+        self.rpm = rpm
+        self.rpd = rpd
+        self.tpm = tpm
+        self.in_flight = 0
+        self.recent = deque()  # (start time, tokens) of calls in the last minute
+        self.day = None
+        self.today = 0
+        self.cooldown_until = 0.0
+        self.backoffs = 0  # consecutive 429s
+        self.requests = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self.tokens = 0
+
+    def _expire(self, now):
+        while self.recent and now - self.recent[0][0] >= 60:
+            self.recent.popleft()
+        day = datetime.now(timezone.utc).date()
+        if day != self.day:
+            self.day = day
+            self.today = 0
+
+    def available_at(self, now):
+        """
+        Earliest time this member can take a call: `now` if it can right away, or
+        None if today's quota is used up.
+        """
+        self._expire(now)
+        if self.today >= self.rpd:
+            return None
+        at = max(now, self.cooldown_until)
+        if len(self.recent) >= self.rpm:
+            at = max(at, self.recent[len(self.recent) - self.rpm][0] + 60)
+        if self.tpm and sum(tokens for _, tokens in self.recent) >= self.tpm:
+            at = max(at, self.recent[0][0] + 60)
+        return at
+
+    def remaining(self):
+        """Fraction of the tighter of the minute and day quotas still unused."""
+        return min(1 - len(self.recent) / self.rpm, 1 - self.today / self.rpd)
+
+    def usage(self, now):
+        return {
+            "key": self.label,
+            "model": self.model_name,
+            "requests": self.requests,
+            "rate_limited": self.rate_limited,
+            "errors": self.errors,
+            "tokens": self.tokens,
+            "in_flight": self.in_flight,
+            "last_minute": len(self.recent),
+            "today": self.today,
+            "cooling_down": max(0.0, self.cooldown_until - now),
+        }
+
+
+class ModelPool(LLMBackend):
+    """Backend that spreads calls over several keys and models."""
+
+    name = "pool"
+
+    def __init__(self, members, strategy="least-loaded", max_wait=5.0, base_backoff=1.0,
+                 max_backoff=60.0, max_attempts=6, sleep=time.sleep, clock=time.monotonic):
+        """
+        Args:
+            members (list): PoolMember objects
+            strategy (str): "least-loaded" or "remaining-quota"
+            max_wait (float): Longest a call waits for quota before PoolExhaustedError
+            base_backoff (float): First cooldown after a 429 without a retry delay; doubles per repeat.
+                Also the shortest cooldown, so a retry delay of 0 can't cause a busy loop
+            max_backoff (float): Cap on the cooldown
+            max_attempts (int): Rate limited attempts after which a call fails
+        """
+        if not members:
+            raise ValueError("A model pool needs at least one member")
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown pool strategy '{strategy}' (expected one of {', '.join(STRATEGIES)})")
+        super().__init__(members[0].model_name)
+        self.members = members
+        self.strategy = strategy
+        self.max_wait = max_wait
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+        self._sleep = sleep
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def _acquire(self, deadline):
+        """Reserve quota on the best available member, waiting until `deadline` if none has any."""
+        while True:
+            with self._lock:
+                now = self._clock()
+                times = [(member.available_at(now), member) for member in self.members]
+                ready = [member for at, member in times if at is not None and at <= now]
+                if ready:
+                    if self.strategy == "least-loaded":
+                        member = min(ready, key=lambda m: (m.in_flight, len(m.recent) / m.rpm))
+                    else:
+                        member = max(ready, key=lambda m: (m.remaining(), -m.in_flight))
+                    member.in_flight += 1
+                    member.today += 1
+                    member.recent.append((now, 0))
+                    return member, member.recent[-1]
+
+                pending = [at for at, _ in times if at is not None]
+                if not pending:
+                    raise PoolExhaustedError("Every key in the model pool has used up its daily quota")
+                wake = min(pending)
+            if wake > deadline:
+                raise PoolExhaustedError(f"No model pool quota available within {self.max_wait:g}s")
+            self._sleep(wake - now)
+
+    def _release(self, member, slot, error=None, usage=None):
+        with self._lock:
+            member.in_flight -= 1
+            if error is None:
+                tokens = (usage or {}).get("totalTokenCount", 0)
+                member.requests += 1
+                member.tokens += tokens
+                member.backoffs = 0
+                if tokens and slot in member.recent:
+                    member.recent[member.recent.index(slot)] = (slot[0], tokens)
+                MODEL_REQUESTS.inc(key=member.label, model=member.model_name, outcome="ok")
+            elif is_rate_limit(error):
+                # The rejected call doesn't count against quota, the cooldown does the limiting
+                member.today -= 1
+                if slot in member.recent:
+                    member.recent.remove(slot)
+                member.rate_limited += 1
+                delay = getattr(error, "retry_after", None)
+                if delay is None:
+                    delay = min(self.max_backoff, self.base_backoff * 2 ** member.backoffs)
+                    delay *= random.uniform(0.8, 1.2)
+                delay = max(delay, self.base_backoff)
+                member.backoffs += 1
+                member.cooldown_until = self._clock() + delay
+                MODEL_REQUESTS.inc(key=member.label, model=member.model_name, outcome="rate_limited")
+                print(f"Model pool: {member.label}/{member.model_name} rate limited, cooling down {delay:.1f}s")  # Debug log
+            else:
+                member.errors += 1
+                MODEL_REQUESTS.inc(key=member.label, model=member.model_name, outcome="error")
+
+    def generate_content(self, contents):
+        deadline = self._clock() + self.max_wait
+        attempts = 0
+        while True:
+            member, slot = self._acquire(deadline)
+            try:
+                response = member.backend.generate_content(contents)
+            except Exception as e:
+                self._release(member, slot, error=e)
+                if not is_rate_limit(e):
+                    raise
+                attempts += 1
+                if attempts >= self.max_attempts:
+                    raise PoolExhaustedError(f"Rate limited {attempts} times in a row by the model pool") from e
+                if self._clock() >= deadline:
+                    raise PoolExhaustedError(f"No model pool quota available within {self.max_wait:g}s") from e
+                continue  # another member (or this one after its cooldown)
+            self._release(member, slot, usage=getattr(response, "usage", None))
+            return response
+
+    def usage(self):
+        """Per-member usage counters, in member order."""
+        with self._lock:
+            now = self._clock()
+            for member in self.members:
+                member._expire(now)
+            return [member.usage(now) for member in self.members]
+
+    def format_usage(self):
+        lines = ["**Model pool usage**", f"Strategy: {self.strategy}"]
+        for usage in self.usage():
+            line = (f"- `{usage['key']}` {usage['model']}: {usage['requests']} ok, "
+                    f"{usage['rate_limited']} rate limited, {usage['errors']} errors, "
+                    f"{usage['tokens']} tokens, {usage['last_minute']} in the last minute, "
+                    f"{usage['today']} today")
+            if usage["cooling_down"]:
+                line += f", cooling down {usage['cooling_down']:.0f}s"
+            lines.append(line)
+        return "\n".join(lines)
+
+
+def _key_label(index, api_key):
+    return f"key{index + 1}-{api_key[-4:]}"
+
+
+def pool_from_env(model_name=DEFAULT_MODEL_NAME, backend_factory=None):
+    """
+    Build a ModelPool from the environment.
+
+    GEMINI_API_KEYS (comma-separated, falls back to GEMINI_API_KEY) and
+    GEMINI_MODELS (falls back to `model_name`) define the members. Every member
+    gets the per-key limits GEMINI_RPM, GEMINI_RPD and GEMINI_TPM. GEMINI_ENDPOINT
+    points at a stub server for testing, and LLM_POOL_STRATEGY and
+    GEMINI_POOL_MAX_WAIT and GEMINI_POOL_MAX_ATTEMPTS tune routing and retries.
+    """
+    keys = [key.strip() for key in os.getenv("GEMINI_API_KEYS", os.getenv("GEMINI_API_KEY", "")).split(",") if key.strip()]
+    if not keys:
+        raise ValueError("GEMINI_API_KEYS (or GEMINI_API_KEY) not found in environment variables")
+    models = [model.strip() for model in os.getenv("GEMINI_MODELS", model_name).split(",") if model.strip()]
+    endpoint = os.getenv("GEMINI_ENDPOINT", DEFAULT_GEMINI_ENDPOINT)
+    if backend_factory is None:
+        backend_factory = lambda key, model: GeminiHTTPBackend(model, api_key=key, endpoint=endpoint)
+
+    members = [
+        PoolMember(
+            _key_label(index, key),
+            backend_factory(key, model),
+            rpm=int(os.getenv("GEMINI_RPM", "15")),
+            rpd=int(os.getenv("GEMINI_RPD", "1500")),
+            tpm=int(os.getenv("GEMINI_TPM", "0")),
+        )
+        for index, key in enumerate(keys)
+        for model in models
+    ]
+    print(f"Model pool: {len(keys)} keys x {len(models)} models via {endpoint}")  # Debug log
+    return ModelPool(
+        members,
+        strategy=os.getenv("LLM_POOL_STRATEGY", "least-loaded"),
+        max_wait=float(os.getenv("GEMINI_POOL_MAX_WAIT", "5")),
+        max_attempts=int(os.getenv("GEMINI_POOL_MAX_ATTEMPTS", "6")),
+    )
+
+
+_shared_pools = {}
+_shared_lock = threading.Lock()
+
+
+def shared_pool(model_name=DEFAULT_MODEL_NAME):
+    """The process-wide pool for `model_name`, built from the environment on first use."""
+    with _shared_lock:
+        pool = _shared_pools.get(model_name)
+        if pool is None:
+            pool = _shared_pools[model_name] = pool_from_env(model_name)
+        return pool
@@ -0,0 +1,204 @@
+"""
+Local pre-analysis of outfit photos: dominant colours and basic image statistics.
+
+During `!submit` preprocessing, `image_profile` runs a small weighted k-means
+(NumPy) over a downsampled copy of the photo. Pixels are weighted towards the
+centre, where the outfit usually is, and away from the background. Each cluster
+is named after the nearest colour in COLOR_NAMES, measured in CIELAB. Brightness,
+contrast, saturation and the aspect ratio are measured as well. The result goes
+into the vision prompt, so the model no longer enumerates colours itself, and
+into the stored submission. The "Colors" line of every analysis then comes from
+the measurement, and colour statistics (`!stats colors`) need no model call.
+A submission with several photos stores their average (`merge_profiles`).
+"""
+import numpy as np
+
+
+SAMPLE_SIZE = 64
+CLUSTERS = 6
+ITERATIONS = 12
+# Clusters smaller than this share of the (weighted) image are not reported
+MIN_SHARE = 0.04
+
+COLOR_NAMES = {
+    "black": (20, 20, 20),
+    "charcoal": (60, 60, 64),
+    "grey": (128, 128, 128),
+    "light grey": (196, 196, 196),
+    "white": (245, 245, 245),
+    "cream": (240, 230, 200),
+    "beige": (215, 195, 160),
+    "camel": (190, 145, 90),
+    "brown": (110, 70, 40),
+    "khaki": (170, 160, 110),
+    "olive": (110, 115, 50),
+    "green": (50, 140, 60),
+    "sage": (150, 170, 130),
+    "teal": (20, 120, 120),
+    "navy": (25, 35, 80),
+    "blue": (40, 80, 180),
+    "denim blue": (80, 110, 150),
+    "light blue": (150, 190, 230),
+    "purple": (110, 50, 140),
+    "lavender": (190, 170, 220),
+    "pink": (235, 140, 180),
+    "hot pink": (230, 40, 140),
+    "burgundy": (110, 20, 40),
+    "red": (200, 30, 40),
+    "orange": (235, 120, 30),
+    "rust": (170, 80, 40),
+    "mustard": (210, 170, 40),
+    "yellow": (245, 220, 60),
+    "silver": (175, 180, 185),
+    "gold": (200, 165, 70),
+}
+
+
+def _to_lab(rgb):
+    """sRGB values in 0..1 (shape (..., 3)) to CIELAB."""
+    linear = np.where(rgb > 0.04045, ((rgb + 0.055) / 1.055) ** 2.4, rgb / 12.92)
+    xyz = linear @ np.array([[0.4124, 0.2126, 0.0193],
+                             [0.3576, 0.7152, 0.1192],
+                             [0.1805, 0.0722, 0.9505]], dtype=np.float32)
+    xyz /= np.array([0.9505, 1.0, 1.089], dtype=np.float32)
+    f = np.where(xyz > 0.008856, np.cbrt(xyz), 7.787 * xyz + 16 / 116)
+    return np.stack([116 * f[..., 1] - 16, 500 * (f[..., 0] - f[..., 1]), 200 * (f[..., 1] - f[..., 2])], axis=-1)
+
+
+_NAMES = list(COLOR_NAMES)
+_NAME_LAB = _to_lab(np.array(list(COLOR_NAMES.values()), dtype=np.float32) / 255.0)
+
+
+def color_name(lab):
+    return _NAMES[int(np.argmin(((_NAME_LAB - lab) ** 2).sum(axis=1)))]
+
+
+def _kmeans(points, weights, k, iterations, rng):
+    """Weighted k-means with k-means++ seeding. Returns (centres, labels)."""
+    centres = [points[rng.choice(len(points), p=weights / weights.sum())]]
+    for _ in range(1, k):
+        distances = np.min(((points[:, None, :] - np.array(centres)[None]) ** 2).sum(axis=2), axis=1)
+        probabilities = distances * weights
+        if probabilities.sum() == 0:
+            break
+        centres.append(points[rng.choice(len(points), p=probabilities / probabilities.sum())])
+    centres = np.array(centres)
+
+    for _ in range(iterations):
+        labels = np.argmin(((points[:, None, :] - centres[None]) ** 2).sum(axis=2), axis=1)
+        totals = np.bincount(labels, weights=weights, minlength=len(centres))
+        updated = np.stack([
+            np.bincount(labels, weights=weights * points[:, axis], minlength=len(centres)) for axis in range(3)
+        ], axis=1)
+        filled = totals > 0
+        updated[filled] /= totals[filled, None]
+        updated[~filled] = centres[~filled]
+        if np.allclose(updated, centres, atol=0.5):
+            break
+        centres = updated
+    return centres, labels
+
+
+def image_profile(img):
+    """
+    Dominant colours and basic statistics of a PIL image.
+
+    Returns:
+        dict: colors (list of {"name", "hex", "share"}, largest first), brightness,
+        contrast and saturation (0-1), width, height and aspect (width / height)
+    """
+    width, height = img.size
+    small = img.convert("RGB").resize((SAMPLE_SIZE, SAMPLE_SIZE))
+    rgb = np.asarray(small, dtype=np.float32).reshape(-1, 3) / 255.0
+    lab = _to_lab(rgb)
+
+    # Centre weighting: the outfit is usually in the middle, backgrounds at the edges
+    axis = (np.arange(SAMPLE_SIZE) + 0.5) / SAMPLE_SIZE - 0.5
+    weights = np.exp(-(axis[:, None] ** 2 + axis[None, :] ** 2) / (2 * 0.25 ** 2)).ravel().astype(np.float64)
+
+    centres, labels = _kmeans(lab.astype(np.float64), weights, CLUSTERS, ITERATIONS, np.random.default_rng(0))
+    shares = np.bincount(labels, weights=weights, minlength=len(centres)) / weights.sum()
+
+    # Merge clusters that map to the same colour name
+    named = {}
+    for cluster in np.argsort(-shares):
+        if shares[cluster] < MIN_SHARE:
+            continue
+        name = color_name(centres[cluster])
+        if name not in named:
+            mean_rgb = rgb[labels == cluster].mean(axis=0)
+            named[name] = {"name": name, "hex": "#" + "".join(f"{int(round(c * 255)):02x}" for c in mean_rgb), "share": 0.0}
+        named[name]["share"] += float(shares[cluster])
+    colors = sorted(named.values(), key=lambda color: -color["share"])
+    for color in colors:
+        color["share"] = round(color["share"], 3)
+
+    luminance = lab[:, 0] / 100.0
+    maximum, minimum = rgb.max(axis=1), rgb.min(axis=1)
+    saturation = np.where(maximum > 0, (maximum - minimum) / np.maximum(maximum, 1e-6), 0.0)
+    return {
+        "colors": colors,
+        "brightness": round(float(np.average(luminance, weights=weights)), 3),
+        "contrast": round(float(luminance.std()), 3),
+        "saturation": round(float(np.average(saturation, weights=weights)), 3),
+        "width": width,
+        "height": height,
+        "aspect": round(width / height, 3) if height else None,
+    }
+
+
+def describe_profile(profile):
+    """One-line summaries used in the vision prompt and the analysis text."""
+    colors = ", ".join(f"{color['name']} ({color['share'] * 100:.0f}%)" for color in profile["colors"])
+
+    def level(value, low, high):
+        return "low" if value < low else "high" if value > high else "medium"
+
+    aspect = profile["aspect"] or 1.0
+    orientation = "portrait" if aspect < 0.9 else "landscape" if aspect > 1.1 else "square"
+    facts = (f"brightness {level(profile['brightness'], 0.35, 0.65)}, contrast {level(profile['contrast'], 0.12, 0.25)}, "
+             f"saturation {level(profile['saturation'], 0.2, 0.45)}, {orientation} {profile['width']}x{profile['height']}")
+    return colors, facts
+
+
+def with_measured_colors(analysis, colors):
+    """Put the measured palette on the analysis's "- Colors:" line, adding the line if the model left it out."""
+    line = f"- Colors: {colors}"
+    lines = analysis.split("\n")
+    for i, text in enumerate(lines):
+        if text.strip().lower().startswith("- colors:"):
+            lines[i] = line
+            return "\n".join(lines)
+
+    # After the last item of the Visual Inventory section
+    inventory = next((i for i, text in enumerate(lines) if text.strip().lower().startswith("## visual inventory")), None)
+    if inventory is None:
+        return f"## Visual Inventory\n{line}\n\n{analysis}"
+    end = inventory + 1
+    while end < len(lines) and lines[end].strip().startswith("- "):
+        end += 1
+    lines.insert(end, line)
+    return "\n".join(lines)
+
+
+def merge_profiles(profiles):
+    """
+    One profile for several photos of the same outfit: colour shares and image
+    statistics are averaged over the photos, and the size is the first photo's.
+    """
+    if len(profiles) == 1:
+        return profiles[0]
+
+    named = {}
+    for profile in profiles:
+        for color in profile["colors"]:
+            merged = named.setdefault(color["name"], {"name": color["name"], "hex": color["hex"], "share": 0.0})
+            merged["share"] += color["share"] / len(profiles)
+    colors = sorted((color for color in named.values() if color["share"] >= MIN_SHARE), key=lambda color: -color["share"])
+    for color in colors:
+        color["share"] = round(color["share"], 3)
+
+    merged = dict(profiles[0], colors=colors, images=len(profiles))
+    for stat in ("brightness", "contrast", "saturation"):
+        merged[stat] = round(sum(profile[stat] for profile in profiles) / len(profiles), 3)
+    return merged
@@ -0,0 +1,245 @@
+"""
+On-demand profiling for a running bot.
+
+A ProfileSession samples the Python stacks of every thread from a background
+thread (a cheap statistical profiler; handlers keep running at close to full
+speed). Besides the event loop this covers the `datamanager` storage pool and the
+`asyncio.to_thread` workers that download, preprocess and analyze images. Each
+stack starts with the name of its thread, and idle pool workers are left out.
+In "pstats" mode it runs cProfile instead, which only sees the event-loop
+thread. tracemalloc snapshots are taken at start and stop to show where memory
+was allocated and how it grew. Reports are written to the profiles/ folder and a
+short top-N summary is returned for posting to Discord.
+"""
+import os
+import sys
+import math
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+
+
+PROFILE_FOLDER = "profiles"
+
+# Frames from these files are what admins usually care about
+FOCUS_FILES = ("agent.py", "data_manager.py")
+
+
+def parse_duration(text):
+    """Parse '60s', '2m', '500ms' or a bare number of seconds. Raises ValueError for anything else, including nan and inf."""
+    text = text.strip().lower()
+    if text.endswith("ms"):
+        seconds = float(text[:-2]) / 1000
+    elif text.endswith("s"):
+        seconds = float(text[:-1])
+    elif text.endswith("m"):
+        seconds = float(text[:-1]) * 60
+    else:
+        seconds = float(text)
+    if not math.isfinite(seconds):
+        raise ValueError(f"Duration must be finite: {text}")
+    return seconds
+
+
+def _frame_label(code):
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def _is_idle(stack):
+    """True for a ThreadPoolExecutor worker waiting for its next work item."""
+    return "thread.py:_worker" in stack and "thread.py:run" not in stack
+
+
+class StackSampler:
+    """
+    Samples the Python stacks of all threads every `interval` seconds.
+
+    Each stack is prefixed with "thread:<name>". `samples` counts sampling
+    rounds, so a frame's share is the share of wall time its thread spent in it.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                if _is_idle(stack):
+                    continue
+                stack.append(f"thread:{names.get(thread_id, thread_id)}")
+                stack.reverse()
+                self.stacks[";".join(stack)] += 1
+            self.samples += 1
+
+    def write_collapsed(self, path):
+        """Brendan Gregg collapsed-stack format, ready for flamegraph.pl or speedscope."""
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def top_functions(self, limit=10):
+        """Return (self samples, inclusive samples) Counters keyed by file:function."""
+        self_counts = Counter()
+        inclusive_counts = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]
+            self_counts[frames[-1]] += count
+            for label in set(frames):
+                inclusive_counts[label] += count
+        return self_counts.most_common(limit), inclusive_counts
+
+    def thread_samples(self):
+        """Samples per thread name, busiest first."""
+        counts = Counter()
+        for stack, count in self.stacks.items():
+            counts[stack.split(";", 1)[0][len("thread:"):]] += count
+        return counts.most_common()
+
+
+class ProfileSession:
+    """One profiling run: CPU (sampling or cProfile) plus tracemalloc snapshots."""
+
+    def __init__(self, duration, mode="sample", top_n=10, folder=PROFILE_FOLDER, interval=0.005):
+        if mode not in ("sample", "pstats"):
+            raise ValueError("mode must be 'sample' or 'pstats'")
+        self.duration = duration
+        self.mode = mode
+        self.top_n = top_n
+        self.folder = folder
+        self.interval = interval
+        self.started_at = None
+        self._sampler = None
+        self._cprofile = None
+        self._snapshot_start = None
+        self._started_tracemalloc = False
+        self._elapsed = None
+        # Handle for the scheduled stop, set by whoever drives the session
+        self.timer = None
+
+    def start(self):
+        """Start profiling. cProfile ("pstats") covers the calling thread only, the event loop thread when called from a handler."""
+        self.started_at = datetime.now()
+        self._start_clock = time.perf_counter()
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+            self._started_tracemalloc = True
+        self._snapshot_start = tracemalloc.take_snapshot()
+
+        if self.mode == "sample":
+            self._sampler = StackSampler(self.interval)
+            self._sampler.start()
+        else:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    def stop(self):
+        """Stop profiling, write the reports and return (summary text, list of report paths)."""
+        self.halt()
+        return self.write_reports()
+
+    def halt(self):
+        """Stop collecting CPU samples. Call it on the thread that called start(), since cProfile is per thread."""
+        self._elapsed = time.perf_counter() - self._start_clock
+        if self._sampler:
+            self._sampler.stop()
+        if self._cprofile:
+            self._cprofile.disable()
+
+    def write_reports(self):
+        """
+        Take the closing memory snapshot and write the reports once halted. This is
+        the slow part and can run in a worker thread.
+
+        Returns:
+            tuple: (summary text, list of report paths)
+        """
+        elapsed = self._elapsed
+        # Leave the profiler's own bookkeeping out of the memory report
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        snapshot_end = tracemalloc.take_snapshot().filter_traces(ignore)
+        self._snapshot_start = self._snapshot_start.filter_traces(ignore)
+        current, peak = tracemalloc.get_traced_memory()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+        stamp = self.started_at.strftime("%Y%m%d-%H%M%S")
+        base = os.path.join(self.folder, f"profile-{stamp}")
+        paths = []
+
+        lines = [f"## Profile {stamp} ({elapsed:.1f}s, {self.mode})"]
+
+        if self._sampler:
+            path = base + ".collapsed"
+            self._sampler.write_collapsed(path)
+            paths.append(path)
+            top_self, inclusive = self._sampler.top_functions(self.top_n)
+            total = max(1, self._sampler.samples)
+            lines.append(f"**CPU samples:** {self._sampler.samples} every {self.interval * 1000:.0f}ms")
+            lines.append("**Threads:** " + ", ".join(
+                f"{name} {count / total * 100:.0f}%" for name, count in self._sampler.thread_samples()[:self.top_n]))
+            focus = [(label, count) for label, count in inclusive.most_common()
+                     if label.split(":")[0] in FOCUS_FILES][:self.top_n]
+            if focus:
+                lines.append("**Agent/DataManager (inclusive):**")
+                lines.extend(f"- `{label}` {count / total * 100:.1f}%" for label, count in focus)
+            lines.append("**Hottest frames (self):**")
+            lines.extend(f"- `{label}` {count / total * 100:.1f}%" for label, count in top_self)
+        else:
+            path = base + ".pstats"
+            self._cprofile.dump_stats(path)
+            paths.append(path)
+            stats = pstats.Stats(self._cprofile)
+            lines.append("**Top functions (cumulative):**")
+            for (filename, lineno, function), (_, calls, _, cumulative, _) in sorted(
+                    stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:self.top_n]:
+                lines.append(f"- `{os.path.basename(filename)}:{function}` {cumulative:.3f}s ({calls} calls)")
+
+        memory_path = base + "-memory.txt"
+        growth = snapshot_end.compare_to(self._snapshot_start, "lineno")[:self.top_n]
+        largest = snapshot_end.statistics("lineno")[:self.top_n]
+        with open(memory_path, "w") as f:
+            f.write(f"traced current={current} peak={peak}\n\nGrowth since start:\n")
+            for stat in growth:
+                f.write(f"{stat}\n")
+            f.write("\nLargest allocations:\n")
+            for stat in largest:
+                f.write(f"{stat}\n")
+        paths.append(memory_path)
+
+        lines.append(f"**Memory:** traced {current / 1e6:.1f} MB, peak {peak / 1e6:.1f} MB")
+        lines.append("**Top growth:**")
+        for stat in growth[:5]:
+            frame = stat.traceback[0]
+            lines.append(f"- `{os.path.basename(frame.filename)}:{frame.lineno}` "
+                         f"{stat.size_diff / 1024:+.1f} KiB ({stat.count_diff:+d} blocks)")
+
+        lines.append("Reports: " + ", ".join(f"`{path}`" for path in paths))
+        return "\n".join(lines), paths
@@ -0,0 +1,161 @@
+"""
+Prompt templates with a static prefix that is built once and reused.
+
+Every `!submit` photo of the active trend gets the same instructions, and every
+`!feedback` question about a submission gets the same original analysis.
+`PromptTemplates` builds that part once per trend (or per submission) as a
+CachedPrefix, placed first in the request. Only the image and a short suffix
+differ between requests. Backends with context caching register a long
+enough prefix once and then send only the rest (see GeminiHTTPBackend). That
+is mostly the `!feedback` prefix with its full analysis: the `!submit`
+instructions (a few hundred tokens) are below the explicit caching minimum. For
+those, and for the other backends, the API's implicit prefix caching applies,
+since the prefix is byte-identical.
+
+`record_usage` counts the prompt tokens of each templated call and how many of
+them were served from a cache, as reported in the response's usage metadata
+(estimated when the backend reports none). The totals are exported as
+fashionbot_prompt_tokens_total and shown by `!debug prompts`.
+"""
+from collections import OrderedDict
+
+from metrics import REGISTRY
+from llm_backends import CachedPrefix, estimate_tokens, IMAGE_TOKENS, _split_contents
+
+
+PROMPT_TOKENS = REGISTRY.counter(
+    "fashionbot_prompt_tokens_total", "Prompt tokens of templated model calls, total and served from cache.",
+    ["command", "kind"])
+PROMPT_REQUESTS = REGISTRY.counter(
+    "fashionbot_prompt_requests_total", "Model calls made with a prompt template.", ["command"])
+
+TEMPLATED_COMMANDS = ("!submit", "!feedback")
+
+
+class PromptTemplates:
+    def __init__(self, max_entries=256):
+        """
+        Args:
+            max_entries (int): Prefixes kept before the least recently used is dropped
+        """
+        self.max_entries = max_entries
+        self._prefixes = OrderedDict()
+
+    def _prefix(self, key, build):
+        prefix = self._prefixes.get(key)
+        if prefix is None:
+            prefix = self._prefixes[key] = CachedPrefix(build())
+            while len(self._prefixes) > self.max_entries:
+                self._prefixes.popitem(last=False)
+        else:
+            self._prefixes.move_to_end(key)
+        return prefix
+
+    def submit_prefix(self, trend_name):
+        """Instructions for analyzing an outfit photo, the same for every photo of a trend."""
+        return self._prefix(("submit", trend_name), lambda: f"""Analyze outfit photos for the {trend_name} trend challenge.
+
+REQUIREMENTS:
+1. Only describe what is clearly visible, naming items with the colors measured from the photo (given after it)
+2. Rate on three criteria (1-10 scale), one sentence of justification each
+
+FORMAT YOUR RESPONSE EXACTLY LIKE THIS:
+
+## Visual Inventory
+- Top: [item]
+- Bottom: [item]
+- Footwear: [if visible]
+- Accessories: [only visible items]
+
+## Style Analysis
+[How the outfit relates to the {trend_name} trend]
+
+## Ratings
+Trend Accuracy: [X]/10
+[Justification]
+
+Creativity: [X]/10
+[Justification]
+
+Overall Fit: [X]/10
+[Justification]
+
+## Summary
+[One sentence]
+
+## Improvement Tips
+[2-3 specific suggestions to improve this outfit]""")
+
+    @staticmethod
+    def submit_suffix(colors, facts, index=0, count=1):
+        """The part of a !submit prompt that belongs to one photo, sent after the image."""
+        photo_note = f"This is photo {index + 1} of {count} of the same outfit (it may show the back or a detail).\n" if count > 1 else ""
+        return f"""{photo_note}MEASURED FROM THE PHOTO:
+- Dominant colors: {colors}
+- Image: {facts}"""
+
+    def feedback_prefix(self, submission):
+        """Instructions plus the original analysis and ratings of a submission, the same for every follow-up."""
+        ratings = submission.get('ratings', {})
+        key = ("feedback", submission.get('id'), submission.get('analysis_text'))
+        return self._prefix(key, lambda: f"""You are a fashion advisor analyzing a user's outfit. They submitted an outfit and received feedback, and now they're asking for more information.
+
+Give them specific, constructive advice based on the original analysis. Be encouraging while providing practical tips they can use.
+Focus on:
+1. Direct answers to their questions
+2. Specific, actionable improvement suggestions
+3. Encouragement and positive reinforcement
+4. Trend-relevant advice
+
+Format your response in clear, helpful paragraphs with bullet points for specific tips.
+
+Here is the original analysis of their outfit:
+{submission.get('analysis_text', 'No analysis available')}
+
+The ratings were:
+Trend Accuracy: {ratings.get('trend_accuracy', 'N/A')}/10
+Creativity: {ratings.get('creativity', 'N/A')}/10
+Overall Fit: {ratings.get('fit', 'N/A')}/10""")
+
+    @staticmethod
+    def feedback_suffix(user_query, with_image=False):
+        image_note = "The outfit photo is attached again. Look at it to answer, and correct the original analysis if it missed something.\n" if with_image else ""
+        return f"""{image_note}The user is asking: "{user_query}\""""
+
+
+def response_usage(contents, response):
+    """
+    (prompt tokens, tokens served from cache) of a model call. Uses the usage
+    metadata of the response when the backend reports it, else an estimate with
+    nothing cached.
+    """
+    usage = getattr(response, "usage", None)
+    if usage and "promptTokenCount" in usage:
+        return usage["promptTokenCount"], usage.get("cachedContentTokenCount", 0)
+    metadata = getattr(response, "usage_metadata", None)  # google.generativeai responses
+    if metadata is not None and getattr(metadata, "prompt_token_count", None):
+        return metadata.prompt_token_count, getattr(metadata, "cached_content_token_count", 0) or 0
+    prompt, images = _split_contents(contents)
+    return estimate_tokens(prompt) + IMAGE_TOKENS * len(images), 0
+
+
+def record_usage(command, contents, response):
+    prompt_tokens, cached_tokens = response_usage(contents, response)
+    PROMPT_REQUESTS.inc(command=command)
+    PROMPT_TOKENS.inc(prompt_tokens, command=command, kind="prompt")
+    PROMPT_TOKENS.inc(cached_tokens, command=command, kind="cached")
+
+
+def format_usage():
+    lines = ["**Prompt tokens**"]
+    for command in TEMPLATED_COMMANDS:
+        requests = PROMPT_REQUESTS.value(command=command)
+        if not requests:
+            lines.append(f"- `{command}`: no calls yet")
+            continue
+        prompt_tokens = PROMPT_TOKENS.value(command=command, kind="prompt")
+        cached_tokens = PROMPT_TOKENS.value(command=command, kind="cached")
+        saved = cached_tokens / prompt_tokens * 100 if prompt_tokens else 0
+        lines.append(f"- `{command}`: {requests} calls, {prompt_tokens:,} prompt tokens "
+                     f"({prompt_tokens // requests:,} per call), {cached_tokens:,} from cache ({saved:.0f}% saved)")
+    return "\n".join(lines)
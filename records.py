@@ -0,0 +1,236 @@
+"""
+Typed records for stored entities and the compact on-disk encoding.
+
+Users, trend submissions (and their ratings), competition entries and chat turns
+are slotted dataclasses instead of free-form dicts: no per-record key dict in
+memory, and fixed field order. They keep dict-style access (`record["points"]`,
+`record.get("ratings", {})`) so existing callers work unchanged.
+
+On disk a collection of records is stored as a table,
+`{"fields": [...], "rows": {key: [values...]}}`, so keys aren't repeated per
+record, and files are written without indentation, which lets the C JSON encoder
+(or orjson, when installed) do the work. The legacy layout (a dict of dicts) is
+still read, and can still be written for rollback.
+"""
+import json
+from dataclasses import dataclass, fields as dataclass_fields
+from typing import Optional
+
+try:
+    import orjson
+except ImportError:  # optional speed-up
+    orjson = None
+
+
+_MISSING = object()
+
+
+class Record:
+    """Dict-compatible behaviour shared by every record type."""
+
+    __slots__ = ()
+
+    # Field name -> Record subclass for nested records
+    NESTED = {}
+    # Treat None fields as absent (for records that were stored as sparse dicts)
+    OMIT_NONE = False
+
+    def __getitem__(self, key):
+        value = getattr(self, key, _MISSING) if key in self._FIELDS else _MISSING
+        if value is _MISSING or (self.OMIT_NONE and value is None):
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key not in self._FIELDS:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        if key not in self._FIELDS:
+            return False
+        return not (self.OMIT_NONE and getattr(self, key) is None)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return [name for name in self._FIELDS if name in self]
+
+    def items(self):
+        return [(name, self[name]) for name in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def to_dict(self):
+        result = {}
+        for name in self.keys():
+            value = getattr(self, name)
+            result[name] = value.to_dict() if isinstance(value, Record) else value
+        return result
+
+    def to_row(self):
+        row = []
+        for name in self._FIELDS:
+            value = getattr(self, name)
+            if isinstance(value, Record):
+                value = value.to_row() if value.keys() else None
+            row.append(value)
+        return row
+
+    @classmethod
+    def from_dict(cls, data):
+        values = {}
+        for name in cls._FIELDS:
+            if name in data:
+                value = data[name]
+                if name in cls.NESTED:
+                    value = cls.NESTED[name].from_dict(value or {})
+                values[name] = value
+        return cls(**values)
+
+    @classmethod
+    def from_row(cls, row, stored_fields=None):
+        if stored_fields is None or stored_fields == cls._FIELDS:
+            values = dict(zip(cls._FIELDS, row))
+        else:
+            # Written by a different schema version: match by name, defaults for the rest
+            values = {name: value for name, value in zip(stored_fields, row) if name in cls._FIELDS}
+        for name, nested in cls.NESTED.items():
+            if name in values:
+                raw = values[name]
+                values[name] = nested.from_row(raw) if isinstance(raw, list) else nested.from_dict(raw or {})
+        return cls(**values)
+
+
+def _finish(cls):
+    """Record the dataclass field order used for rows."""
+    cls._FIELDS = tuple(field.name for field in dataclass_fields(cls))
+    return cls
+
+
+@_finish
+@dataclass(slots=True)
+class User(Record):
+    username: str
+    points: int = 0
+    participations: int = 0
+    wins: int = 0
+
+
+@_finish
+@dataclass(slots=True)
+class Ratings(Record):
+    OMIT_NONE = True
+
+    trend_accuracy: Optional[float] = None
+    creativity: Optional[float] = None
+    fit: Optional[float] = None
+    average: Optional[float] = None
+    points: Optional[int] = None
+
+
+@_finish
+@dataclass(slots=True)
+class Submission(Record):
+    NESTED = {"ratings": Ratings}
+
+    id: str
+    user_id: int
+    username: str
+    trend_id: str
+    image_url: str
+    submission_date: str
+    ratings: Ratings = None
+    analysis_text: Optional[str] = None
+    # Dominant colors and image statistics measured locally (palette.py)
+    image_profile: Optional[dict] = None
+
+    def __post_init__(self):
+        if self.ratings is None:
+            self.ratings = Ratings()
+
+
+@_finish
+@dataclass(slots=True)
+class CompetitionEntry(Record):
+    user_id: str
+    username: str
+    image_url: str
+    description: str
+    timestamp: str
+    votes: int = 0
+
+
+@_finish
+@dataclass(slots=True)
+class ChatTurn(Record):
+    timestamp: str
+    user_message: str
+    ai_response: str
+    submission_id: Optional[str] = None
+
+
+# TABLE ENCODING
+
+def encode_table(mapping, cls, many=False, compact=True):
+    """
+    Encode {key: record} (or {key: [record, ...]} with many=True) for storage.
+
+    compact=True produces {"fields": [...], "rows": {key: row or [rows]}};
+    compact=False produces the legacy {key: dict or [dicts]} layout.
+    """
+    if compact:
+        if many:
+            rows = {key: [record.to_row() for record in records] for key, records in mapping.items()}
+        else:
+            rows = {key: record.to_row() for key, record in mapping.items()}
+        return {"fields": list(cls._FIELDS), "rows": rows}
+    if many:
+        return {key: [record.to_dict() for record in records] for key, records in mapping.items()}
+    return {key: record.to_dict() for key, record in mapping.items()}
+
+
+def decode_table(raw, cls, many=False):
+    """Inverse of encode_table; accepts both the compact and the legacy layout."""
+    if not raw:
+        return {}
+    if isinstance(raw.get("rows"), dict) and isinstance(raw.get("fields"), list):
+        stored_fields = tuple(raw["fields"])
+        from_row = cls.from_row
+        if many:
+            return {key: [from_row(row, stored_fields) for row in rows] for key, rows in raw["rows"].items()}
+        return {key: from_row(row, stored_fields) for key, row in raw["rows"].items()}
+    if many:
+        return {key: [cls.from_dict(item) for item in items] for key, items in raw.items()}
+    return {key: cls.from_dict(item) for key, item in raw.items()}
+
+
+# SERIALIZATION
+
+def _default(value):
+    if isinstance(value, Record):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(data, compact=True):
+    """Serialize to bytes: minified (orjson if available) or legacy indent=4."""
+    if not compact:
+        return json.dumps(data, indent=4, default=_default).encode("utf-8")
+    if orjson is not None:
+        return orjson.dumps(data, default=_default)
+    return json.dumps(data, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def loads(raw):
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
@@ -0,0 +1,83 @@
+"""
+Cache of rendered replies to read-only commands.
+
+Each DataManager owns one RenderCache. Entries are keyed by command (and user,
+where the reply is personal) and depend on named topics:
+- "leaderboard": every user's points, wins and name
+- "user:<id>": one user's points card
+- "trend": the active trend
+- "competition": the active competition's details and participants
+- "standings": the active competition's vote totals
+DataManager mutations call `invalidate` with exactly the topics they change.
+For example, add_points invalidates "leaderboard" and that user's card, while a
+vote changes neither. A repeated `!leaderboard` or `!points` is then a
+dictionary lookup, with no JSON load.
+
+Every topic has a version counter. An entry records the versions from before it
+was rendered, so a write that lands while a reply is being rendered makes that
+entry stale immediately. When several processes share a store, the entry also
+records the files' modification times. Writes made by other processes then
+invalidate it too.
+"""
+import threading
+from collections import OrderedDict
+
+
+class RenderCache:
+    def __init__(self, max_entries=1024, signature=None):
+        """
+        Args:
+            max_entries (int): Entries kept before the least recently used is dropped
+            signature: Optional callable (topics) -> tuple that is added to each
+                entry's version stamp (e.g. modification times of the files behind the topics)
+        """
+        self.max_entries = max_entries
+        self.signature = signature
+        self._entries = OrderedDict()  # key -> (stamp, text)
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _stamp(self, topics):
+        stamp = tuple(self._versions.get(topic, 0) for topic in topics)
+        if self.signature is not None:
+            stamp += self.signature(topics)
+        return stamp
+
+    def invalidate(self, *topics):
+        with self._lock:
+            for topic in topics:
+                self._versions[topic] = self._versions.get(topic, 0) + 1
+
+    def clear(self):
+        """Drop every entry, e.g. after the code that renders them was reloaded."""
+        with self._lock:
+            self._entries.clear()
+
+    async def get(self, key, topics, render):
+        """
+        Return the cached reply for `key`, or await `render()` and cache its result.
+
+        Args:
+            key (tuple): Command and, where relevant, user identity
+            topics (tuple): Topics the reply depends on
+            render: Coroutine function producing the reply
+        """
+        with self._lock:
+            stamp = self._stamp(topics)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == stamp:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        text = await render()
+
+        with self._lock:
+            self._entries[key] = (stamp, text)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return text
@@ -0,0 +1,330 @@
+"""
+Traffic replay load generator.
+
+Turns a discord.log written by bot.py (or a JSONL capture written when
+TRAFFIC_CAPTURE_FILE is set) into a timed event stream and drives
+`bot.on_message` with fake Discord objects against the fake model backend.
+Each speed multiplier replays the same stream on a fresh copy of the data store
+and reports queueing delay, end-to-end latency and error rates.
+
+Usage:
+    python replay.py discord.log --speeds 1,10,100
+    python replay.py capture.jsonl --speeds 10 --max-gap 30 --output replay_results.json
+"""
+import os
+import io
+import re
+import json
+import time
+import shutil
+import asyncio
+import zlib
+import argparse
+import tempfile
+import contextlib
+from datetime import datetime
+
+from fakes import FakeUser, FakeGuild, FakeChannel, FakeAttachment, FakeMessage, FakeHTTPResponse, make_test_image
+
+
+LOG_LINE = re.compile(
+    r"^(?P<timestamp>\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3}):(?P<level>[A-Z]+):(?P<logger>[\w.]+): (?P<text>.*)$"
+)
+PROCESSING = re.compile(r"^Processing (?P<kind>command|message) from (?P<author>.+?): (?P<content>.*)$", re.DOTALL)
+
+# Commands that only make sense with an image; log lines don't record attachments
+ATTACHMENT_COMMANDS = ("!submit", "!competition submit")
+
+ERROR_PREFIXES = ("Error", "Sorry", "Could not")
+
+
+class TrafficEvent:
+    def __init__(self, offset, author, content, author_id=None, attachments=0, guild_id=1, channel_id=1):
+        self.offset = offset  # seconds since the first event
+        self.author = author
+        self.author_id = author_id if author_id is not None else stable_user_id(author)
+        self.content = content
+        self.attachments = attachments
+        self.guild_id = guild_id or 1
+        self.channel_id = channel_id or 1
+
+    def __repr__(self):
+        return f"TrafficEvent(+{self.offset:.3f}s, {self.author!r}, {self.content[:30]!r})"
+
+
+def stable_user_id(name):
+    """Derive a consistent snowflake-sized id for authors only known by name."""
+    return 10_000_000_000 + zlib.crc32(name.encode("utf-8"))
+
+
+def _needs_attachment(content):
+    lowered = content.lower()
+    return any(lowered.startswith(command) for command in ATTACHMENT_COMMANDS)
+
+
+def parse_discord_log(path):
+    """Extract 'Processing command/message' lines from a discord.log file."""
+    raw = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            match = LOG_LINE.match(line)
+            if not match:
+                # Continuation of a multi-line message body
+                if raw and raw[-1] is not None:
+                    raw[-1]["content"] += "\n" + line
+                continue
+            processing = PROCESSING.match(match.group("text")) if match.group("logger") == "discord" else None
+            if not processing:
+                raw.append(None)
+                continue
+            raw.append({
+                "timestamp": datetime.strptime(match.group("timestamp"), "%Y-%m-%d %H:%M:%S,%f"),
+                "author": processing.group("author"),
+                "content": processing.group("content"),
+            })
+
+    entries = [entry for entry in raw if entry is not None]
+    if not entries:
+        return []
+    first = entries[0]["timestamp"]
+    return [
+        TrafficEvent(
+            (entry["timestamp"] - first).total_seconds(),
+            entry["author"],
+            entry["content"],
+            attachments=1 if _needs_attachment(entry["content"]) else 0,
+        )
+        for entry in entries
+    ]
+
+
+def _parse_timestamp(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(value).timestamp()
+
+
+def parse_jsonl_capture(path):
+    """Read a capture written by bot.capture_message (one JSON object per line)."""
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    if not records:
+        return []
+
+    first = _parse_timestamp(records[0]["timestamp"])
+    events = []
+    for record in records:
+        attachments = record.get("attachments", 0)
+        if isinstance(attachments, list):
+            attachments = len(attachments)
+        author = record.get("author", "unknown")
+        events.append(TrafficEvent(
+            _parse_timestamp(record["timestamp"]) - first,
+            author,
+            record.get("content", ""),
+            author_id=record.get("author_id"),
+            attachments=attachments,
+            guild_id=record.get("guild_id"),
+            channel_id=record.get("channel_id"),
+        ))
+    return events
+
+
+def load_events(path):
+    events = parse_jsonl_capture(path) if path.endswith(".jsonl") else parse_discord_log(path)
+    events.sort(key=lambda event: event.offset)
+    return events
+
+
+def compress_gaps(events, max_gap):
+    """Cap idle gaps between consecutive events so long quiet periods don't dominate a replay."""
+    if not max_gap or not events:
+        return events
+    shifted = 0.0
+    previous = events[0].offset
+    for event in events:
+        gap = event.offset - previous
+        previous = event.offset
+        if gap > max_gap:
+            shifted += gap - max_gap
+        event.offset -= shifted
+    return events
+
+
+def summarize(values):
+    values = sorted(values)
+    if not values:
+        return {"n": 0, "p50_ms": 0.0, "p90_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+
+    def pct(p):
+        return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))] * 1000
+
+    return {"n": len(values), "p50_ms": pct(50), "p90_ms": pct(90), "p99_ms": pct(99), "max_ms": values[-1] * 1000}
+
+
+class ReplayWorld:
+    """Fake guilds, channels and users shared by every event of one replay run."""
+
+    def __init__(self, image_bytes):
+        self.image_bytes = image_bytes
+        self.guilds = {}
+        self.channels = {}
+        self.users = {}
+
+    def guild(self, guild_id):
+        if guild_id not in self.guilds:
+            self.guilds[guild_id] = FakeGuild(guild_id=guild_id, name=f"guild-{guild_id}")
+        return self.guilds[guild_id]
+
+    def message_for(self, event):
+        guild = self.guild(event.guild_id)
+        user = self.users.get(event.author_id)
+        if user is None:
+            user = FakeUser(event.author_id, event.author)
+            self.users[event.author_id] = user
+        if guild.get_member(user.id) is None:
+            guild.add_member(user)
+        channel = self.channels.get(event.channel_id)
+        if channel is None:
+            channel = FakeChannel(event.channel_id, guild=guild)
+            self.channels[event.channel_id] = channel
+        attachments = [
+            FakeAttachment(f"https://cdn.example.invalid/replay/{event.author_id}/{i}.jpg", self.image_bytes)
+            for i in range(event.attachments)
+        ]
+        return FakeMessage(event.content, user, guild=guild, channel=channel, attachments=attachments)
+
+
+async def replay(events, bot_module, speed, image_bytes, builtin_commands=False):
+    """Replay `events` through bot_module.on_message at `speed`x and collect timings."""
+    world = ReplayWorld(image_bytes)
+    if not builtin_commands:
+        # discord.py's command parser needs a real gateway-backed Message; the
+        # agent handles every "!" command itself so skipping it is safe here.
+        async def no_builtin_commands(message):
+            return None
+        bot_module.bot.process_commands = no_builtin_commands
+
+    queue_delays = []
+    latencies = []
+    errors = []
+    error_replies = 0
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+
+    async def dispatch(event, scheduled):
+        nonlocal error_replies
+        message = world.message_for(event)
+        began = loop.time()
+        queue_delays.append(began - scheduled)
+        try:
+            await bot_module.on_message(message)
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+        else:
+            for reply in message.replies:
+                text = reply[0] if isinstance(reply, list) and reply else reply
+                if isinstance(text, str) and text.strip().startswith(ERROR_PREFIXES):
+                    error_replies += 1
+                    break
+        latencies.append(loop.time() - scheduled)
+
+    tasks = []
+    for event in events:
+        scheduled = start + event.offset / speed
+        delay = scheduled - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(dispatch(event, scheduled)))
+    await asyncio.gather(*tasks)
+    wall = loop.time() - start
+
+    return {
+        "speed": speed,
+        "events": len(events),
+        "wall_seconds": wall,
+        "achieved_events_per_s": len(events) / wall if wall else 0.0,
+        "queue_delay": summarize(queue_delays),
+        "end_to_end": summarize(latencies),
+        "exceptions": len(errors),
+        "error_replies": error_replies,
+        "error_rate": (len(errors) + error_replies) / len(events) if events else 0.0,
+        "sample_exceptions": errors[:5],
+    }
+
+
+def print_result(result):
+    queue = result["queue_delay"]
+    e2e = result["end_to_end"]
+    print(f"\n=== {result['speed']}x: {result['events']} events in {result['wall_seconds']:.2f}s "
+          f"({result['achieved_events_per_s']:.1f}/s) ===")
+    print(f"  queue delay  p50 {queue['p50_ms']:9.2f} ms  p90 {queue['p90_ms']:9.2f} ms  "
+          f"p99 {queue['p99_ms']:9.2f} ms  max {queue['max_ms']:9.2f} ms")
+    print(f"  end-to-end   p50 {e2e['p50_ms']:9.2f} ms  p90 {e2e['p90_ms']:9.2f} ms  "
+          f"p99 {e2e['p99_ms']:9.2f} ms  max {e2e['max_ms']:9.2f} ms")
+    print(f"  errors: {result['exceptions']} exceptions, {result['error_replies']} error replies "
+          f"({result['error_rate'] * 100:.1f}%)")
+    for sample in result["sample_exceptions"]:
+        print(f"    {sample}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay captured Discord traffic against the bot offline.")
+    parser.add_argument("source", help="discord.log or a .jsonl capture (TRAFFIC_CAPTURE_FILE)")
+    parser.add_argument("--speeds", default="1,10,100", help="Comma-separated speed multipliers")
+    parser.add_argument("--max-gap", type=float, default=None, help="Cap idle gaps (seconds, before speed-up)")
+    parser.add_argument("--data-dir", default="data", help="Store to copy for each run (never modified)")
+    parser.add_argument("--legacy-guild-id", default=os.getenv("LEGACY_DATA_GUILD_ID") or "1",
+                        help="Guild whose store is seeded from the top-level data files (log events use guild 1)")
+    parser.add_argument("--latency", default="lognormal:-0.5,0.4", help="Fake model latency spec")
+    parser.add_argument("--builtin-commands", action="store_true",
+                        help="Also run discord.py's command parser for non-! messages")
+    parser.add_argument("--output", default=None, help="Write results as JSON to this path")
+    parser.add_argument("--verbose", action="store_true", help="Show the agent's debug output")
+    args = parser.parse_args(argv)
+
+    events = compress_gaps(load_events(args.source), args.max_gap)
+    if not events:
+        print(f"No replayable events found in {args.source}")
+        return
+    print(f"Loaded {len(events)} events spanning {events[-1].offset:.1f}s from {args.source}")
+
+    # bot.py builds its agent at import time; make sure that never reaches Gemini
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["FAKE_LLM_LATENCY"] = args.latency
+    os.environ.pop("TRAFFIC_CAPTURE_FILE", None)
+    import bot as bot_module
+    from agent import MistralAgent
+    from data_manager import GuildDataManagers
+
+    image_bytes = make_test_image()
+    results = []
+    for speed in [float(s) for s in args.speeds.split(",") if s.strip()]:
+        with tempfile.TemporaryDirectory() as work_dir:
+            data_dir = os.path.join(work_dir, "data")
+            if os.path.isdir(args.data_dir):
+                shutil.copytree(args.data_dir, data_dir)
+            agent = MistralAgent(data_managers=GuildDataManagers(data_dir, legacy_guild_id=args.legacy_guild_id))
+            agent.download_image = lambda url: FakeHTTPResponse(image_bytes)
+            bot_module.agent = agent
+
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()) if not args.verbose else contextlib.nullcontext():
+                result = asyncio.run(replay(events, bot_module, speed, image_bytes, args.builtin_commands))
+            result["harness_seconds"] = time.perf_counter() - started
+        results.append(result)
+        print_result(result)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"source": args.source, "latency": args.latency, "results": results}, f, indent=4)
+        print(f"\nResults saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
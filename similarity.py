@@ -0,0 +1,195 @@
+"""
+"Similar outfits" search over cheap local image features.
+
+While `!submit` preprocesses an outfit photo, `outfit_features` reduces it to a
+small vector: a joint RGB colour histogram, an 8x8 luminance thumbnail, an
+edge orientation histogram and a coarse edge-density grid. Each block is
+normalised separately, so no block dominates. Vectors are appended to
+<data folder>/similar/vectors.f32 (raw float32 rows), and entries.jsonl holds
+the matching submission details. A row's vector is written (and synced) before
+its entry, and an unmatched tail left by an interrupted write is cut off before
+the next row is added. `SimilarityIndex` keeps all rows in one NumPy
+matrix, and a search is a single matrix-vector product (cosine similarity) plus
+a partial sort. This is fast enough for 100k+ submissions without an
+approximate index or a model call.
+"""
+import os
+import json
+import threading
+
+import numpy as np
+
+
+THUMBNAIL_SIZE = 64
+COLOR_LEVELS = 4
+LUMINANCE_GRID = 8
+ORIENTATION_BINS = 8
+EDGE_GRID = 4
+
+FEATURE_SIZE = COLOR_LEVELS ** 3 + LUMINANCE_GRID ** 2 + ORIENTATION_BINS + EDGE_GRID ** 2
+
+# Relative weight of each block in the cosine similarity
+BLOCK_WEIGHTS = (1.0, 1.0, 0.5, 0.5)
+
+
+def _normalized(block):
+    norm = np.linalg.norm(block)
+    return block / norm if norm else block
+
+
+def outfit_features(img):
+    """
+    Feature vector for a PIL image (unit length, float32, FEATURE_SIZE values).
+    """
+    small = img.convert("RGB").resize((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+    rgb = np.asarray(small, dtype=np.float32) / 255.0
+
+    # Joint RGB histogram
+    levels = np.minimum((rgb * COLOR_LEVELS).astype(np.int32), COLOR_LEVELS - 1)
+    codes = (levels[..., 0] * COLOR_LEVELS + levels[..., 1]) * COLOR_LEVELS + levels[..., 2]
+    color = np.bincount(codes.ravel(), minlength=COLOR_LEVELS ** 3).astype(np.float32)
+
+    # Downsampled luminance, mean-centred so overall brightness is left to the histogram
+    luminance = rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    cell = THUMBNAIL_SIZE // LUMINANCE_GRID
+    layout = luminance.reshape(LUMINANCE_GRID, cell, LUMINANCE_GRID, cell).mean(axis=(1, 3)).ravel()
+    layout -= layout.mean()
+
+    # Edges: orientation histogram weighted by gradient magnitude, and where the edges are
+    gy, gx = np.gradient(luminance)
+    magnitude = np.hypot(gx, gy)
+    angle = np.arctan2(gy, gx) % np.pi
+    bins = np.minimum((angle / np.pi * ORIENTATION_BINS).astype(np.int32), ORIENTATION_BINS - 1)
+    orientation = np.bincount(bins.ravel(), weights=magnitude.ravel(), minlength=ORIENTATION_BINS)
+    cell = THUMBNAIL_SIZE // EDGE_GRID
+    density = magnitude.reshape(EDGE_GRID, cell, EDGE_GRID, cell).mean(axis=(1, 3)).ravel()
+
+    blocks = (color, layout, orientation, density)
+    vector = np.concatenate([weight * _normalized(block) for weight, block in zip(BLOCK_WEIGHTS, blocks)])
+    return _normalized(vector).astype(np.float32)
+
+
+class SimilarityIndex:
+    def __init__(self, folder):
+        """
+        Args:
+            folder (str): Folder holding vectors.f32 and entries.jsonl
+        """
+        self.folder = folder
+        self.vectors_file = os.path.join(folder, "vectors.f32")
+        self.entries_file = os.path.join(folder, "entries.jsonl")
+        self._lock = threading.Lock()
+        self.size = 0
+        self._vectors = np.zeros((1024, FEATURE_SIZE), dtype=np.float32)
+        self._users = np.zeros(1024, dtype=np.int32)
+        self._user_codes = {}
+        self._entries = []
+        self._loaded_bytes = (0, 0)
+
+    def _sync(self):
+        """Pick up rows appended since the last load (by this or another process)."""
+        try:
+            sizes = (os.path.getsize(self.vectors_file), os.path.getsize(self.entries_file))
+        except FileNotFoundError:
+            return
+        if sizes == self._loaded_bytes:
+            return
+
+        with open(self.vectors_file, "rb") as f:
+            f.seek(self._loaded_bytes[0])
+            data = f.read()
+        # A vector still being written is left for the next sync
+        new_vectors = np.frombuffer(data, dtype=np.float32, count=len(data) // (FEATURE_SIZE * 4) * FEATURE_SIZE)
+        with open(self.entries_file, "rb") as f:
+            f.seek(self._loaded_bytes[1])
+            lines = f.read().split(b"\n")[:-1]
+
+        # Only take complete rows that have both a vector and an entry line
+        rows = min(len(new_vectors) // FEATURE_SIZE, len(lines))
+        if not rows:
+            return
+        needed = self.size + rows
+        if needed > len(self._vectors):
+            capacity = max(needed, 2 * len(self._vectors))
+            self._vectors = np.resize(self._vectors, (capacity, FEATURE_SIZE))
+            self._users = np.resize(self._users, capacity)
+
+        self._vectors[self.size:needed] = new_vectors[:rows * FEATURE_SIZE].reshape(rows, FEATURE_SIZE)
+        for offset, line in enumerate(lines[:rows]):
+            entry = json.loads(line)
+            user_id = str(entry["user_id"])
+            self._users[self.size + offset] = self._user_codes.setdefault(user_id, len(self._user_codes))
+            self._entries.append(entry)
+        self.size = needed
+        self._loaded_bytes = (
+            self._loaded_bytes[0] + rows * FEATURE_SIZE * 4,
+            self._loaded_bytes[1] + sum(len(line) + 1 for line in lines[:rows]),
+        )
+
+    def add(self, entry, vector):
+        """
+        Append one submission. Callers hold the store lock, so no other add is in progress.
+
+        Args:
+            entry (dict): Submission details returned by search (id, user_id, ...)
+            vector (np.ndarray): outfit_features() of its image
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        with self._lock:
+            self._sync()
+            self._drop_incomplete_row()
+            # The vector is on disk before its entry, so every entry line has a complete vector
+            with open(self.vectors_file, "ab") as f:
+                f.write(np.asarray(vector, dtype=np.float32).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.entries_file, "ab") as f:
+                f.write(json.dumps(entry).encode("utf-8") + b"\n")
+            self._sync()
+
+    def _drop_incomplete_row(self):
+        """
+        Cut off whatever follows the last complete row, such as a vector whose entry
+        was never written because a writer crashed. Otherwise the next row's vector
+        would be paired with the wrong entry.
+        """
+        for path, loaded in zip((self.vectors_file, self.entries_file), self._loaded_bytes):
+            try:
+                if os.path.getsize(path) > loaded:
+                    print(f"Similarity index: dropping an incomplete row from {path}")  # Debug log
+                    os.truncate(path, loaded)
+            except FileNotFoundError:
+                pass
+
+    def latest_for_user(self, user_id):
+        """Row of the user's most recent indexed submission, or None."""
+        with self._lock:
+            self._sync()
+            code = self._user_codes.get(str(user_id))
+            if code is None:
+                return None
+            return int(np.flatnonzero(self._users[:self.size] == code)[-1])
+
+    def search(self, row, limit=5, exclude_user=True):
+        """
+        Most similar submissions to the one at `row`.
+
+        Returns:
+            list: (entry, cosine similarity) pairs, best first
+        """
+        with self._lock:
+            self._sync()
+            size = self.size
+            vectors, users, entries = self._vectors[:size], self._users[:size], self._entries
+
+        scores = vectors @ vectors[row]
+        scores[row] = -np.inf
+        if exclude_user:
+            scores[users == users[row]] = -np.inf
+
+        limit = min(limit, size)
+        if not limit:
+            return []
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+        return [(entries[i], float(scores[i])) for i in top if np.isfinite(scores[i])]
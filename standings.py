@@ -0,0 +1,72 @@
+"""
+Live vote standings of the active competition.
+
+Each entrant's score follows the rule the winner has always been picked by.
+With `!vote`, votes go to the user's latest entry and only that entry counts,
+so a new entry starts again from zero. With reaction voting, any posted entry
+can collect votes and the entrant's best entry counts. Ties go to the earlier
+entrant.
+
+DataManager keeps one Standings in memory for the active competition and
+updates it as votes and entries arrive. `!competition standings` and
+`end_competition` then read the top entrants without loading competitions.json
+or scanning every entry. The standings are rebuilt from the file only when
+another process or store has written it since.
+"""
+import bisect
+import threading
+
+
+def entrant_votes(competition, entries):
+    """Votes that count for an entrant with `entries` (oldest first)."""
+    if competition.get("voting") == "reactions":
+        return max(entry["votes"] for entry in entries)
+    return entries[-1]["votes"]
+
+
+class Standings:
+    def __init__(self, competition):
+        """
+        Args:
+            competition (dict): The active competition, with its entries
+        """
+        self.competition_id = competition["start_date"]
+        self.name = competition["name"]
+        self.voting = competition.get("voting", "command")
+        self._entrants = {}  # user id -> (sort key, username)
+        self._ranking = []  # sort keys (-votes, entrant order, user id), best first
+        self._lock = threading.Lock()
+        for user_id, entries in competition["submissions"].items():
+            self.update(user_id, entries[-1]["username"], entrant_votes(competition, entries))
+
+    def update(self, user_id, username, votes):
+        """Set an entrant's votes and name, adding the entrant after the existing ones if new."""
+        with self._lock:
+            current = self._entrants.get(user_id)
+            if current is None:
+                order = len(self._entrants)
+            else:
+                order = current[0][1]
+                del self._ranking[bisect.bisect_left(self._ranking, current[0])]
+            key = (-votes, order, user_id)
+            bisect.insort(self._ranking, key)
+            self._entrants[user_id] = (key, username)
+
+    def leader(self):
+        """(user id, votes) of the entrant in first place, or None without entries."""
+        with self._lock:
+            if not self._ranking:
+                return None
+            votes, _, user_id = self._ranking[0]
+            return user_id, -votes
+
+    def top(self, limit=10):
+        """The first `limit` entrants as {"user_id", "username", "votes"}, most votes first."""
+        with self._lock:
+            return [
+                {"user_id": user_id, "username": self._entrants[user_id][1], "votes": -votes}
+                for votes, _, user_id in self._ranking[:limit]
+            ]
+
+    def __len__(self):
+        return len(self._entrants)
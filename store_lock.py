@@ -0,0 +1,98 @@
+"""
+Locking for DataManager stores.
+
+Every load-modify-save in DataManager runs under a StoreLock for its data folder.
+The lock is reentrant and always serializes threads within a process; in
+process-safe mode it additionally holds an exclusive OS file lock on
+<data folder>/.lock so several shard processes can share one store without
+losing updates.
+"""
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def _lock_file(f):
+    if fcntl:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    else:
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                # LK_LOCK gives up after ~10 seconds; keep waiting like flock does
+                continue
+
+
+def _unlock_file(f):
+    if fcntl:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class StoreLock:
+    """Reentrant lock for one data folder, across threads and optionally processes."""
+
+    def __init__(self, lock_path, process_safe=False):
+        self.lock_path = lock_path
+        self.process_safe = process_safe
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        self._depth += 1
+        if self._depth == 1 and self.process_safe:
+            try:
+                self._file = open(self.lock_path, "a+")
+                _lock_file(self._file)
+            except BaseException:
+                if self._file:
+                    self._file.close()
+                    self._file = None
+                self._depth -= 1
+                self._thread_lock.release()
+                raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if self._depth == 1 and self._file:
+                _unlock_file(self._file)
+                self._file.close()
+                self._file = None
+        finally:
+            self._depth -= 1
+            self._thread_lock.release()
+
+
+_store_locks = {}
+_store_locks_guard = threading.Lock()
+
+
+def store_lock(data_folder, process_safe=False):
+    """
+    Return the shared StoreLock for a data folder.
+
+    DataManager instances for the same folder (e.g. after a guild store is evicted
+    and rebuilt) must share one lock, so locks are registered by absolute path.
+    """
+    key = os.path.abspath(data_folder)
+    with _store_locks_guard:
+        lock = _store_locks.get(key)
+        if lock is None:
+            lock = StoreLock(os.path.join(key, ".lock"), process_safe)
+            _store_locks[key] = lock
+        elif process_safe:
+            lock.process_safe = True
+        return lock
@@ -0,0 +1,99 @@
+"""
+Multi-process stress test for DataManager storage.
+
+Several processes hammer one shared store with add_points and
+vote_for_submission calls at the same time, then the totals are checked: every
+point and every vote must be present. Exits with status 1 if any update was lost.
+
+Usage:
+    python stress_storage.py --processes 8 --operations 200
+    python stress_storage.py --unsafe   # same run without cross-process locking, to see updates get lost
+"""
+import sys
+import time
+import argparse
+import tempfile
+import multiprocessing
+
+from data_manager import DataManager
+
+
+TARGET_USERS = 5
+POINTS_PER_CALL = 3
+
+
+def worker(folder, process_safe, worker_index, operations, start_event):
+    dm = DataManager(folder, process_safe=process_safe)
+    start_event.wait()
+    for i in range(operations):
+        target = 1 + (i % TARGET_USERS)
+        dm.add_points(target, POINTS_PER_CALL, username=f"user{target}")
+        voter = 1_000_000 + worker_index * operations + i
+        success, result = dm.vote_for_submission(voter, target)
+        if not success:
+            raise RuntimeError(f"Vote rejected: {result}")
+
+
+def run(processes, operations, process_safe):
+    with tempfile.TemporaryDirectory() as folder:
+        dm = DataManager(folder, process_safe=process_safe)
+        dm.start_competition("Stress", "Stress test competition", "StyleCo")
+        for target in range(1, TARGET_USERS + 1):
+            dm.submit_competition_entry(target, f"user{target}", f"https://example.invalid/{target}.jpg", "entry")
+
+        context = multiprocessing.get_context("spawn")
+        start_event = context.Event()
+        workers = [
+            context.Process(target=worker, args=(folder, process_safe, index, operations, start_event))
+            for index in range(processes)
+        ]
+        for process in workers:
+            process.start()
+        started = time.perf_counter()
+        start_event.set()
+        for process in workers:
+            process.join()
+        elapsed = time.perf_counter() - started
+
+        failed = [process.exitcode for process in workers if process.exitcode != 0]
+
+        total_calls = processes * operations
+        users = {str(target): dm.get_user(target) for target in range(1, TARGET_USERS + 1)}
+        points = sum(user["points"] for user in users.values() if user)
+        participations = sum(user["participations"] for user in users.values() if user)
+
+        competition = dm.get_active_competition()
+        vote_count = sum(entries[-1]["votes"] for entries in competition["submissions"].values())
+        recorded_voters = len(dm._load_json(dm.competitions_file)["votes"])
+
+        print(f"{processes} processes x {operations} operations in {elapsed:.2f}s "
+              f"({2 * total_calls / elapsed:.0f} writes/s), process_safe={process_safe}")
+        checks = [
+            ("points", points, total_calls * POINTS_PER_CALL),
+            ("participations", participations, total_calls),
+            ("entry votes", vote_count, total_calls),
+            ("recorded voters", recorded_voters, total_calls),
+        ]
+        lost = False
+        for name, actual, expected in checks:
+            status = "ok" if actual == expected else f"LOST {expected - actual}"
+            lost = lost or actual != expected
+            print(f"  {name:<16} {actual:>8} / {expected:<8} {status}")
+        if failed:
+            print(f"  {len(failed)} worker(s) crashed (exit codes {failed})")
+        return not lost and not failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that concurrent processes never lose DataManager updates.")
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--operations", type=int, default=200, help="add_points + vote pairs per process")
+    parser.add_argument("--unsafe", action="store_true", help="Disable cross-process locking")
+    args = parser.parse_args(argv)
+
+    ok = run(args.processes, args.operations, process_safe=not args.unsafe)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
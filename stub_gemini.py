@@ -0,0 +1,229 @@
+"""
+Local stand-in for the Gemini generateContent REST endpoint.
+
+It answers like the real API: canned analyses from FakeBackend, usageMetadata
+token counts, and per-key, per-model rate limits that return 429s with a
+RetryInfo delay. Cached contexts (cachedContents) can be created and used by
+generateContent, and their tokens are reported as cachedContentTokenCount.
+This makes ModelPool and prompt caching testable without real keys:
+
+    python stub_gemini.py --port 8089 --rpm 10
+    LLM_BACKEND=pool GEMINI_API_KEYS=a,b,c GEMINI_ENDPOINT=http://127.0.0.1:8089 python bot.py
+
+or run a load through a pool against an in-process stub and print per-key usage:
+
+    python stub_gemini.py --load 200 --keys 3 --rpm 30 --concurrency 8
+"""
+import re
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm_backends import FakeBackend, GeminiHTTPBackend
+from model_pool import ModelPool, PoolMember, PoolExhaustedError, _key_label
+
+
+PATH_PATTERN = re.compile(r"^/v1beta/models/([^/:]+):generateContent$")
+CACHE_PATH = "/v1beta/cachedContents"
+
+
+class StubGeminiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, host="127.0.0.1", rpm=15, latency="fixed:0", seed=0):
+        """
+        Args:
+            port (int): Port to listen on, 0 for any free port
+            rpm (int): Requests per minute allowed per key and model
+            latency (str): FakeBackend latency spec for every answer
+        """
+        super().__init__((host, port), StubHandler)
+        self.rpm = rpm
+        self.latency = latency
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.windows = {}  # (key, model) -> deque of request times
+        self.counts = {}  # (key, model) -> {"ok": n, "429": n}
+        self.backends = {}
+        self.cached_contents = {}  # name -> (key, prompt text)
+
+    @property
+    def endpoint(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="stub-gemini", daemon=True).start()
+        return self
+
+    def admit(self, key, model):
+        """None if the request fits the key's quota, else the seconds until it would."""
+        now = time.monotonic()
+        with self.lock:
+            window = self.windows.setdefault((key, model), deque())
+            while window and now - window[0] >= 60:
+                window.popleft()
+            counts = self.counts.setdefault((key, model), {"ok": 0, "429": 0})
+            if len(window) >= self.rpm:
+                counts["429"] += 1
+                return window[0] + 60 - now
+            window.append(now)
+            counts["ok"] += 1
+            return None
+
+    def backend(self, model):
+        with self.lock:
+            if model not in self.backends:
+                self.backends[model] = FakeBackend(model, latency=self.latency, seed=self.seed)
+            return self.backends[model]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _not_found(self, message="Not found"):
+        self._send_json(404, {"error": {"code": 404, "message": message, "status": "NOT_FOUND"}})
+
+    def _create_cached_content(self, key, request):
+        texts = [part["text"] for content in request.get("contents", []) for part in content.get("parts", [])
+                 if "text" in part]
+        with self.server.lock:
+            name = f"cachedContents/stub{len(self.server.cached_contents) + 1}"
+            self.server.cached_contents[name] = (key, "\n".join(texts))
+        self._send_json(200, {"name": name, "model": request.get("model"), "usageMetadata": {
+            "totalTokenCount": sum(len(text) for text in texts) // 4}})
+
+    def do_POST(self):
+        path = self.path.split("?")[0]
+        match = PATH_PATTERN.match(path)
+        if not match and path != CACHE_PATH:
+            self._not_found()
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        key = self.headers.get("x-goog-api-key")
+        if not key:
+            self._send_json(403, {"error": {"code": 403, "message": "API key missing", "status": "PERMISSION_DENIED"}})
+            return
+        if path == CACHE_PATH:
+            self._create_cached_content(key, request)
+            return
+        model = match.group(1)
+
+        # Cached contexts belong to the key that created them
+        contents = []
+        cached_tokens = 0
+        if request.get("cachedContent"):
+            cached = self.server.cached_contents.get(request["cachedContent"])
+            if cached is None or cached[0] != key:
+                self._not_found(f"CachedContent not found: {request['cachedContent']}")
+                return
+            contents.append(cached[1])
+            cached_tokens = len(cached[1]) // 4
+
+        retry_after = self.server.admit(key, model)
+        if retry_after is not None:
+            self._send_json(429, {"error": {
+                "code": 429,
+                "message": "Resource has been exhausted (e.g. check quota).",
+                "status": "RESOURCE_EXHAUSTED",
+                "details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": f"{retry_after:.1f}s"}],
+            }}, headers={"Retry-After": str(max(1, round(retry_after)))})
+            return
+
+        for content in request.get("contents", []):
+            for part in content.get("parts", []):
+                if "text" in part:
+                    contents.append(part["text"])
+                elif "inline_data" in part:
+                    contents.append(part["inline_data"])
+        prompt_tokens = sum(len(part) for part in contents if isinstance(part, str)) // 4
+        text = self.server.backend(model).generate_content(contents).text
+        self._send_json(200, {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}],
+            "usageMetadata": {
+                "promptTokenCount": prompt_tokens,
+                "cachedContentTokenCount": cached_tokens,
+                "candidatesTokenCount": len(text) // 4,
+                "totalTokenCount": prompt_tokens + len(text) // 4,
+            },
+        })
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_load(requests, keys, models, rpm, pool_rpm, concurrency, strategy, latency):
+    server = StubGeminiServer(rpm=rpm, latency=latency).start()
+    api_keys = [f"stub-key-{i + 1:04d}" for i in range(keys)]
+    members = [
+        PoolMember(_key_label(index, key), GeminiHTTPBackend(model, api_key=key, endpoint=server.endpoint),
+                   rpm=pool_rpm or rpm)
+        for index, key in enumerate(api_keys)
+        for model in models
+    ]
+    pool = ModelPool(members, strategy=strategy, max_wait=2.0, base_backoff=0.5)
+
+    def call(i):
+        try:
+            pool.generate_content(f"Request {i}: how do I style a denim jacket?")
+            return "ok"
+        except PoolExhaustedError:
+            return "exhausted"
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        outcomes = list(executor.map(call, range(requests)))
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    print(f"{requests} requests over {len(members)} members in {elapsed:.2f}s: "
+          f"{outcomes.count('ok')} ok, {outcomes.count('exhausted')} failed with no quota left")
+    print(f"{'member':<16}{'model':<24}{'ok':>6}{'429':>6}{'tokens':>9}")
+    for usage in pool.usage():
+        print(f"{usage['key']:<16}{usage['model']:<24}{usage['requests']:>6}{usage['rate_limited']:>6}{usage['tokens']:>9}")
+    return outcomes.count("exhausted") == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--rpm", type=int, default=15, help="requests per minute per key and model")
+    parser.add_argument("--latency", default="fixed:0", help="FakeBackend latency spec, e.g. lognormal:-0.3,0.4")
+    parser.add_argument("--load", type=int, default=0, help="run this many requests through a pool instead of serving")
+    parser.add_argument("--keys", type=int, default=3)
+    parser.add_argument("--models", default="gemini-1.5-flash")
+    parser.add_argument("--pool-rpm", type=int, default=0,
+                        help="limit the pool assumes per member (default: --rpm; set higher to exercise 429 backoff)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--strategy", default="least-loaded")
+    args = parser.parse_args()
+
+    if args.load:
+        models = [model.strip() for model in args.models.split(",") if model.strip()]
+        ok = run_load(args.load, args.keys, models, args.rpm, args.pool_rpm, args.concurrency,
+                      args.strategy, args.latency)
+        sys.exit(0 if ok else 1)
+
+    server = StubGeminiServer(args.port, rpm=args.rpm, latency=args.latency)
+    print(f"Stub Gemini API on {server.endpoint} ({args.rpm} requests/minute per key and model)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import asyncio
+import re
+import threading
+
+import pytest
+
+from agent import MistralAgent
+from data_manager import GuildDataManagers
+from fakes import FakeAttachment, FakeGuild, FakeHTTPResponse, FakeMessage, FakeUser, make_test_image
+from llm_backends import BackendResponse, FakeBackend
+
+
+class ThreadRecordingBackend(FakeBackend):
+    """FakeBackend that notes which thread each call ran on."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.threads = []
+
+    def generate_content(self, contents):
+        self.threads.append(threading.get_ident())
+        return super().generate_content(contents)
+
+
+@pytest.fixture
+def agent(tmp_path):
+    return MistralAgent(text_model=ThreadRecordingBackend(seed=1), vision_model=ThreadRecordingBackend(seed=2),
+                        data_managers=GuildDataManagers(str(tmp_path)))
+
+
+def test_model_and_storage_calls_run_off_the_event_loop(agent):
+    guild = FakeGuild()
+    store = agent.data_managers.get(guild.id)
+    storage_threads = []
+    original = store.add_to_chat_history
+
+    def recording(*args, **kwargs):
+        storage_threads.append(threading.get_ident())
+        return original(*args, **kwargs)
+
+    store.add_to_chat_history = recording
+
+    async def scenario():
+        loop_thread = threading.get_ident()
+        reply = await agent.run(FakeMessage("what goes with wide-leg trousers?", FakeUser(7, "ana"), guild=guild))
+        return loop_thread, reply
+
+    loop_thread, reply = asyncio.run(scenario())
+    assert reply
+    assert agent.text_model.threads and loop_thread not in agent.text_model.threads
+    assert storage_threads and loop_thread not in storage_threads
+
+
+def test_concurrent_async_writes_are_not_lost(tmp_path):
+    store = GuildDataManagers(str(tmp_path)).get(1)
+
+    async def scenario():
+        await asyncio.gather(*(store.aio.add_points(7, 1, "ana") for _ in range(20)))
+        return await store.aio.get_user(7)
+
+    assert asyncio.run(scenario())["points"] == 20
+
+
+class PhotoRatingBackend(FakeBackend):
+    """Vision backend that rates photo N of a submission N, N+1 and N+2."""
+
+    def generate_content(self, contents):
+        match = re.search(r"photo (\d+) of", " ".join(part for part in contents if isinstance(part, str)))
+        score = int(match.group(1)) if match else 5
+        return BackendResponse(f"## Visual Inventory\n- Top: tee\n\n## Ratings\n"
+                               f"Trend Accuracy: {score}/10\nCreativity: {score + 1}/10\nOverall Fit: {score + 2}/10")
+
+
+def test_multi_photo_submit_averages_the_photos_that_could_be_analyzed(tmp_path):
+    agent = MistralAgent(text_model=FakeBackend(seed=1), vision_model=PhotoRatingBackend(),
+                         data_managers=GuildDataManagers(str(tmp_path)))
+    image = make_test_image(300, 400)
+    agent.download_image = lambda url: FakeHTTPResponse(b"", 404) if "broken" in url else FakeHTTPResponse(image)
+    guild = FakeGuild()
+    store = agent.data_managers.get(guild.id)
+    store.announce_trend("Y2K", "desc")
+    attachments = [FakeAttachment(f"https://cdn.example/{name}.jpg", image)
+                   for name in ("front", "broken", "back")]
+
+    reply = asyncio.run(agent.run(FakeMessage("!submit", FakeUser(7, "ana"), guild=guild, attachments=attachments)))
+    reply = "\n".join(reply) if isinstance(reply, list) else reply
+
+    assert "### Photo 2\nError downloading the image. Please try again." in reply
+    assert "## Combined Rating (2 of 3 photos)" in reply
+    # Photos 1 and 3 were rated 1/2/3 and 3/4/5
+    assert "Trend Accuracy: 2.0/10\nCreativity: 3.0/10\nOverall Fit: 4.0/10" in reply
+    assert store.get_user(7)["points"] == 30
+    [submission] = store.get_outfit_submissions_history(7)
+    assert submission["image_url"] == "https://cdn.example/front.jpg"
+    assert submission["ratings"]["average"] == 3.0
+
+
+def test_submit_reports_the_error_when_no_photo_can_be_analyzed(agent):
+    agent.download_image = lambda url: FakeHTTPResponse(b"", 404)
+    guild = FakeGuild()
+    agent.data_managers.get(guild.id).announce_trend("Y2K", "desc")
+    attachments = [FakeAttachment(f"https://cdn.example/{i}.jpg", b"x") for i in range(2)]
+
+    reply = asyncio.run(agent.run(FakeMessage("!submit", FakeUser(7, "ana"), guild=guild, attachments=attachments)))
+    assert reply == "Error downloading the image. Please try again."
+    assert agent.data_managers.get(guild.id).get_user(7) is None
@@ -0,0 +1,62 @@
+from analytics import RatingsIndex
+from data_manager import DataManager
+from records import Ratings, Submission
+
+
+def rated(store, user_id, username, score):
+    store.submit_outfit(user_id, username, f"u{user_id}")
+    store.rate_submission(user_id, score, score, score)
+
+
+def test_trend_stats_follow_new_ratings(tmp_path):
+    store = DataManager(str(tmp_path))
+    store.announce_trend("Y2K", "desc")
+    rated(store, 1, "ana", 8)
+    rated(store, 2, "bo", 6)
+    assert store.get_trend_stats("Y2K")[0]["count"] == 2
+
+    store.end_current_trend()
+    store.announce_trend("Boho", "desc")
+    rated(store, 3, "cy", 4)
+
+    summaries = store.get_trend_stats()
+    assert [summary["trend"] for summary in summaries] == ["Boho", "Y2K"]
+    assert summaries[1]["average"] == 7.0
+    assert store.get_trend_stats("Grunge") == []
+
+
+def test_ratings_index_picks_up_other_processes_in_process_safe_mode(tmp_path):
+    first = DataManager(str(tmp_path), process_safe=True)
+    second = DataManager(str(tmp_path), process_safe=True)
+    first.announce_trend("Y2K", "desc")
+    first.submit_outfit(1, "ana", "u1")
+    first.rate_submission(1, 8, 8, 8)
+    assert first.get_trend_stats()[0]["count"] == 1
+
+    second.submit_outfit(2, "bo", "u2")
+    second.rate_submission(2, 6, 6, 6)
+    assert first.get_trend_stats()[0]["count"] == 2
+
+
+def submission(submission_id, user_id, trend, date, score):
+    ratings = Ratings(trend_accuracy=score, creativity=score, fit=score, average=score, points=score * 10)
+    return Submission(id=submission_id, user_id=user_id, username=f"user{user_id}", trend_id=trend,
+                      image_url="u", submission_date=date, ratings=ratings)
+
+
+def test_build_and_add_give_the_same_trajectory():
+    first = submission("s1", 1, "Y2K", "2024-01-01T10:00:00", 8.0)
+    second = submission("s2", 1, "Boho", "2024-01-08T10:00:00", 4.0)
+    unrated = Submission(id="s3", user_id=1, username="user1", trend_id="Boho",
+                         image_url="u", submission_date="2024-01-09T10:00:00")
+
+    built = RatingsIndex.build([second, first, unrated])
+    grown = RatingsIndex(capacity=1)
+    for record in (first, second, unrated):
+        grown.add(record)
+
+    for index in (built, grown):
+        trajectory = index.user_trajectory(1)
+        assert [point["trend"] for point in trajectory] == ["Y2K", "Boho"]
+        assert [point["running_average"] for point in trajectory] == [8.0, 6.0]
+        assert index.user_trajectory(99) == []
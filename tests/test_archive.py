@@ -0,0 +1,37 @@
+import json
+
+from archive import Archive
+from data_manager import DataManager
+from records import CompetitionEntry, Submission
+
+
+def test_archive_returns_newest_entries_first(tmp_path):
+    archive = Archive(str(tmp_path))
+    submission = Submission(id="s1", user_id=7, username="ana", trend_id="t1",
+                            image_url="u", submission_date="2024-01-01")
+    archive.append("trends", [{"name": "t1"}], {"s1": submission})
+    archive.append("trends", [{"name": "t2"}, {"name": "t3"}])
+    archive.append("competitions", [{"name": "c1", "submissions": {"7": [CompetitionEntry("7", "ana", "u", "d", "t")]}}])
+
+    assert [entry["name"] for entry in archive.past_entries("trends")] == ["t3", "t2", "t1"]
+    assert [entry["name"] for entry in archive.past_entries("trends", limit=1)] == ["t3"]
+    assert archive.user_submissions(7, 5)[0]["id"] == "s1"
+    assert archive.user_submissions(8, 5) == []
+
+    competition = Archive(str(tmp_path)).past_entries("competitions")[0]
+    assert competition["submissions"]["7"][0]["username"] == "ana"
+
+
+def test_store_moves_old_trends_to_the_archive(tmp_path):
+    store = DataManager(str(tmp_path), keep_recent=1)
+    for name in ("t1", "t2", "t3"):
+        store.announce_trend(name, "desc")
+        if name == "t1":
+            store.submit_outfit(7, "ana", "u1")
+        store.end_current_trend()
+    store.announce_trend("t4", "desc")  # moves t1's submissions to the archive too
+
+    with open(tmp_path / "trends.json") as f:
+        assert len(json.load(f)["past_trends"]) == 1
+    assert [trend["name"] for trend in store.get_past_trends()] == ["t3", "t2", "t1"]
+    assert [sub["trend_id"] for sub in store.get_outfit_submissions_history(7)] == ["t1"]
@@ -0,0 +1,52 @@
+import json
+
+from blob_store import BlobStore, is_ref
+from data_manager import DataManager
+
+
+def test_blob_store_shares_paragraphs_and_sweeps_dead_objects(tmp_path):
+    store = BlobStore(str(tmp_path), min_chars=10)
+    analysis = "x" * 200
+    assert store.store_large("short") == "short"
+
+    analysis_ref = store.store_large(analysis)
+    reply_ref = store.store_large(f"Thanks!\n\n{analysis}")
+    assert is_ref(analysis_ref) and is_ref(reply_ref)
+
+    fresh = BlobStore(str(tmp_path))
+    assert fresh.resolve(reply_ref) == f"Thanks!\n\n{analysis}"
+    assert fresh.resolve("plain") == "plain"
+
+    # The shared paragraph survives because the reply still uses it
+    assert store.sweep([reply_ref]) == 1
+    assert BlobStore(str(tmp_path)).resolve(reply_ref) == f"Thanks!\n\n{analysis}"
+
+
+def test_messages_shaped_like_references_are_kept_as_text(tmp_path):
+    store = DataManager(str(tmp_path))
+    existing = store.blobs.put("y" * 600)  # someone else's stored reply
+    missing = "blob:" + "0" * 64
+    store.add_to_chat_history(7, existing, "ok")
+    store.add_to_chat_history(7, missing, "blob:=not escaped twice")
+
+    history = DataManager(str(tmp_path)).get_chat_history(7)
+    assert [(turn.user_message, turn.ai_response) for turn in history] == [
+        (existing, "ok"), (missing, "blob:=not escaped twice")]
+
+    store.relocate_text(to_blobs=False)
+    store.relocate_text(to_blobs=True)
+    assert [turn.user_message for turn in store.get_chat_history(7)] == [existing, missing]
+
+
+def test_unescaped_reference_shaped_text_from_older_files_is_returned_as_is(tmp_path):
+    store = DataManager(str(tmp_path))
+    store.add_to_chat_history(7, "hi", "ok")
+    with open(store.chat_history_file) as f:
+        data = json.load(f)
+    missing = "blob:" + "0" * 64
+    table = data["user_histories"]
+    table["rows"]["7"][0][table["fields"].index("user_message")] = missing
+    with open(store.chat_history_file, "w") as f:
+        json.dump(data, f)
+
+    assert DataManager(str(tmp_path)).get_chat_history(7)[0].user_message == missing
@@ -0,0 +1,35 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from challenge_scheduler import ChallengeScheduler, challenge_deadline
+
+
+def test_legacy_challenge_deadline_uses_duration():
+    start = datetime(2024, 1, 1)
+    legacy = {"start_date": start.isoformat(), "end_date": start.isoformat(), "duration_days": 2}
+    assert challenge_deadline(legacy) == (start + timedelta(days=2)).timestamp()
+
+
+def test_due_callbacks_run_in_deadline_order_and_respect_cancel():
+    fired = []
+
+    async def on_due(guild_id, kind, challenge_id):
+        fired.append((guild_id, kind, challenge_id))
+
+    async def scenario():
+        scheduler = ChallengeScheduler(on_due)
+        scheduler.start()
+        now = time.time()
+        scheduler.schedule(now + 0.15, 1, "trend", "late")
+        scheduler.schedule(now + 0.05, 2, "competition", "early")
+        scheduler.schedule(now + 0.05, 3, "trend", "cancelled")
+        scheduler.cancel(3, "trend", "cancelled")
+        scheduler.schedule(now + 10, 4, "trend", "moved")
+        scheduler.schedule(now + 0.1, 4, "trend", "moved")
+        await asyncio.sleep(0.3)
+        await scheduler.stop()
+        assert scheduler.pending() == []
+
+    asyncio.run(scenario())
+    assert fired == [(2, "competition", "early"), (4, "trend", "moved"), (1, "trend", "late")]
@@ -0,0 +1,96 @@
+import gc
+
+import pytest
+
+from data_manager import DataManager, GuildDataManagers
+
+
+@pytest.fixture
+def store(tmp_path):
+    return DataManager(str(tmp_path))
+
+
+def test_guilds_have_separate_stores(tmp_path):
+    guilds = GuildDataManagers(str(tmp_path))
+    guilds.get(1).add_points(7, 10, "ana")
+    guilds.get(2).add_points(7, 3, "ana")
+
+    assert guilds.get(1).get_user(7)["points"] == 10
+    assert guilds.get(2).get_user(7)["points"] == 3
+    assert guilds.get(None) is guilds.default
+    assert guilds.default.get_user(7) is None
+    assert guilds.guild_ids() == ["1", "2"]
+
+
+def test_evicted_guild_store_is_rebuilt_from_disk(tmp_path):
+    guilds = GuildDataManagers(str(tmp_path), max_cached=1)
+    guilds.get(1).add_points(7, 10, "ana")
+    guilds.get(2)
+    assert guilds.cached_guild_ids() == ["2"]
+    assert guilds.get(1).get_user(7)["points"] == 10
+
+
+def test_legacy_guild_is_seeded_from_the_old_files(tmp_path):
+    DataManager(str(tmp_path)).add_points(7, 42, "ana")
+    guilds = GuildDataManagers(str(tmp_path), legacy_guild_id=5)
+    assert guilds.get(5).get_user(7)["points"] == 42
+    assert guilds.get(6).get_user(7) is None
+
+
+def test_command_votes_count_for_the_latest_entry(store):
+    store.start_competition("Spring", "desc", "sponsor")
+    store.submit_competition_entry(1, "ana", "u1", "first")
+    store.submit_competition_entry(2, "bo", "u2", "only")
+    store.vote_for_submission(10, 1)
+    store.vote_for_submission(11, 1)
+    store.vote_for_submission(12, 2)
+    # A new entry starts again from zero
+    store.submit_competition_entry(1, "ana", "u3", "second")
+    store.vote_for_submission(13, 1)
+
+    info, top = store.get_competition_standings()
+    assert info == {"name": "Spring", "voting": "command"}
+    assert [(entry["user_id"], entry["votes"]) for entry in top] == [("1", 1), ("2", 1)]
+
+    ok, ended = store.end_competition()
+    assert ok and ended["winner"]["user_id"] == "1" and ended["winner"]["votes"] == 1
+    assert store.get_competition_standings() == (None, [])
+
+
+def test_reaction_votes_count_for_the_best_entry(store):
+    store.start_competition("Spring", "desc", "sponsor", voting="reactions")
+    competition_id = store.get_active_competition()["start_date"]
+    store.submit_competition_entry(1, "ana", "u1", "first")
+    store.submit_competition_entry(1, "ana", "u2", "second")
+    store.submit_competition_entry(2, "bo", "u3", "only")
+    store.checkpoint_votes(competition_id, {"10": "1/0", "11": "1/0", "12": "1/1", "13": "2/0"})
+
+    _, top = store.get_competition_standings()
+    assert [(entry["user_id"], entry["votes"]) for entry in top] == [("1", 2), ("2", 1)]
+
+
+def test_standings_follow_writes_from_another_store(tmp_path):
+    first = DataManager(str(tmp_path))
+    second = DataManager(str(tmp_path))
+    first.start_competition("Spring", "desc", "sponsor")
+    first.submit_competition_entry(1, "ana", "u1", "entry")
+    assert first.get_competition_standings()[1][0]["votes"] == 0
+
+    second.submit_competition_entry(2, "bo", "u2", "entry")
+    second.vote_for_submission(10, 2)
+    _, top = first.get_competition_standings()
+    assert [(entry["user_id"], entry["votes"]) for entry in top] == [("2", 1), ("1", 0)]
+
+
+def test_evicted_guild_store_still_in_use_is_handed_out_again(tmp_path):
+    guilds = GuildDataManagers(str(tmp_path), max_cached=1)
+    held = guilds.get(1)
+    guilds.get(2)  # evicts guild 1 from the cache
+    assert 1 not in map(int, guilds.cached_guild_ids())
+    assert guilds.get(1) is held
+    assert held in guilds.loaded()
+
+    del held
+    guilds.get(2)
+    gc.collect()
+    assert len(guilds.loaded()) == 2  # the default store and guild 2
@@ -0,0 +1,59 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+import hot_reload
+from hot_reload import ReloadError, reload_agent
+
+AGENT_SOURCE = """
+VERSION = {version!r}
+
+class MistralAgent:
+    def reloaded(self):
+        self.version = VERSION
+"""
+
+
+@pytest.fixture
+def agent_module(tmp_path, monkeypatch):
+    """A stand-in agent.py registered as the `agent` module."""
+    path = tmp_path / "agent.py"
+    path.write_text(AGENT_SOURCE.format(version=1))
+    spec = importlib.util.spec_from_file_location("agent", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    monkeypatch.setitem(sys.modules, "agent", module)
+    monkeypatch.setattr(hot_reload, "RELOADABLE_MODULES", ("agent",))
+    monkeypatch.setenv("RELOAD_TEST", "old")
+    return path
+
+
+def test_reload_switches_the_running_agent(agent_module, tmp_path):
+    agent = sys.modules["agent"].MistralAgent()
+    old_module = sys.modules["agent"]
+    agent_module.write_text(AGENT_SOURCE.format(version=2))
+    (tmp_path / ".env").write_text("RELOAD_TEST=new\n")
+
+    assert reload_agent(agent, str(tmp_path / ".env"))[0] == ["agent"]
+    assert agent.version == 2
+    assert os.environ["RELOAD_TEST"] == "new"
+    assert old_module.VERSION == 1  # the old module object is left alone
+
+
+def test_failed_reload_keeps_the_old_code(agent_module, tmp_path):
+    agent = sys.modules["agent"].MistralAgent()
+    old_module, old_class = sys.modules["agent"], agent.__class__
+    agent_module.write_text("import does_not_exist\n" + AGENT_SOURCE.format(version=2))
+    (tmp_path / ".env").write_text("RELOAD_TEST=new\n")
+
+    with pytest.raises(ReloadError):
+        reload_agent(agent, str(tmp_path / ".env"))
+    assert sys.modules["agent"] is old_module
+    assert agent.__class__ is old_class
+    assert os.environ["RELOAD_TEST"] == "old"
+
+    agent_module.write_text("def broken(:\n")
+    with pytest.raises(ReloadError, match="line 1"):
+        reload_agent(agent, str(tmp_path / ".env"))
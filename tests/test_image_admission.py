@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from image_admission import (MAX_IMAGE_PIXELS, ImageRejected, MemoryBudget, check_image,
+                             estimate_cost, pixel_limit)
+
+MB = 1024 * 1024
+
+
+def test_pixel_limit_is_the_largest_image_that_fits():
+    budget = 200 * MB
+    pixels = pixel_limit(budget, body_bytes=10 * MB)
+    side = int(pixels ** 0.5)
+    assert estimate_cost(10 * MB, side, side) <= budget
+    assert estimate_cost(10 * MB, side + 100, side + 100) > budget
+    assert pixel_limit(10 ** 12) == MAX_IMAGE_PIXELS
+    assert pixel_limit(MB, body_bytes=2 * MB) == 0
+
+
+def test_check_image_rejects_by_type_and_pixels():
+    check_image(size=MB, width=1000, height=1000, content_type="image/png")
+    with pytest.raises(ImageRejected):
+        check_image(content_type="text/plain")
+    with pytest.raises(ImageRejected):
+        check_image(width=4000, height=4000, max_pixels=10_000_000)
+
+
+def test_growing_reservation_keeps_its_body_and_goes_before_new_jobs():
+    async def scenario():
+        budget = MemoryBudget(100)
+        async with budget.reserve(40) as first:
+            await budget.acquire(50)  # another job admitted
+            newcomer = asyncio.create_task(budget.acquire(45))
+            await asyncio.sleep(0)
+            grow = asyncio.create_task(first.resize(60))
+            await asyncio.sleep(0)
+            assert budget.in_use == 90  # the body is still held while waiting
+            budget.release(50)
+            await grow
+            assert first.cost == 60
+            assert not newcomer.done()
+        await newcomer
+        assert budget.in_use == 45
+
+    asyncio.run(scenario())
+
+
+def test_growing_jobs_that_hold_everything_do_not_deadlock():
+    budget = MemoryBudget(100)
+    peak = []
+
+    async def job():
+        async with budget.reserve(50) as reservation:
+            await asyncio.sleep(0)  # both bodies are held before either grows
+            await reservation.resize(70)
+            peak.append(budget.in_use)
+
+    async def scenario():
+        await asyncio.wait_for(asyncio.gather(job(), job()), 1)
+
+    asyncio.run(scenario())
+    # The first grower goes over budget; the second grows once the first is done
+    assert peak == [120, 70]
+    assert budget.in_use == 0
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        budget = MemoryBudget(100)
+        await budget.acquire(80)
+        waiter = asyncio.create_task(budget.acquire(50))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert budget.snapshot() == {"budget": 100, "in_use": 80, "waiting": 0}
+
+    asyncio.run(scenario())
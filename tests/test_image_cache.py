@@ -0,0 +1,74 @@
+import os
+import time
+
+import image_cache
+from image_cache import ImageCache
+
+
+def age(cache, submission_id, seconds):
+    then = time.time() - seconds
+    os.utime(cache._path(submission_id), (then, then))
+
+
+def test_put_and_get_round_trip(tmp_path):
+    cache = ImageCache(str(tmp_path / "images"))
+    assert cache.get("s1") is None
+    cache.put("s1", b"jpeg bytes")
+    assert cache.get("s1") == b"jpeg bytes"
+
+
+def test_least_recently_used_images_are_evicted_over_the_size_cap(tmp_path):
+    cache = ImageCache(str(tmp_path), max_bytes=25)
+    cache.put("s1", b"x" * 10)
+    cache.put("s2", b"x" * 10)
+    age(cache, "s1", 60)
+    age(cache, "s2", 30)
+    assert cache.get("s1") == b"x" * 10  # s2 is now the least recently used
+
+    cache.put("s3", b"x" * 10)
+    assert cache.get("s2") is None
+    assert cache.get("s1") is not None and cache.get("s3") is not None
+
+
+def test_expired_images_are_not_served_and_are_evicted(tmp_path):
+    cache = ImageCache(str(tmp_path), max_age=3600)
+    cache.put("old", b"x")
+    cache.put("new", b"y")
+    age(cache, "old", 7200)
+    assert cache.get("old") is None
+
+    assert cache.evict() == 1
+    assert sorted(os.listdir(tmp_path)) == ["new.jpg"]
+
+
+def test_overwriting_an_image_counts_only_the_new_size(tmp_path):
+    cache = ImageCache(str(tmp_path), max_bytes=25)
+    cache.put("s1", b"x" * 10)
+    for _ in range(3):
+        cache.put("s2", b"y" * 10)
+    assert cache._total_bytes == 20
+    assert cache.get("s1") is not None
+
+
+def test_expired_images_are_swept_on_put_below_the_size_cap(tmp_path, monkeypatch):
+    cache = ImageCache(str(tmp_path), max_age=3600)
+    cache.put("old", b"x")
+    age(cache, "old", 7200)
+    cache.put("new", b"y")
+    assert os.path.exists(cache._path("old"))  # swept at most every SWEEP_INTERVAL
+
+    monkeypatch.setattr(image_cache, "SWEEP_INTERVAL", 0)
+    cache._next_sweep = 0
+    cache.put("newer", b"z")
+    assert sorted(os.listdir(tmp_path)) == ["new.jpg", "newer.jpg"]
+
+
+def test_image_evicted_while_being_read_is_still_served(tmp_path, monkeypatch):
+    cache = ImageCache(str(tmp_path))
+    cache.put("s1", b"jpeg")
+
+    def evicted(path, *args):
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(os, "utime", evicted)
+    assert cache.get("s1") == b"jpeg"
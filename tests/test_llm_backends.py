@@ -0,0 +1,173 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+import llm_backends
+from llm_backends import (CachedPrefix, FakeBackend, GeminiHTTPBackend, RecordReplayBackend, ReplayMissError,
+                          create_backend, parse_latency_spec)
+
+IMAGE = {"mime_type": "image/jpeg", "data": "aGVsbG8="}
+
+
+def test_fake_backend_is_deterministic_per_seed():
+    first, again, other = FakeBackend(seed=1), FakeBackend(seed=1), FakeBackend(seed=2)
+    prompts = [f"question {i}" for i in range(8)]
+    answers = [first.generate_content(prompt).text for prompt in prompts]
+    assert answers == [again.generate_content(prompt).text for prompt in prompts]
+    assert answers != [other.generate_content(prompt).text for prompt in prompts]
+    assert first.calls == 8
+
+
+def test_fake_image_analysis_has_the_rating_lines():
+    text = FakeBackend().generate_content(["Analyze this outfit", IMAGE]).text
+    for label in ("Trend Accuracy:", "Creativity:", "Overall Fit:", "## Improvement Tips"):
+        assert label in text
+
+
+def test_fake_latency_is_slept():
+    slept = []
+    FakeBackend(latency="fixed:0.25", sleep=slept.append).generate_content("hi")
+    assert slept == [0.25]
+
+
+@pytest.mark.parametrize("spec, expected", [
+    ("", ("fixed", (0.0,))),
+    ("0.5", ("fixed", (0.5,))),
+    ("uniform:0.1,0.5", ("uniform", (0.1, 0.5))),
+    ("lognormal:-0.3,0.4", ("lognormal", (-0.3, 0.4))),
+])
+def test_parse_latency_spec(spec, expected):
+    assert parse_latency_spec(spec) == expected
+
+
+@pytest.mark.parametrize("spec", ["gamma:1,2", "uniform:0.1"])
+def test_parse_latency_spec_rejects_bad_specs(spec):
+    with pytest.raises(ValueError):
+        parse_latency_spec(spec)
+
+
+def test_record_then_replay_without_the_inner_backend(tmp_path):
+    recorder = RecordReplayBackend(str(tmp_path), mode="record", inner=FakeBackend(seed=3))
+    recorded = recorder.generate_content(["Analyze this outfit", IMAGE]).text
+
+    replayer = RecordReplayBackend(str(tmp_path), mode="replay")
+    assert replayer.generate_content(["Analyze this outfit", IMAGE]).text == recorded
+    with pytest.raises(ReplayMissError):
+        replayer.generate_content("never recorded")
+
+
+def test_create_backend_from_environment(monkeypatch):
+    monkeypatch.setenv("FAKE_LLM_SEED", "7")
+    backend = create_backend(kind="fake")
+    assert isinstance(backend, FakeBackend) and backend.seed == 7
+    with pytest.raises(ValueError):
+        create_backend(kind="nope")
+
+
+def test_fake_backend_reports_cached_tokens_only_above_the_threshold():
+    backend = FakeBackend(min_cache_tokens=100)
+    short, long = CachedPrefix("s" * 40), CachedPrefix("l" * 800)
+    for _ in range(2):
+        short_usage = backend.generate_content([short, "question"]).usage
+        long_usage = backend.generate_content([long, "question"]).usage
+    assert short_usage["cachedContentTokenCount"] == 0
+    assert long_usage["cachedContentTokenCount"] == 200
+
+
+class RecordingHTTPBackend(GeminiHTTPBackend):
+    def __init__(self, **kwargs):
+        super().__init__(api_key="test", min_cache_tokens=10, **kwargs)
+        self._session = object()
+        self.posts = []
+
+    def _post(self, url, body):
+        self.posts.append((url, body))
+        if url == self.cache_url:
+            return SimpleNamespace(status_code=200, json=lambda: {"name": "cachedContents/abc"})
+        return SimpleNamespace(status_code=200, headers={}, raise_for_status=lambda: None, json=lambda: {
+            "candidates": [{"content": {"parts": [{"text": "ok"}]}}]})
+
+
+def test_http_backend_caches_a_long_prefix_once_and_sends_only_the_rest():
+    backend = RecordingHTTPBackend()
+    prefix = CachedPrefix("p" * 400)
+    for question in ("first", "second"):
+        assert backend.generate_content([prefix, IMAGE, question]).text == "ok"
+
+    urls = [url for url, _ in backend.posts]
+    assert urls == [backend.cache_url, backend.url, backend.url]
+    body = backend.posts[-1][1]
+    assert body["cachedContent"] == "cachedContents/abc"
+    assert body["contents"][0]["parts"][1] == {"text": "second"}
+    assert len(body["contents"][0]["parts"]) == 2
+
+
+def test_http_backend_sends_short_prefixes_inline():
+    backend = RecordingHTTPBackend()
+    backend.generate_content([CachedPrefix("short"), "question"])
+    [(url, body)] = backend.posts
+    assert url == backend.url and "cachedContent" not in body
+    assert body["contents"][0]["parts"] == [{"text": "short"}, {"text": "question"}]
+
+
+class CacheTestBackend(GeminiHTTPBackend):
+    def __init__(self, responses, **kwargs):
+        super().__init__(api_key="test", min_cache_tokens=10, **kwargs)
+        self.responses = responses
+        self.posts = []
+        self.entered = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def _post(self, url, body):
+        self.posts.append(url)
+        self.entered.set()
+        self.release.wait(1)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def test_short_prefixes_are_never_cached():
+    backend = CacheTestBackend([])
+    assert backend._cached_content(CachedPrefix("short")) is None
+    assert backend.posts == []
+
+
+def test_concurrent_calls_send_the_prefix_inline_while_it_is_created():
+    created = SimpleNamespace(status_code=200, json=lambda: {"name": "cachedContents/abc"})
+    backend = CacheTestBackend([created])
+    backend.release.clear()
+    prefix = CachedPrefix("p" * 400)
+
+    creator = threading.Thread(target=lambda: backend._cached_content(prefix))
+    creator.start()
+    backend.entered.wait(1)
+    assert backend._cached_content(prefix) is None  # not blocked behind the POST
+    backend.release.set()
+    creator.join(1)
+
+    assert backend._cached_content(prefix) == "cachedContents/abc"
+    assert len(backend.posts) == 1
+
+
+def test_refusals_are_remembered_for_a_while(monkeypatch):
+    refused = SimpleNamespace(status_code=400)
+    created = SimpleNamespace(status_code=200, json=lambda: {"name": "cachedContents/abc"})
+    backend = CacheTestBackend([requests.ConnectionError("offline"), refused, created])
+    prefix = CachedPrefix("p" * 400)
+    now = [1000.0]
+    monkeypatch.setattr(llm_backends.time, "time", lambda: now[0])
+
+    assert backend._cached_content(prefix) is None
+    assert backend._cached_content(prefix) is None
+    assert len(backend.posts) == 1
+
+    now[0] += llm_backends.CACHE_REFUSAL_TTL + 1
+    assert backend._cached_content(prefix) is None
+    now[0] += llm_backends.CACHE_REFUSAL_TTL + 1
+    assert backend._cached_content(prefix) == "cachedContents/abc"
+    assert len(backend.posts) == 3
@@ -0,0 +1,58 @@
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+from metrics import Registry, recent_traces, stage, start_metrics_server, trace_message
+
+
+def test_counter_and_histogram_render_prometheus_text():
+    registry = Registry()
+    commands = registry.counter("test_commands_total", "Commands.", ["command"])
+    latency = registry.histogram("test_seconds", "Latency.", ["command"], buckets=(0.1, 1.0))
+    commands.inc(command="!points")
+    commands.inc(2, command="!points")
+    latency.observe(0.5, command='say "hi"')
+
+    lines = registry.render().splitlines()
+    assert "# TYPE test_commands_total counter" in lines
+    assert 'test_commands_total{command="!points"} 3' in lines
+    assert 'test_seconds_bucket{command="say \\"hi\\"",le="0.1"} 0' in lines
+    assert 'test_seconds_bucket{command="say \\"hi\\"",le="1.0"} 1' in lines
+    assert 'test_seconds_bucket{command="say \\"hi\\"",le="+Inf"} 1' in lines
+    assert 'test_seconds_count{command="say \\"hi\\""} 1' in lines
+
+
+def test_stages_are_attached_to_the_message_trace():
+    with trace_message("m-stages", "!submit") as trace:
+        with stage("download"):
+            pass
+        with pytest.raises(ValueError):
+            with stage("model_call"):
+                raise ValueError("boom")
+    with stage("outside"):
+        pass  # no active trace
+
+    [recorded] = recent_traces("m-stages")
+    assert recorded["command"] == "!submit" and recorded["outcome"] == "ok"
+    assert [(span["name"], span["error"]) for span in recorded["spans"]] == [
+        ("download", None), ("model_call", "ValueError")]
+    assert trace.duration is not None
+
+
+def test_metrics_endpoint_serves_metrics_and_traces():
+    with trace_message("m-http", "!leaderboard"):
+        pass
+    server = start_metrics_server(0)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        with urllib.request.urlopen(f"{base}/metrics") as response:
+            assert "fashionbot_commands_total" in response.read().decode()
+        with urllib.request.urlopen(f"{base}/traces?message_id=m-http") as response:
+            assert [trace["command"] for trace in json.load(response)] == ["!leaderboard"]
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"{base}/nope")
+    finally:
+        server.shutdown()
+        server.server_close()
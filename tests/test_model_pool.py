@@ -0,0 +1,100 @@
+import pytest
+
+from llm_backends import BackendResponse, RateLimitedError
+from model_pool import ModelPool, PoolMember, PoolExhaustedError, is_rate_limit
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class ScriptedBackend:
+    def __init__(self, outcomes, model_name="test-model"):
+        self.model_name = model_name
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def generate_content(self, contents):
+        self.calls += 1
+        outcome = self.outcomes.pop(0) if self.outcomes else BackendResponse("ok")
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def make_pool(*backends, **kwargs):
+    clock = FakeClock()
+    members = [PoolMember(f"key{index}", backend) for index, backend in enumerate(backends)]
+    return ModelPool(members, sleep=clock.sleep, clock=clock, **kwargs), clock
+
+
+def test_rate_limited_call_moves_to_another_member():
+    limited = ScriptedBackend([RateLimitedError("429", retry_after=30)])
+    healthy = ScriptedBackend([BackendResponse("from healthy")])
+    pool, _ = make_pool(limited, healthy)
+    # least-loaded picks the first member when both are idle
+    assert pool.generate_content("hi").text == "from healthy"
+    assert pool.members[0].rate_limited == 1
+    assert pool.members[0].today == 0
+
+
+def test_remaining_quota_strategy_prefers_the_emptier_member():
+    busy, idle = ScriptedBackend([]), ScriptedBackend([])
+    pool, clock = make_pool(busy, idle, strategy="remaining-quota")
+    pool.members[0].recent.extend((clock.now, 0) for _ in range(10))
+    for _ in range(3):
+        pool.generate_content("hi")
+    assert (busy.calls, idle.calls) == (0, 3)
+    assert pool.usage()[1]["requests"] == 3
+
+
+def test_daily_quota_exhaustion_raises():
+    backend = ScriptedBackend([])
+    clock = FakeClock()
+    pool = ModelPool([PoolMember("key0", backend, rpd=2)], sleep=clock.sleep, clock=clock)
+    pool.generate_content("hi")
+    pool.generate_content("hi")
+    with pytest.raises(PoolExhaustedError):
+        pool.generate_content("hi")
+    assert backend.calls == 2
+
+
+def test_unknown_strategy_is_rejected():
+    with pytest.raises(ValueError):
+        make_pool(ScriptedBackend([]), strategy="round-robin")
+
+
+def test_zero_retry_delay_fails_after_max_attempts():
+    backend = ScriptedBackend([RateLimitedError("429", retry_after=0)] * 20)
+    pool, clock = make_pool(backend, max_wait=60, max_attempts=6)
+
+    with pytest.raises(PoolExhaustedError):
+        pool.generate_content("hi")
+    assert backend.calls == 6
+    # Every retry waited at least base_backoff instead of spinning
+    assert clock.now - 1000.0 >= 5 * pool.base_backoff
+
+
+def test_only_real_429s_count_as_rate_limits():
+    assert is_rate_limit(RateLimitedError("slow down"))
+
+    class SdkError(Exception):
+        code = 429
+
+    assert is_rate_limit(SdkError())
+    assert not is_rate_limit(ValueError("user 4290 not found"))
+
+
+def test_usage_reports_cooldown_on_the_pool_clock():
+    backend = ScriptedBackend([RateLimitedError("429", retry_after=10)])
+    pool, clock = make_pool(backend, max_wait=60)
+    pool.generate_content("hi")
+    assert pool.usage()[0]["cooling_down"] == 0.0
+    assert pool.usage()[0]["rate_limited"] == 1
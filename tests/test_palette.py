@@ -0,0 +1,41 @@
+import numpy as np
+from PIL import Image
+
+from palette import _to_lab, color_name, describe_profile, image_profile, with_measured_colors
+
+
+def lab(rgb):
+    return _to_lab(np.array([rgb], dtype=np.float32) / 255.0)[0]
+
+
+def test_color_names_are_the_nearest_in_lab():
+    assert color_name(lab((0, 0, 0))) == "black"
+    assert color_name(lab((250, 250, 250))) == "white"
+    assert color_name(lab((214, 196, 158))) == "beige"
+
+
+def test_profile_finds_the_outfit_over_the_background():
+    img = Image.new("RGB", (600, 800), (245, 245, 245))
+    img.paste((15, 15, 15), (150, 200, 450, 600))  # a black outfit in the middle
+    profile = image_profile(img)
+
+    names = [color["name"] for color in profile["colors"]]
+    assert names[:2] == ["black", "white"]
+    assert abs(sum(color["share"] for color in profile["colors"]) - 1.0) < 0.01
+    assert profile["colors"][0]["hex"] == "#0f0f0f"
+    assert (profile["width"], profile["height"], profile["aspect"]) == (600, 800, 0.75)
+
+    colors, facts = describe_profile(profile)
+    assert colors.startswith("black (")
+    assert "contrast high" in facts and "portrait 600x800" in facts
+
+
+def test_measured_colors_replace_or_add_the_colors_line():
+    analysis = "## Visual Inventory\n- Top: tee\n- Colors: navy, red\n\n## Scores"
+    assert with_measured_colors(analysis, "black (60%)") == (
+        "## Visual Inventory\n- Top: tee\n- Colors: black (60%)\n\n## Scores")
+
+    missing = "## Visual Inventory\n- Top: tee\n- Shoes: boots\n\n## Scores"
+    assert with_measured_colors(missing, "black (60%)") == (
+        "## Visual Inventory\n- Top: tee\n- Shoes: boots\n- Colors: black (60%)\n\n## Scores")
+    assert with_measured_colors("Nice fit", "black (60%)").startswith("## Visual Inventory\n- Colors: black")
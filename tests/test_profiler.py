@@ -0,0 +1,73 @@
+import sys
+import threading
+import time
+
+import pytest
+
+from profiler import ProfileSession, StackSampler, parse_duration
+
+
+def test_parse_duration_units():
+    assert parse_duration("500ms") == 0.5
+    assert parse_duration("2m") == 120
+    assert parse_duration(" 30S ") == 30
+    assert parse_duration("1.5") == 1.5
+
+
+@pytest.mark.parametrize("text", ["nan", "inf", "-infs", "soon"])
+def test_parse_duration_rejects_non_finite_and_garbage(text):
+    with pytest.raises(ValueError):
+        parse_duration(text)
+
+
+def _busy_work(seconds):
+    end = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < end:
+        total += sum(range(100))
+    return total
+
+
+@pytest.mark.parametrize("mode, suffix", [("sample", ".collapsed"), ("pstats", ".pstats")])
+def test_profile_session_writes_reports(tmp_path, mode, suffix):
+    session = ProfileSession(1, mode=mode, folder=str(tmp_path), interval=0.001)
+    session.start()
+    _busy_work(0.1)
+    summary, paths = session.stop()
+
+    assert summary.startswith("## Profile")
+    assert "**Memory:**" in summary
+    assert [path[-len(suffix):] for path in paths[:1]] == [suffix]
+    assert paths[-1].endswith("-memory.txt")
+    if mode == "sample":
+        with open(paths[0]) as f:
+            assert "_busy_work" in f.read()
+
+
+def test_sampler_sees_worker_threads():
+    sampler = StackSampler(interval=0.001)
+    worker = threading.Thread(target=_busy_work, args=(0.1,), name="image-worker")
+    sampler.start()
+    worker.start()
+    worker.join()
+    sampler.stop()
+
+    assert any(stack.startswith("thread:image-worker;") and stack.endswith("_busy_work")
+               for stack in sampler.stacks)
+    assert "image-worker" in dict(sampler.thread_samples())
+
+
+def test_reports_can_be_written_from_a_worker_thread(tmp_path):
+    session = ProfileSession(1, mode="pstats", folder=str(tmp_path))
+    session.start()
+    _busy_work(0.05)
+    session.halt()
+    assert sys.getprofile() is None  # cProfile is off on the profiled thread
+
+    result = {}
+    worker = threading.Thread(target=lambda: result.update(report=session.write_reports()))
+    worker.start()
+    worker.join()
+    summary, paths = result["report"]
+    assert "_busy_work" in summary
+    assert paths[0].endswith(".pstats")
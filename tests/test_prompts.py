@@ -0,0 +1,30 @@
+from llm_backends import CachedPrefix
+from prompts import PromptTemplates, response_usage
+
+
+def test_prefixes_are_built_once_per_trend_and_submission():
+    templates = PromptTemplates(max_entries=2)
+    prefix = templates.submit_prefix("Y2K")
+    assert isinstance(prefix, CachedPrefix) and "Y2K trend challenge" in prefix
+    assert templates.submit_prefix("Y2K") is prefix
+
+    submission = {"id": "s1", "analysis_text": "Nice denim", "ratings": {"trend_accuracy": 8}}
+    feedback = templates.feedback_prefix(submission)
+    assert "Nice denim" in feedback and "Trend Accuracy: 8/10" in feedback
+    assert templates.feedback_prefix(dict(submission)) is feedback
+    # A re-rated analysis gets a new prefix
+    assert templates.feedback_prefix({**submission, "analysis_text": "Rewritten"}) is not feedback
+
+    # The least recently used prefix was dropped
+    assert templates.submit_prefix("Y2K") is not prefix
+
+
+def test_usage_falls_back_to_an_estimate():
+    class Response:
+        usage = {}
+
+    image = {"mime_type": "image/jpeg", "data": "aGVsbG8="}
+    assert response_usage(["x" * 400, image], Response()) == (100 + 258, 0)
+
+    Response.usage = {"promptTokenCount": 500, "cachedContentTokenCount": 300}
+    assert response_usage(["x" * 400], Response()) == (500, 300)
@@ -0,0 +1,43 @@
+import pytest
+
+import records
+from data_manager import DataManager
+from records import CompetitionEntry, Submission, User, decode_table, encode_table
+
+
+@pytest.mark.parametrize("compact", [True, False])
+def test_users_round_trip(compact):
+    users = {"1": User(username="ana", points=12, wins=1), "2": User(username="bo")}
+    raw = records.loads(records.dumps(encode_table(users, User, compact=compact), compact=compact))
+    decoded = decode_table(raw, User)
+    assert decoded == users
+    assert decoded["1"]["points"] == 12
+    assert decoded["2"].get("wins") == 0
+
+
+def test_nested_ratings_and_many_rows_round_trip():
+    submission = Submission(id="s1", user_id=1, username="ana", trend_id="t",
+                            image_url="u", submission_date="2024-01-01")
+    submission["ratings"]["creativity"] = 7.5
+    decoded = decode_table(records.loads(records.dumps(encode_table({"s1": submission}, Submission))), Submission)
+    assert decoded["s1"]["ratings"]["creativity"] == 7.5
+    assert "fit" not in decoded["s1"]["ratings"]
+
+    entries = {"1": [CompetitionEntry("1", "ana", "u", "d", "t0"), CompetitionEntry("1", "ana", "u2", "d", "t1", votes=3)]}
+    decoded = decode_table(records.loads(records.dumps(encode_table(entries, CompetitionEntry, many=True))),
+                           CompetitionEntry, many=True)
+    assert [entry["votes"] for entry in decoded["1"]] == [0, 3]
+
+
+def test_store_reads_files_written_in_either_layout(tmp_path):
+    legacy = DataManager(str(tmp_path), compact=False)
+    legacy.add_points(7, 12, "ana")
+    with open(tmp_path / "users.json", "rb") as f:
+        assert b'"fields"' not in f.read()
+
+    compact = DataManager(str(tmp_path))
+    assert compact.get_user(7)["points"] == 12
+    compact.add_points(7, 1)
+    with open(tmp_path / "users.json", "rb") as f:
+        assert b'"fields"' in f.read()
+    assert DataManager(str(tmp_path), compact=False).get_user(7)["points"] == 13
@@ -0,0 +1,51 @@
+import asyncio
+
+from render_cache import RenderCache
+
+
+def test_hits_until_a_topic_is_invalidated():
+    cache = RenderCache()
+    renders = []
+
+    async def render():
+        renders.append(1)
+        return f"render {len(renders)}"
+
+    async def scenario():
+        assert await cache.get(("leaderboard",), ("leaderboard",), render) == "render 1"
+        assert await cache.get(("leaderboard",), ("leaderboard",), render) == "render 1"
+        cache.invalidate("user:1")
+        assert await cache.get(("leaderboard",), ("leaderboard",), render) == "render 1"
+        cache.invalidate("leaderboard")
+        assert await cache.get(("leaderboard",), ("leaderboard",), render) == "render 2"
+
+    asyncio.run(scenario())
+    assert (cache.hits, cache.misses) == (2, 2)
+
+
+def test_write_during_render_leaves_entry_stale():
+    cache = RenderCache()
+
+    async def render_racing_a_write():
+        cache.invalidate("standings")
+        return "old"
+
+    async def render_fresh():
+        return "new"
+
+    async def scenario():
+        assert await cache.get(("standings",), ("standings",), render_racing_a_write) == "old"
+        assert await cache.get(("standings",), ("standings",), render_fresh) == "new"
+
+    asyncio.run(scenario())
+
+
+def test_least_recently_used_entry_is_dropped():
+    cache = RenderCache(max_entries=2)
+
+    async def scenario():
+        for key in ("a", "b", "a", "c"):
+            await cache.get((key,), (), lambda: asyncio.sleep(0, key))
+
+    asyncio.run(scenario())
+    assert list(cache._entries) == [("a",), ("c",)]
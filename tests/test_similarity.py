@@ -0,0 +1,61 @@
+import os
+
+import numpy as np
+from PIL import Image
+
+from similarity import FEATURE_SIZE, SimilarityIndex, outfit_features
+
+
+def striped(color, background=(255, 255, 255), vertical=True):
+    img = Image.new("RGB", (96, 128), background)
+    for i in range(0, 96 if vertical else 128, 16):
+        box = (i, 0, i + 8, 128) if vertical else (0, i, 96, i + 8)
+        img.paste(color, box)
+    return img
+
+
+def test_features_are_unit_vectors():
+    vector = outfit_features(striped((200, 30, 40)))
+    assert vector.shape == (FEATURE_SIZE,)
+    assert vector.dtype == np.float32
+    assert abs(float(np.linalg.norm(vector)) - 1.0) < 1e-5
+
+
+def test_search_ranks_similar_outfits_from_other_users(tmp_path):
+    index = SimilarityIndex(str(tmp_path))
+    index.add({"id": "red", "user_id": 1}, outfit_features(striped((200, 30, 40))))
+    index.add({"id": "red_again", "user_id": 1}, outfit_features(striped((190, 35, 45))))
+    index.add({"id": "dark_red", "user_id": 2}, outfit_features(striped((180, 20, 30))))
+    index.add({"id": "green", "user_id": 3}, outfit_features(striped((30, 160, 60), vertical=False)))
+
+    row = index.latest_for_user(1)
+    assert row == 1
+    assert index.latest_for_user(99) is None
+    results = index.search(row, limit=5)
+    assert [entry["id"] for entry, _ in results] == ["dark_red", "green"]
+    assert results[0][1] > results[1][1]
+
+    # Another process (or a restart) sees the same rows
+    reopened = SimilarityIndex(str(tmp_path))
+    ids = [entry["id"] for entry, _ in reopened.search(1, exclude_user=False)]
+    assert sorted(ids[:2]) == ["dark_red", "red"] and ids[2] == "green"
+
+
+def test_vector_without_an_entry_is_dropped_before_the_next_add(tmp_path):
+    index = SimilarityIndex(str(tmp_path))
+    red, green = outfit_features(striped((200, 30, 40))), outfit_features(striped((30, 160, 60), vertical=False))
+    index.add({"id": "red", "user_id": 1}, red)
+    # A writer that crashed after its vector (and half of another) but before the entry
+    with open(index.vectors_file, "ab") as f:
+        f.write(np.ones(FEATURE_SIZE, dtype=np.float32).tobytes() + b"\0" * 10)
+
+    restarted = SimilarityIndex(str(tmp_path))
+    restarted.add({"id": "green", "user_id": 2}, green)
+
+    reopened = SimilarityIndex(str(tmp_path))
+    row = reopened.latest_for_user(2)
+    assert row == 1
+    [(entry, score)] = reopened.search(row)
+    assert entry["id"] == "red"
+    assert abs(score - float(red @ green)) < 1e-5
+    assert os.path.getsize(reopened.vectors_file) == 2 * FEATURE_SIZE * 4
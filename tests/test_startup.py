@@ -0,0 +1,31 @@
+import os
+import subprocess
+import sys
+
+from agent import MistralAgent
+from data_manager import DataManager
+from llm_backends import FakeBackend
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_importing_the_agent_skips_heavy_libraries():
+    code = ("import sys, agent; "
+            "print(','.join(m for m in ('google.generativeai', 'PIL', 'requests') if m in sys.modules))")
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ""
+
+
+def test_model_backends_are_built_on_first_use(tmp_path, monkeypatch):
+    monkeypatch.setenv("LLM_BACKEND", "fake")
+    agent = MistralAgent(data_manager=DataManager(str(tmp_path)))
+    assert agent._text_model is None and agent._vision_model is None
+
+    model = agent.text_model
+    assert isinstance(model, FakeBackend)
+    assert agent.text_model is model
+    assert agent._vision_model is None
+
+    timings = agent.warm_up()
+    assert agent.warmed_up and set(timings) == {"imports", "models"}
+    assert isinstance(agent._vision_model, FakeBackend)
@@ -0,0 +1,53 @@
+import os
+import subprocess
+import sys
+import threading
+
+from data_manager import DataManager
+from store_lock import store_lock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_one_lock_per_folder(tmp_path):
+    assert store_lock(str(tmp_path)) is store_lock(str(tmp_path / "."))
+    assert store_lock(str(tmp_path)) is not store_lock(str(tmp_path / "other"))
+
+
+def test_lock_is_reentrant_and_excludes_other_threads(tmp_path):
+    lock = store_lock(str(tmp_path))
+    acquired = []
+
+    def other():
+        with lock:
+            acquired.append(True)
+
+    with lock:
+        with lock:
+            thread = threading.Thread(target=other)
+            thread.start()
+            thread.join(0.1)
+            assert not acquired
+    thread.join(1)
+    assert acquired == [True]
+
+
+def test_concurrent_threads_do_not_lose_updates(tmp_path):
+    stores = [DataManager(str(tmp_path)) for _ in range(4)]
+    threads = [threading.Thread(target=lambda s=s: [s.add_points(7, 1, "ana") for _ in range(25)])
+               for s in stores]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert DataManager(str(tmp_path)).get_user(7)["points"] == 100
+
+
+def test_shard_processes_do_not_lose_updates(tmp_path):
+    code = ("import sys; from data_manager import DataManager; "
+            "store = DataManager(sys.argv[1], process_safe=True); "
+            "[store.add_points(7, 1, 'ana') for _ in range(20)]")
+    DataManager(str(tmp_path), process_safe=True)
+    processes = [subprocess.Popen([sys.executable, "-c", code, str(tmp_path)], cwd=ROOT) for _ in range(3)]
+    assert [process.wait(60) for process in processes] == [0, 0, 0]
+    assert DataManager(str(tmp_path)).get_user(7)["points"] == 60
@@ -0,0 +1,34 @@
+import threading
+
+import bot
+from fakes import FakeAttachment, FakeGuild, FakeMessage, FakeUser
+from replay import parse_jsonl_capture
+
+
+def test_captured_messages_are_written_by_the_listener_thread(tmp_path, monkeypatch):
+    path = tmp_path / "capture.jsonl"
+    writers = []
+    listener = bot.setup_traffic_capture(str(path))
+    handler = bot.capture_logger.handlers[-1]
+    file_handler = listener.handlers[0]
+    original_emit = file_handler.emit
+
+    def emit(record):
+        writers.append(threading.get_ident())
+        original_emit(record)
+
+    monkeypatch.setattr(file_handler, "emit", emit)
+    try:
+        guild = FakeGuild(5)
+        bot.capture_message(FakeMessage("!trend", FakeUser(7, "ana"), guild=guild))
+        bot.capture_message(FakeMessage("!submit", FakeUser(8, "bo"), guild=guild,
+                                        attachments=[FakeAttachment("https://cdn.example/a.jpg", b"x")]))
+    finally:
+        listener.stop()  # writes whatever is still queued
+        bot.capture_logger.removeHandler(handler)
+        file_handler.close()
+
+    assert writers and threading.get_ident() not in writers
+    events = parse_jsonl_capture(str(path))
+    assert [(event.author, event.content, event.attachments, event.guild_id) for event in events] == [
+        ("ana", "!trend", 0, 5), ("bo", "!submit", 1, 5)]
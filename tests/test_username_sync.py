@@ -0,0 +1,65 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from data_manager import DataManager
+from fakes import FakeGuild, FakeUser
+from username_sync import UsernameSync
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = DataManager(str(tmp_path))
+    for user_id in (1, 2, 3):
+        store.add_points(user_id, 10, f"old{user_id}")
+    return store
+
+
+def test_reconcile_writes_renames_and_is_not_repeated(store):
+    guild = FakeGuild(members=[FakeUser(1, "ana"), FakeUser(2, "old2")])
+    sync = UsernameSync(store, chunk_size=2)
+
+    assert asyncio.run(sync.reconcile([guild])) == 1
+    assert store.get_user(1)["username"] == "ana"
+    assert store.get_user(2)["username"] == "old2"
+    assert sync._load_state()["cursor"] is None
+
+    guild.add_member(FakeUser(3, "bo"))
+    assert asyncio.run(sync.reconcile([guild])) == 0  # a pass finished recently
+
+
+class FailingAio:
+    def __init__(self, aio):
+        self.aio = aio
+        self.fail = True
+
+    async def update_usernames(self, usernames):
+        await asyncio.sleep(0)
+        if self.fail:
+            raise OSError("disk full")
+        return await self.aio.update_usernames(usernames)
+
+
+def test_failed_flush_requeues_renames_without_overwriting_newer_ones(store):
+    sync = UsernameSync(store)
+    sync.data_manager = SimpleNamespace(aio=FailingAio(store.aio))
+    sync.note_rename(SimpleNamespace(name="old1"), SimpleNamespace(id=1, name="ana"))
+    sync.note_rename(SimpleNamespace(name="old2"), SimpleNamespace(id=2, name="bo"))
+    sync.note_rename(SimpleNamespace(name="same"), SimpleNamespace(id=3, name="same"))
+
+    async def scenario():
+        flushing = asyncio.create_task(sync.flush())
+        await asyncio.sleep(0)
+        sync.note_rename(SimpleNamespace(name="ana"), SimpleNamespace(id=1, name="ana2"))
+        with pytest.raises(OSError):
+            await flushing
+        assert sync.pending == {"1": "ana2", "2": "bo"}
+
+        sync.data_manager.aio.fail = False
+        assert await sync.flush() == 2
+        assert sync.pending == {}
+
+    asyncio.run(scenario())
+    assert store.get_user(1)["username"] == "ana2"
+    assert store.get_user(2)["username"] == "bo"
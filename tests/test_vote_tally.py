@@ -0,0 +1,55 @@
+import asyncio
+
+from vote_tally import ReactionTally
+
+
+class FakeAio:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.checkpoints = []
+
+    async def get_competition_votes(self):
+        competition = {"start_date": "c1", "voting": "reactions",
+                       "entry_messages": {"100": {"channel_id": 1, "user_id": "7", "entry": 0}}}
+        return competition, {}
+
+    async def checkpoint_votes(self, competition_id, reaction_votes):
+        if self.fail:
+            raise OSError("disk full")
+        self.checkpoints.append(dict(reaction_votes))
+        return True
+
+
+class FakeStore:
+    def __init__(self, fail=False):
+        self.aio = FakeAio(fail)
+
+
+def test_one_vote_per_voter_and_withdrawal():
+    async def scenario():
+        tally = ReactionTally(FakeStore(), flush_every=100)
+        assert await tally.note_reaction(100, 1, added=True)
+        assert not await tally.note_reaction(100, 1, added=True)
+        assert not await tally.note_reaction(999, 2, added=True)  # not an entry message
+        assert await tally.note_reaction(100, 1, added=False)
+        assert tally.votes == {}
+        assert tally.pending == 2
+
+    asyncio.run(scenario())
+
+
+def test_failed_checkpoint_keeps_changes_pending():
+    async def scenario():
+        store = FakeStore(fail=True)
+        tally = ReactionTally(store, flush_every=1)
+        await tally.note_reaction(100, 1, added=True)
+        await asyncio.sleep(0)  # the early checkpoint runs and fails
+        assert tally._flushing is None
+        assert tally.pending == 1
+
+        store.aio.fail = False
+        assert await tally.flush() == 1
+        assert tally.pending == 0
+        assert store.aio.checkpoints == [{"1": "7/0"}]
+
+    asyncio.run(scenario())
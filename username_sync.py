@@ -0,0 +1,124 @@
+"""
+Incremental username sync.
+
+Instead of rewriting users.json for every guild on every on_ready, username
+changes arrive through on_member_update/on_user_update, are buffered in memory
+and written in one batch per flush interval. A background reconcile walks the
+stored users in chunks (all disk access happens off the event loop) to catch
+renames that happened while the bot was offline; its progress is persisted so a
+crash or reconnect resumes where it left off instead of starting over.
+"""
+import os
+import time
+import asyncio
+
+
+class UsernameSync:
+    def __init__(self, data_manager, flush_interval=30, chunk_size=500, reconcile_every=24 * 60 * 60):
+        """
+        Args:
+            data_manager (DataManager): Store holding users.json
+            flush_interval (float): Seconds between batched writes of pending renames
+            chunk_size (int): Stored users checked per reconcile step
+            reconcile_every (float): Minimum seconds between completed reconciles
+        """
+        self.data_manager = data_manager
+        self.flush_interval = flush_interval
+        self.chunk_size = chunk_size
+        self.reconcile_every = reconcile_every
+        self.state_file = os.path.join(data_manager.data_folder, "username_sync.json")
+        self.pending = {}
+        self._tasks = []
+
+    @property
+    def started(self):
+        return bool(self._tasks)
+
+    def note_rename(self, before, after):
+        """Queue a rename from a member/user update event. Cheap; no disk access."""
+        if before.name != after.name:
+            self.pending[str(after.id)] = after.name
+
+    async def flush(self):
+        """
+        Write all pending renames in a single users.json update, off the event loop.
+        If the write fails, the batch is queued again for the next flush.
+        """
+        if not self.pending:
+            return 0
+        batch, self.pending = self.pending, {}
+        try:
+            return await self.data_manager.aio.update_usernames(batch)
+        except BaseException:
+            # Renames noted during the write are newer than the batch
+            self.pending = {**batch, **self.pending}
+            raise
+
+    def start(self, guilds):
+        """Start the periodic flusher and the reconcile. Safe to call on every on_ready."""
+        if self.started:
+            return
+        self._tasks = [
+            asyncio.create_task(self._flush_loop()),
+            asyncio.create_task(self.reconcile(guilds)),
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        await self.flush()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                changed = await self.flush()
+                if changed:
+                    print(f"Username sync: updated {changed} usernames")  # Debug log
+            except Exception as e:
+                print(f"Username sync flush failed: {str(e)}")
+
+    def _load_state(self):
+        state = self.data_manager._load_json(self.state_file)
+        return state or {"cursor": None, "completed_at": 0}
+
+    def _save_state(self, state):
+        # Under the store lock, like every other write to the store's folder
+        with self.data_manager._lock:
+            self.data_manager._save_json(self.state_file, state)
+
+    async def reconcile(self, guilds):
+        """
+        Compare stored usernames with guild member caches, chunk by chunk.
+
+        Skipped if a full pass finished within `reconcile_every`; otherwise resumes
+        after the last user id recorded in username_sync.json.
+        """
+        state = await asyncio.to_thread(self._load_state)
+        if state["cursor"] is None and time.time() - state.get("completed_at", 0) < self.reconcile_every:
+            return 0
+
+        stored = await self.data_manager.aio.get_usernames()
+        if state["cursor"] is not None:
+            stored = [(user_id, name) for user_id, name in stored if int(user_id) > int(state["cursor"])]
+
+        found = 0
+        for start in range(0, len(stored), self.chunk_size):
+            chunk = stored[start:start + self.chunk_size]
+            for user_id, stored_name in chunk:
+                for guild in guilds:
+                    member = guild.get_member(int(user_id))
+                    if member:
+                        if member.name != stored_name:
+                            self.pending[user_id] = member.name
+                            found += 1
+                        break
+            await self.flush()
+            state["cursor"] = chunk[-1][0]
+            await asyncio.to_thread(self._save_state, state)
+
+        state["cursor"] = None
+        state["completed_at"] = time.time()
+        await asyncio.to_thread(self._save_state, state)
+        return found
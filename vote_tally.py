@@ -0,0 +1,194 @@
+"""
+Reaction-based competition voting.
+
+In a competition started with `!competition start --reactions`, every entry is
+posted as its own message and people vote by reacting with VOTE_EMOJI. Reaction
+events only update an in-memory tally: one vote per voter per competition, and
+removing the reaction withdraws the vote. The tally is written to
+competitions.json in batches, either after `flush_every` changes or every
+`flush_interval` seconds. The number of disk writes therefore doesn't grow with
+the number of votes. When the competition ends, the reactions on every entry
+message are fetched and reconciled with the tally. This catches votes cast while
+the bot was offline and reactions that were removed.
+"""
+import os
+import time
+import asyncio
+
+
+VOTE_EMOJI = os.getenv("VOTE_EMOJI", "⭐")
+
+
+def is_reaction_vote(target):
+    """Reaction votes name an entry ("<user id>/<entry index>"); !vote targets are plain user ids."""
+    return "/" in target
+
+
+class ReactionTally:
+    def __init__(self, data_manager, flush_interval=30, flush_every=50, refresh_interval=10):
+        """
+        Args:
+            data_manager (DataManager): Store holding competitions.json
+            flush_interval (float): Seconds between checkpoints of pending votes
+            flush_every (int): Vote changes that trigger an early checkpoint
+            refresh_interval (float): Minimum seconds between reloads of the entry
+                messages when a reaction arrives on an unknown message
+        """
+        self.data_manager = data_manager
+        self.flush_interval = flush_interval
+        self.flush_every = flush_every
+        self.refresh_interval = refresh_interval
+        self.competition_id = None
+        self.entry_messages = {}  # message id -> (channel id, vote target)
+        self.votes = {}  # voter id -> vote target
+        self.pending = 0
+        self._loaded_at = None
+        self._tasks = []
+        self._flushing = None
+
+    @property
+    def started(self):
+        return bool(self._tasks)
+
+    def start(self):
+        if not self.started:
+            self._tasks = [asyncio.create_task(self._flush_loop())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        await self.flush()
+
+    def invalidate(self):
+        """Reload entry messages on the next reaction (e.g. after a new entry was posted)."""
+        self._loaded_at = None
+
+    async def refresh(self, force=False):
+        if not force and self._loaded_at is not None and time.monotonic() - self._loaded_at < self.refresh_interval:
+            return
+        competition, votes = await self.data_manager.aio.get_competition_votes()
+        self._loaded_at = time.monotonic()
+
+        if not competition or competition.get("voting") != "reactions":
+            self.competition_id = None
+            self.entry_messages = {}
+            self.votes = {}
+            self.pending = 0
+            return
+        if competition["start_date"] != self.competition_id:
+            self.competition_id = competition["start_date"]
+            self.votes = dict(votes)
+            self.pending = 0
+        self.entry_messages = {
+            message_id: (info["channel_id"], f"{info['user_id']}/{info['entry']}")
+            for message_id, info in competition.get("entry_messages", {}).items()
+        }
+
+    async def note_reaction(self, message_id, voter_id, added):
+        """
+        Apply one vote reaction added or removed on an entry message. No disk write
+        unless this completes a batch.
+
+        Returns:
+            bool: True if the tally changed
+        """
+        entry = self.entry_messages.get(str(message_id))
+        if entry is None:
+            await self.refresh()
+            entry = self.entry_messages.get(str(message_id))
+            if entry is None:
+                return False
+        target = entry[1]
+
+        voter = str(voter_id)
+        if added:
+            if voter in self.votes:
+                return False  # one vote per competition
+            self.votes[voter] = target
+        else:
+            if self.votes.get(voter) != target:
+                return False
+            del self.votes[voter]
+
+        self.pending += 1
+        if self.pending >= self.flush_every and self._flushing is None:
+            self._flushing = asyncio.create_task(self._flush_now())
+        return True
+
+    async def _flush_now(self):
+        try:
+            await self.flush()
+        except Exception as e:
+            # The changes stay pending and the flush loop retries them
+            print(f"Reaction vote checkpoint failed: {str(e)}")
+        finally:
+            self._flushing = None
+
+    async def flush(self):
+        """
+        Checkpoint the tally to competitions.json in a single write. If the write
+        fails, the changes stay pending and are written by the next flush.
+        """
+        if not self.pending or self.competition_id is None:
+            return 0
+        pending = self.pending
+        reaction_votes = {voter: target for voter, target in self.votes.items() if is_reaction_vote(target)}
+        stored = await self.data_manager.aio.checkpoint_votes(self.competition_id, reaction_votes)
+        # Reactions that arrived during the write stay pending
+        self.pending = max(0, self.pending - pending)
+        return pending if stored else 0
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                changed = await self.flush()
+                if changed:
+                    print(f"Reaction votes: checkpointed {changed} changes")  # Debug log
+            except Exception as e:
+                print(f"Reaction vote checkpoint failed: {str(e)}")
+
+    async def reconcile(self, fetch_message):
+        """
+        Rebuild the tally from the reactions on every entry message and checkpoint it.
+
+        Args:
+            fetch_message: async (channel_id, message_id) -> message with `.reactions`
+
+        Returns:
+            int: Number of votes after reconciling, or None if no reaction-voted
+            competition is active
+        """
+        await self.refresh(force=True)
+        if self.competition_id is None:
+            return None
+
+        reacted = {}  # voter id -> entries they reacted to, in entry order
+        fetched = set()
+        for message_id, (channel_id, target) in self.entry_messages.items():
+            try:
+                message = await fetch_message(channel_id, int(message_id))
+            except Exception as e:
+                print(f"Could not fetch entry message {message_id}: {str(e)}")
+                continue
+            fetched.add(target)
+            for reaction in message.reactions:
+                if str(reaction.emoji) != VOTE_EMOJI:
+                    continue
+                async for user in reaction.users():
+                    if not user.bot:
+                        reacted.setdefault(str(user.id), []).append(target)
+
+        # Keep !vote votes and votes for entries whose message couldn't be fetched
+        votes = {voter: target for voter, target in self.votes.items()
+                 if not is_reaction_vote(target) or target not in fetched}
+        for voter, targets in reacted.items():
+            if voter not in votes:
+                current = self.votes.get(voter)
+                votes[voter] = current if current in targets else targets[0]
+
+        self.votes = votes
+        self.pending = 1  # force the checkpoint
+        await self.flush()
+        return len(votes)